@@ -0,0 +1,138 @@
+# Background Analysis
+# Nischay Bharadwaj (N-tronics)
+
+import queue
+import multiprocessing as mp
+from bitboard import BitBoard
+from search import Searcher, SearchLimits, SearchInfo
+from typing import *
+
+
+class _JobChanged:
+    def __init__(self, job: int, current: "mp.Value"):
+        """
+        Stop event of a search, set once the GUI has moved on to another job
+        :param job: Job the search belongs to
+        :param current: Shared id of the newest job
+        """
+        self.job = job
+        self.current = current
+
+    def is_set(self) -> bool:
+        return self.current.value != self.job
+
+
+def _worker_main(jobs: mp.Queue, results: mp.Queue, current: "mp.Value", tt_size_mb: float) -> None:
+    """
+    Analysis process loop: searches the newest position it was sent until a newer one arrives
+    :param jobs: Queue of (job id, BitBoard), None to exit
+    :param results: Queue to put (job id, SearchInfo) on after every finished iteration
+    :param current: Shared id of the newest job, searches of older jobs stop as soon as it changes
+    :param tt_size_mb: Size of the transposition table, kept across positions
+    :return: None
+    """
+    from tablebases import Tablebases
+    searcher = Searcher(tt_size_mb=tt_size_mb, tablebases=Tablebases())
+    while True:
+        job = jobs.get()
+        # Only the newest position is worth searching
+        while job is not None:
+            try:
+                job = jobs.get_nowait()
+            except queue.Empty:
+                break
+        if job is None:
+            break
+        job_id, bb = job
+        if job_id != current.value:
+            continue
+        searcher.stop_event = _JobChanged(job_id, current)
+        searcher.search(bb, SearchLimits(), lambda info: results.put((job_id, info)))
+
+
+class AnalysisWorker:
+    def __init__(self, tt_size_mb: float = 32):
+        """
+        Searches positions in a separate process, so the GUI thread only ever polls a queue.
+        A process rather than a thread keeps the search from competing with drawing for the GIL
+        :param tt_size_mb: Size of the worker's transposition table
+        """
+        self.current = mp.Value("q", 0, lock=False)
+        self.jobs = mp.Queue()
+        self.results = mp.Queue()
+        self.job = 0
+        # Latest result of the current job, None until its first iteration finishes
+        self.info: SearchInfo | None = None
+        self.process = mp.Process(target=_worker_main, args=(self.jobs, self.results, self.current, tt_size_mb),
+                                  daemon=True)
+        self.process.start()
+
+    def analyse(self, bb: BitBoard) -> None:
+        """
+        Starts analysing a position, cancelling the search of the previous one
+        :param bb: Position, copied so it can change afterwards
+        :return: None
+        """
+        self.job += 1
+        self.current.value = self.job
+        self.info = None
+        self.jobs.put((self.job, bb.copy()))
+
+    def cancel(self) -> None:
+        """
+        Stops the current search without starting another
+        :return: None
+        """
+        self.job += 1
+        self.current.value = self.job
+        self.info = None
+
+    def poll(self) -> SearchInfo | None:
+        """
+        Takes in the results that arrived since the last poll, without blocking
+        :return: The newest result if there was one for the current position, otherwise None
+        """
+        latest = None
+        while True:
+            try:
+                job, info = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if job == self.job:
+                latest = self.info = info
+        return latest
+
+    def close(self) -> None:
+        self.cancel()
+        self.jobs.put(None)
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def __enter__(self) -> "AnalysisWorker":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import game
+
+    parser = argparse.ArgumentParser(description="Analyse a position in the background and stream the results")
+    parser.add_argument("--fen", default=game.start_fen, help="position to analyse")
+    parser.add_argument("--seconds", type=float, default=5.0, help="how long to analyse")
+    args = parser.parse_args()
+
+    engine = game.ChessEngine(False)
+    engine.load_fen(args.fen)
+    with AnalysisWorker() as worker:
+        worker.analyse(engine.bitboard)
+        deadline = time.perf_counter() + args.seconds
+        while time.perf_counter() < deadline:
+            result = worker.poll()
+            if result is not None:
+                print(f"info {result}")
+            time.sleep(0.05)
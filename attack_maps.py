@@ -0,0 +1,71 @@
+# Attack Maps
+# Nischay Bharadwaj (N-tronics)
+
+from dataclasses import dataclass, field
+from bitboard import BitBoard, KING, EMPTY
+from attacks import piece_attacks
+from movegen import attackers_to, slider_blockers
+from typing import *
+
+
+@dataclass
+class AttackMap:
+    # Zobrist key of the position the map was built for
+    key: int
+    # Squares attacked by each color
+    attacked: List[int] = field(default_factory=lambda: [0, 0])
+    # Number of attackers of every square, white's in the low byte and black's in the next one
+    counts: List[int] = field(default_factory=lambda: [0] * 64)
+    # Enemy pieces giving check to the side to move
+    checkers: int = 0
+    # Pieces of the side to move pinned to their king
+    pinned: int = 0
+    # Pieces of the side to move that give check by moving off the line between an own slider and the enemy king
+    discoverers: int = 0
+
+    def is_attacked(self, sq: int, by: int) -> bool:
+        return bool(self.attacked[by] >> sq & 1)
+
+    def attackers(self, sq: int, by: int) -> int:
+        """
+        Returns how many pieces of a color attack a square
+        :param sq: Square index
+        :param by: WHITE or BLACK
+        :return: int
+        """
+        return self.counts[sq] >> (8 * by) & 0xFF
+
+
+def compute_attack_map(bb: BitBoard) -> AttackMap:
+    """
+    Works out everything that attacks what in a position, along with checks and pins of the side to move
+    :param bb: Position
+    :return: AttackMap
+    """
+    attack_map = AttackMap(bb.key)
+    attacked = attack_map.attacked
+    counts = attack_map.counts
+    occupied = bb.occupied
+    for code in range(12):
+        color, type_index = divmod(code, 6)
+        increment = 1 << (8 * color)
+        pieces = bb.pieces[code]
+        while pieces:
+            lsb = pieces & -pieces
+            pieces ^= lsb
+            targets = piece_attacks(type_index, lsb.bit_length() - 1, occupied, color)
+            attacked[color] |= targets
+            while targets:
+                target = targets & -targets
+                targets ^= target
+                counts[target.bit_length() - 1] += increment
+
+    us, them = bb.side, bb.side ^ 1
+    ksq = bb.pieces[us * 6 + KING].bit_length() - 1
+    if ksq != EMPTY:
+        attack_map.checkers = attackers_to(bb, ksq, occupied) & bb.occupancy[them]
+        attack_map.pinned = slider_blockers(bb, ksq, them) & bb.occupancy[us]
+    enemy_ksq = bb.pieces[them * 6 + KING].bit_length() - 1
+    if enemy_ksq != EMPTY:
+        attack_map.discoverers = slider_blockers(bb, enemy_ksq, us) & bb.occupancy[us]
+    return attack_map
@@ -0,0 +1,189 @@
+# Precomputed Attack Tables
+# Nischay Bharadwaj (N-tronics)
+
+import os
+import marshal
+from bitboard import WHITE
+from cache import cache_path, source_stamp
+from game_constants import dir_offsets
+from vector import Vec2
+from typing import *
+
+
+def _step_attacks(offsets: List[Vec2]) -> List[int]:
+    """
+    Builds a table of single step attacks (knight, king) indexed by square
+    :param offsets: List of offsets the piece can jump by
+    :return: List[int] of attack bitboards
+    """
+    table = []
+    for sq in range(64):
+        x, y = sq & 7, sq >> 3
+        attacks = 0
+        for ofst in offsets:
+            if 0 <= x + ofst.x <= 7 and 0 <= y + ofst.y <= 7:
+                attacks |= 1 << ((y + ofst.y) * 8 + x + ofst.x)
+        table.append(attacks)
+    return table
+
+
+def _rays(sq: int, offsets: List[Vec2]) -> List[List[int]]:
+    """
+    Returns the square bits along every ray from a square, nearest first
+    :param sq: Square index
+    :param offsets: Ray directions
+    :return: List of rays, each a List[int] of single bit bitboards
+    """
+    rays = []
+    for ofst in offsets:
+        ray = []
+        x, y = (sq & 7) + ofst.x, (sq >> 3) + ofst.y
+        while 0 <= x <= 7 and 0 <= y <= 7:
+            ray.append(1 << (y * 8 + x))
+            x, y = x + ofst.x, y + ofst.y
+        rays.append(ray)
+    return rays
+
+
+def _slider_tables(offsets: List[Vec2]) -> Tuple[List[int], List[Dict[int, int]]]:
+    """
+    Builds the occupancy indexed attack tables of a sliding piece
+    Like PEXT bitboards the masked occupancy itself is the index, the dict does the hashing a magic multiply would
+    :param offsets: Ray directions
+    :return: (masks, tables) where tables[sq][occupied & masks[sq]] is the attack bitboard
+    """
+    masks, tables = [], []
+    for sq in range(64):
+        rays = _rays(sq, offsets)
+        # The last square of a ray never blocks anything, so it is left out of the mask
+        mask = 0
+        for ray in rays:
+            for bit in ray[:-1]:
+                mask |= bit
+        table = {}
+        # Carry-Rippler enumeration of every subset of the mask
+        sub = 0
+        while True:
+            attacks = 0
+            for ray in rays:
+                for bit in ray:
+                    attacks |= bit
+                    if sub & bit:
+                        break
+            table[sub] = attacks
+            sub = (sub - mask) & mask
+            if sub == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+KNIGHT_ATTACKS: List[int] = _step_attacks(dir_offsets["knight"])
+KING_ATTACKS: List[int] = _step_attacks(dir_offsets["cross"] + dir_offsets["diagonal"])
+# White pawns move up the grid (towards y = 0), black pawns down
+PAWN_ATTACKS: List[List[int]] = [
+    _step_attacks([Vec2(-1, -1), Vec2(1, -1)]),
+    _step_attacks([Vec2(-1, 1), Vec2(1, 1)])
+]
+
+
+def _line_tables() -> Tuple[List[List[int]], List[List[int]]]:
+    """
+    Builds the tables of squares between and on the line through two aligned squares
+    :return: (between, line) where between[a][b] excludes a and b and line[a][b] spans the whole board
+    """
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for a in range(64):
+        for ofst in dir_offsets["cross"] + dir_offsets["diagonal"]:
+            ray, opposite = _rays(a, [ofst, ofst * -1])
+            full = 1 << a
+            for bit in ray + opposite:
+                full |= bit
+            passed = 0
+            for bit in ray:
+                b = bit.bit_length() - 1
+                between[a][b] = passed
+                line[a][b] = full
+                passed |= bit
+    return between, line
+
+
+def _load_tables() -> Tuple[Any, ...]:
+    """
+    Loads the sliding piece and line tables from the cache, building and caching them if needed
+    Unmarshalling them is several times faster than building them
+    :return: (ROOK_MASKS, ROOK_TABLE, BISHOP_MASKS, BISHOP_TABLE, BETWEEN, LINE)
+    """
+    path = cache_path(f"attacks-{source_stamp(__file__)}.marshal")
+    if path is not None and os.path.exists(path):
+        try:
+            with open(path, "rb") as file:
+                return marshal.loads(file.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+    tables = (*_slider_tables(dir_offsets["cross"]), *_slider_tables(dir_offsets["diagonal"]), *_line_tables())
+    if path is not None:
+        try:
+            with open(path, "wb") as file:
+                file.write(marshal.dumps(tables))
+        except OSError:
+            pass
+    return tables
+
+
+ROOK_MASKS, ROOK_TABLE, BISHOP_MASKS, BISHOP_TABLE, BETWEEN, LINE = _load_tables()
+
+
+def rook_attacks(sq: int, occupied: int) -> int:
+    return ROOK_TABLE[sq][occupied & ROOK_MASKS[sq]]
+
+
+def bishop_attacks(sq: int, occupied: int) -> int:
+    return BISHOP_TABLE[sq][occupied & BISHOP_MASKS[sq]]
+
+
+def queen_attacks(sq: int, occupied: int) -> int:
+    return ROOK_TABLE[sq][occupied & ROOK_MASKS[sq]] | BISHOP_TABLE[sq][occupied & BISHOP_MASKS[sq]]
+
+
+def pawn_pushes(sq: int, color: int, occupied: int) -> int:
+    """
+    Returns the squares a pawn can push to, including the double push from its starting rank
+    :param sq: Square index
+    :param color: WHITE or BLACK
+    :param occupied: Occupancy bitboard
+    :return: Bitboard of push targets
+    """
+    if color == WHITE:
+        single = (1 << (sq - 8)) & ~occupied if sq >= 8 else 0
+        if single and 48 <= sq <= 55:
+            return single | ((1 << (sq - 16)) & ~occupied)
+    else:
+        single = (1 << (sq + 8)) & ~occupied if sq < 56 else 0
+        if single and 8 <= sq <= 15:
+            return single | ((1 << (sq + 16)) & ~occupied)
+    return single
+
+
+def piece_attacks(type_index: int, sq: int, occupied: int, color: int = WHITE) -> int:
+    """
+    Returns the attack bitboard of a piece type on a square
+    :param type_index: Piece type index (bitboard.PAWN .. bitboard.KING)
+    :param sq: Square index
+    :param occupied: Occupancy bitboard
+    :param color: Color of the piece, only matters for pawns
+    :return: Attack bitboard
+    """
+    if type_index == 0:
+        return PAWN_ATTACKS[color][sq]
+    elif type_index == 1:
+        return KNIGHT_ATTACKS[sq]
+    elif type_index == 2:
+        return bishop_attacks(sq, occupied)
+    elif type_index == 3:
+        return rook_attacks(sq, occupied)
+    elif type_index == 4:
+        return queen_attacks(sq, occupied)
+    return KING_ATTACKS[sq]
@@ -0,0 +1,150 @@
+# Batch Position Analysis
+# Nischay Bharadwaj (N-tronics)
+
+import os
+import time
+import multiprocessing as mp
+from dataclasses import dataclass, field
+import game
+from typing import *
+
+
+@dataclass
+class BatchResult:
+    index: int
+    fen: str
+    depth: int
+    nodes: int = 0
+    seconds: float = 0.0
+    # Known node count from the input file, if any
+    expected: int | None = None
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and (self.expected is None or self.nodes == self.expected)
+
+
+@dataclass
+class BatchSummary:
+    positions: int = 0
+    nodes: int = 0
+    failures: List[BatchResult] = field(default_factory=list)
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+
+    @property
+    def nps(self) -> int:
+        return int(self.nodes / self.wall_time) if self.wall_time > 0 else 0
+
+
+def read_fens(path: str) -> Generator[Tuple[str, Dict[int, int]], None, None]:
+    """
+    Reads positions from a file, one per line, either plain FEN or perft suite EPD lines like "<fen> ;D1 20 ;D2 400"
+    Blank lines and lines starting with # are skipped
+    :param path: Path of the file
+    :return: Generator of (fen, {depth: expected node count})
+    """
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fen, *counts = line.split(";")
+            expected = {}
+            for count in counts:
+                name, value = count.split()
+                expected[int(name.strip()[1:])] = int(value)
+            fields = fen.split()
+            # EPD lines may leave out the move clocks
+            if len(fields) == 4:
+                fields += ["0", "1"]
+            yield " ".join(fields), expected
+
+
+_engine: game.ChessEngine | None = None
+
+
+def _init_worker() -> None:
+    global _engine
+    _engine = game.ChessEngine(False)
+
+
+def _perft_job(job: Tuple[int, str, int, int | None]) -> BatchResult:
+    index, fen, depth, expected = job
+    result = BatchResult(index, fen, depth, expected=expected)
+    start = time.perf_counter()
+    try:
+        _engine.load_fen(fen)
+        result.nodes = _engine.perft(depth)
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def batch_perft(positions: Iterable[str | Tuple[str, Dict[int, int]]], depth: int = 1, workers: int | None = None,
+                chunksize: int = 4) -> Generator[BatchResult, None, None]:
+    """
+    Runs perft on many positions across a process pool, yielding results as they finish (not in input order)
+    Depth 1 gives the legal move count of each position
+    :param positions: FEN strings, or (fen, expected counts by depth) pairs as produced by read_fens
+    :param depth: Perft depth
+    :param workers: Number of processes, defaults to the CPU count
+    :param chunksize: Positions sent to a worker at a time, raise it for many cheap positions
+    :return: Generator of BatchResult
+    """
+    def jobs() -> Generator[Tuple[int, str, int, int | None], None, None]:
+        for i, position in enumerate(positions):
+            fen, expected = (position, {}) if isinstance(position, str) else position
+            yield i, fen, depth, expected.get(depth)
+
+    with mp.Pool(workers or os.cpu_count(), initializer=_init_worker) as pool:
+        yield from pool.imap_unordered(_perft_job, jobs(), chunksize)
+
+
+def summarize(results: Iterable[BatchResult], on_result: Callable[[BatchResult], None] | None = None) -> BatchSummary:
+    """
+    Consumes a stream of results and totals them up
+    :param results: Results, e.g. from batch_perft
+    :param on_result: Called with every result as it arrives
+    :return: BatchSummary
+    """
+    summary = BatchSummary()
+    start = time.perf_counter()
+    for result in results:
+        summary.positions += 1
+        summary.nodes += result.nodes
+        summary.cpu_time += result.seconds
+        if not result.ok:
+            summary.failures.append(result)
+        if on_result is not None:
+            on_result(result)
+    summary.wall_time = time.perf_counter() - start
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Run perft over a file of FEN or perft suite EPD positions")
+    parser.add_argument("file", help="file with one position per line")
+    parser.add_argument("--depth", type=int, default=1, help="perft depth, 1 counts legal moves")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes")
+    parser.add_argument("--chunksize", type=int, default=4, help="positions sent to a worker at a time")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args()
+
+    def print_result(result: BatchResult) -> None:
+        if args.json:
+            print(json.dumps(result.__dict__), flush=True)
+        else:
+            status = "ok" if result.ok else (result.error or f"FAIL expected {result.expected}")
+            print(f"{result.index:>6} {result.nodes:>12} nodes {result.seconds:8.3f}s  {status}  {result.fen}",
+                  flush=True)
+
+    summary = summarize(batch_perft(read_fens(args.file), args.depth, args.workers, args.chunksize), print_result)
+    print(f"\n{summary.positions} positions, {summary.nodes} nodes in {summary.wall_time:.3f}s "
+          f"({summary.cpu_time:.3f}s CPU), {summary.nps} nps aggregate, {len(summary.failures)} failures")
+    exit(1 if summary.failures else 0)
@@ -0,0 +1,212 @@
+# Batch Evaluation
+# Nischay Bharadwaj (N-tronics)
+
+import numpy as np
+from bitboard import KING, KNIGHT, BISHOP, ROOK, QUEEN, FULL, FILE_A, FILE_H
+from evaluation import VALUES, KING_ENDGAME_VALUES, PHASE_WEIGHTS, MAX_PHASE
+from positions import unpack_mailboxes
+from typing import *
+
+# Centipawns per square reachable by the knights, bishops, rooks and queens of a side
+MOBILITY_WEIGHT = 4
+
+# Material plus piece-square value of every piece code on every square, kings are scored separately
+_PIECE_VALUES = np.array(VALUES, dtype=np.int32)
+_PIECE_VALUES[[KING, 6 + KING]] = 0
+_PHASE = np.array([PHASE_WEIGHTS[code % 6] for code in range(12)], dtype=np.int32)
+_KING_VALUES = np.array([VALUES[KING], VALUES[6 + KING]], dtype=np.int32)
+_KING_ENDGAME_VALUES = np.array(KING_ENDGAME_VALUES, dtype=np.int32)
+
+# Lookups by position record byte, which holds two squares (see positions.py), so a position takes 32 lookups.
+# _PAIR_VALUES packs value + phase << _PHASE_SHIFT of the non-king pieces on the pair of squares.
+# _PAIR_KINGS packs 16 bit fields of white middle game, white endgame, black middle game and black endgame king
+# value, offset by _KING_OFFSET so a field is only non-zero where that king stands.
+_PHASE_SHIFT = 20
+_KING_OFFSET = 512
+_PAIR_VALUES = np.zeros((32, 256), dtype=np.int32)
+_PAIR_KINGS = np.zeros((32, 256), dtype=np.int64)
+for _pair in range(32):
+    for _byte in range(256):
+        for _sq, _code in ((2 * _pair, (_byte & 15) - 1), (2 * _pair + 1, (_byte >> 4) - 1)):
+            if _code == -1 or _code >= 12:
+                continue
+            if _code % 6 == KING:
+                _color = _code // 6
+                _PAIR_KINGS[_pair, _byte] += (
+                    (int(_KING_VALUES[_color][_sq]) + _KING_OFFSET) << (32 * _color)
+                    | (int(_KING_ENDGAME_VALUES[_color][_sq]) + _KING_OFFSET) << (32 * _color + 16)
+                )
+            else:
+                _PAIR_VALUES[_pair, _byte] += int(_PIECE_VALUES[_code][_sq]) + (int(_PHASE[_code]) << _PHASE_SHIFT)
+_PAIR_VALUES = _PAIR_VALUES.ravel()
+_PAIR_KINGS = _PAIR_KINGS.ravel()
+_PAIR_OFFSETS = np.arange(32, dtype=np.intp) * 256
+
+_FILE_B, _FILE_G = FILE_A << 1, FILE_H >> 1
+# (shift, mask of squares a shifted bit can land on) of every direction, index = y * 8 + x so +1 is east and +8 south
+_ROOK_DIRECTIONS: List[Tuple[int, int]] = [(1, FULL ^ FILE_A), (-1, FULL ^ FILE_H), (8, FULL), (-8, FULL)]
+_BISHOP_DIRECTIONS: List[Tuple[int, int]] = [(9, FULL ^ FILE_A), (7, FULL ^ FILE_H), (-7, FULL ^ FILE_A),
+                                             (-9, FULL ^ FILE_H)]
+_KNIGHT_JUMPS: List[Tuple[int, int]] = [
+    (dy * 8 + dx, FULL ^ {1: FILE_A, 2: FILE_A | _FILE_B, -1: FILE_H, -2: FILE_H | _FILE_G}[dx])
+    for dx, dy in ((1, 2), (1, -2), (-1, 2), (-1, -2), (2, 1), (2, -1), (-2, 1), (-2, -1))
+]
+
+
+def _shift(bits: np.ndarray, amount: int) -> np.ndarray:
+    return bits << np.uint64(amount) if amount > 0 else bits >> np.uint64(-amount)
+
+
+def _slide(sliders: np.ndarray, empty: np.ndarray, shift: int, mask: int) -> np.ndarray:
+    """
+    Kogge-Stone fill of all sliders in one direction at once
+    :param sliders: Bitboards of sliders
+    :param empty: Bitboards of empty squares
+    :param shift: Bit shift of one step
+    :param mask: Squares a step can land on, stops wrapping around the board edge
+    :return: Squares attacked in that direction, including the first blocker
+    """
+    mask = np.uint64(mask)
+    propagate = empty & mask
+    sliders = sliders | propagate & _shift(sliders, shift)
+    propagate = propagate & _shift(propagate, shift)
+    sliders = sliders | propagate & _shift(sliders, 2 * shift)
+    propagate = propagate & _shift(propagate, 2 * shift)
+    sliders = sliders | propagate & _shift(sliders, 4 * shift)
+    return _shift(sliders, shift) & mask
+
+
+def _popcount(bits: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).astype(np.int32)
+    # NumPy before 2.0, count the bits of every byte
+    return np.unpackbits(bits.view(np.uint8).reshape(*bits.shape, 8), axis=-1).sum(-1, dtype=np.int32)
+
+
+def planes_from_mailboxes(mailboxes: np.ndarray) -> np.ndarray:
+    """
+    Converts piece codes per square to one plane per piece code
+    :param mailboxes: (N, 64) array of piece codes, EMPTY for empty squares
+    :return: (N, 12, 64) bool array
+    """
+    return mailboxes[:, None, :] == np.arange(12, dtype=mailboxes.dtype)[None, :, None]
+
+
+def bitboards_from_planes(planes: np.ndarray) -> np.ndarray:
+    """
+    Packs piece planes to one 64 bit bitboard per piece code, bit n being square n like BitBoard.pieces
+    :param planes: (N, 12, 64) bool or 0/1 array
+    :return: (N, 12) uint64 array
+    """
+    packed = np.packbits(planes.astype(bool, copy=False), axis=2, bitorder="little")
+    return np.ascontiguousarray(packed).view("<u8")[..., 0]
+
+
+def mobility(bitboards: np.ndarray) -> np.ndarray:
+    """
+    Counts the squares each side's knights, bishops, rooks and queens together attack, minus those of own pieces
+    :param bitboards: (N, 12) uint64 bitboards by piece code
+    :return: (N, 2) int32 array, white then black
+    """
+    white = np.bitwise_or.reduce(bitboards[:, :6], axis=1)
+    black = np.bitwise_or.reduce(bitboards[:, 6:], axis=1)
+    empty = ~(white | black)
+    counts = np.empty((len(bitboards), 2), dtype=np.int32)
+    for color, own in enumerate((white, black)):
+        base = color * 6
+        attacked = np.zeros(len(bitboards), dtype=np.uint64)
+        knights = bitboards[:, base + KNIGHT]
+        for shift, mask in _KNIGHT_JUMPS:
+            attacked |= _shift(knights, shift) & np.uint64(mask)
+        rooks = bitboards[:, base + ROOK] | bitboards[:, base + QUEEN]
+        for shift, mask in _ROOK_DIRECTIONS:
+            attacked |= _slide(rooks, empty, shift, mask)
+        bishops = bitboards[:, base + BISHOP] | bitboards[:, base + QUEEN]
+        for shift, mask in _BISHOP_DIRECTIONS:
+            attacked |= _slide(bishops, empty, shift, mask)
+        counts[:, color] = _popcount(attacked & ~own)
+    return counts
+
+
+def evaluate_batch(positions: np.ndarray, sides: np.ndarray | None = None, use_mobility: bool = False) -> np.ndarray:
+    """
+    Scores many positions in one vectorized pass, giving the same scores as evaluation.evaluate
+    :param positions: Either (N, 64) piece codes per square, (N, 12, 64) piece planes, or records of
+    positions.position_dtype such as PositionStore.array(), which also carry the side to move
+    :param sides: Side to move of each position, scores are from white's point of view if None and not in the records
+    :param use_mobility: Add MOBILITY_WEIGHT per square of mobility difference, not part of evaluation.evaluate
+    :return: (N,) int32 array of centipawn scores
+    """
+    planes = None
+    if positions.dtype.names is not None:
+        if sides is None:
+            sides = positions["state"] & 1
+        boards = positions["board"]
+    elif positions.ndim == 2:
+        boards = ((positions[:, 0::2] + 1) | (positions[:, 1::2] + 1) << 4).astype(np.uint8)
+    else:
+        planes = positions
+        boards = None
+
+    if boards is not None:
+        index = boards.astype(np.intp) + _PAIR_OFFSETS
+        packed = _PAIR_VALUES[index].sum(axis=1, dtype=np.int32)
+        phase = (packed + (1 << (_PHASE_SHIFT - 1))) >> _PHASE_SHIFT
+        score = packed - (phase << _PHASE_SHIFT)
+        king_fields = _PAIR_KINGS[index].sum(axis=1)
+        kings = [
+            [(king_fields >> (32 * color + 16 * stage) & 0xFFFF).astype(np.int32) for stage in (0, 1)]
+            for color in (0, 1)
+        ]
+    else:
+        score = np.einsum("npq,pq->n", planes, _PIECE_VALUES, dtype=np.int32, casting="unsafe")
+        phase = planes.sum(axis=2, dtype=np.int32) @ _PHASE
+        kings = []
+        for color in (0, 1):
+            king_planes = planes[:, color * 6 + KING].astype(bool, copy=False)
+            ksq = king_planes.argmax(axis=1)
+            present = np.where(king_planes.any(axis=1), _KING_OFFSET, 0)
+            kings.append([
+                np.where(present, _KING_VALUES[color][ksq] + present, 0),
+                np.where(present, _KING_ENDGAME_VALUES[color][ksq] + present, 0)
+            ])
+
+    # Kings are tapered between their middle game and endgame tables by the material left
+    phase = np.minimum(phase, MAX_PHASE)
+    for middle_game, endgame in kings:
+        tapered = ((middle_game - _KING_OFFSET) * phase + (endgame - _KING_OFFSET) * (MAX_PHASE - phase)) // MAX_PHASE
+        score += np.where(middle_game != 0, tapered, 0).astype(np.int32)
+
+    if use_mobility:
+        if planes is None:
+            planes = planes_from_mailboxes(unpack_mailboxes(positions) if positions.dtype.names is not None
+                                           else positions)
+        counts = mobility(bitboards_from_planes(planes))
+        score += MOBILITY_WEIGHT * (counts[:, 0] - counts[:, 1])
+
+    if sides is not None:
+        score = np.where(np.asarray(sides) == 0, score, -score).astype(np.int32)
+    return score
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from positions import PositionStore
+
+    parser = argparse.ArgumentParser(description="Score every position of a position store in batches")
+    parser.add_argument("store", help="position store file, see positions.py")
+    parser.add_argument("--batch", type=int, default=65536, help="positions scored per call")
+    parser.add_argument("--mobility", action="store_true", help="add the mobility term")
+    args = parser.parse_args()
+
+    with PositionStore(args.store) as store:
+        records = store.array()
+        start = time.perf_counter()
+        total = 0
+        for i in range(0, len(records), args.batch):
+            total += int(evaluate_batch(records[i:i + args.batch], use_mobility=args.mobility).sum())
+        seconds = time.perf_counter() - start
+        del records
+    print(f"{len(store)} positions in {seconds:.3f}s, {int(len(store) / seconds) if seconds > 0 else 0} positions/s, "
+          f"mean score {total / max(len(store), 1):.1f}")
@@ -0,0 +1,312 @@
+# Benchmark Suite
+# Nischay Bharadwaj (N-tronics)
+
+import os
+import sys
+import json
+import time
+import platform
+import game
+import movegen
+from dataclasses import dataclass, asdict
+from perft import PERFT_POSITIONS
+from search import Searcher, SearchLimits
+from game_constants import Piece
+from pieces import BasePiece
+from vector import Vec2
+from typing import *
+
+# Bumped whenever a benchmark changes in a way that makes old results incomparable
+BENCH_VERSION = 2
+BENCHMARKS = ["fen", "movegen", "perft", "search", "draw"]
+# A result this much worse than the baseline is reported as a regression
+DEFAULT_THRESHOLD = 0.10
+PERFT_DEPTH = 3
+SEARCH_DEPTH = 4
+BENCH_FENS: List[str] = [fen for _, fen, _ in PERFT_POSITIONS]
+
+
+@dataclass
+class BenchResult:
+    value: float
+    unit: str
+    # Rates are better higher, times lower
+    higher_is_better: bool = True
+    # Changes smaller than this, in the result's unit, are timer and scheduler noise and never count as regressions
+    noise_floor: float = 0.0
+
+
+def best_time(func: Callable[[], Any], repeat: int) -> float:
+    """
+    Runs a function several times and keeps the fastest run, the one least disturbed by the rest of the machine
+    :param func: Function to time
+    :param repeat: Number of runs
+    :return: Seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_fen(repeat: int, scale: int) -> Dict[str, BenchResult]:
+    """
+    load_fen and generate_fen throughput over the perft positions
+    :param repeat: Runs to keep the fastest of
+    :param scale: Work per run
+    :return: Results by name
+    """
+    engine = game.ChessEngine(False)
+    engines = []
+    for fen in BENCH_FENS:
+        engines.append(game.ChessEngine(False))
+        engines[-1].load_fen(fen)
+    rounds = 500 * scale
+
+    def load() -> None:
+        for _ in range(rounds):
+            for fen in BENCH_FENS:
+                engine.load_fen(fen)
+
+    def generate() -> None:
+        for _ in range(rounds):
+            for position in engines:
+                position.generate_fen()
+
+    count = rounds * len(BENCH_FENS)
+    return {
+        "fen.load": BenchResult(count / best_time(load, repeat), "fens/s"),
+        "fen.generate": BenchResult(count / best_time(generate, repeat), "fens/s")
+    }
+
+
+def bench_movegen(repeat: int, scale: int) -> Dict[str, BenchResult]:
+    """
+    Piece move generation by type through compute_valid_moves, plus full legal and staged generation
+    :param repeat: Runs to keep the fastest of
+    :param scale: Work per run
+    :return: Results by name
+    """
+    results = {}
+    engines = []
+    pieces: Dict[Piece.Type, List[Tuple[Any, game.BoardView]]] = {}
+    for fen in BENCH_FENS:
+        engine = game.ChessEngine(False)
+        engine.load_fen(fen)
+        engines.append(engine)
+        for sq in range(64):
+            square = engine.board[sq & 7, sq >> 3]
+            if square.piece is not None:
+                pieces.setdefault(square.piece.type, []).append((square.piece, engine.board))
+    rounds = 500 * scale
+
+    for type_, entries in pieces.items():
+        def generate() -> None:
+            for _ in range(rounds):
+                for piece, board in entries:
+                    piece.compute_valid_moves(board)
+
+        results[f"movegen.{BasePiece.get_name(type_)}"] = BenchResult(
+            rounds * len(entries) / best_time(generate, repeat), "calls/s"
+        )
+
+    def legal() -> None:
+        for _ in range(rounds):
+            for engine in engines:
+                movegen.generate_legal_moves(engine.bitboard)
+
+    def staged() -> None:
+        for _ in range(rounds):
+            for engine in engines:
+                engine.pseudo_legal_moves()
+
+    count = rounds * len(engines)
+    results["movegen.legal"] = BenchResult(count / best_time(legal, repeat), "positions/s")
+    results["movegen.staged"] = BenchResult(count / best_time(staged, repeat), "positions/s")
+    return results
+
+
+def bench_perft(repeat: int, scale: int) -> Dict[str, BenchResult]:
+    """
+    Perft of every standard position at a fixed depth, failing if a node count is wrong
+    :param repeat: Runs to keep the fastest of
+    :param scale: Unused, the depth is fixed so results stay comparable
+    :return: Results by name
+    """
+    engine = game.ChessEngine(False)
+    results = {}
+    for name, fen, expected in PERFT_POSITIONS:
+        depth = min(PERFT_DEPTH, len(expected))
+        engine.load_fen(fen)
+        nodes = engine.perft(depth)
+        if nodes != expected[depth - 1]:
+            raise AssertionError(f"perft {name} depth {depth}: {nodes} nodes, expected {expected[depth - 1]}")
+        seconds = best_time(lambda: engine.perft(depth), repeat)
+        results[f"perft.{name.replace(' ', '_')}"] = BenchResult(nodes / seconds, "nodes/s")
+    return results
+
+
+def bench_search(repeat: int, scale: int) -> Dict[str, BenchResult]:
+    """
+    Fixed depth searches of the perft positions, each with a fresh searcher so the node counts are repeatable
+    :param repeat: Runs to keep the fastest of
+    :param scale: Unused, the depth is fixed so results stay comparable
+    :return: Results by name
+    """
+    engine = game.ChessEngine(False)
+    nodes = 0
+
+    def search() -> None:
+        nonlocal nodes
+        nodes = 0
+        for fen in BENCH_FENS:
+            engine.load_fen(fen)
+            nodes += Searcher(tt_size_mb=4).search(engine.bitboard, SearchLimits(depth=SEARCH_DEPTH)).nodes
+
+    seconds = best_time(search, repeat)
+    return {
+        "search.nps": BenchResult(nodes / seconds, "nodes/s"),
+        # Changes with search changes rather than speed, so a move ordering regression shows up too
+        "search.nodes": BenchResult(nodes, "nodes", higher_is_better=False)
+    }
+
+
+def bench_draw(repeat: int, scale: int) -> Dict[str, BenchResult]:
+    """
+    Chess.draw frame times in a hidden window: a full repaint and a frame that only changes a selection
+    :param repeat: Runs to keep the fastest of
+    :param scale: Work per run
+    :return: Results by name, empty if PyGame isn't installed
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    try:
+        import pygame
+        import main
+    except ImportError:
+        return {}
+    pygame.init()
+    chess = main.Chess()
+    # Enough frames that a run takes a few hundred milliseconds, single frames are well under the scheduler's jitter
+    full_frames = 100 * scale
+    selection_frames = 1000 * scale
+    square = Vec2(4, 6)
+
+    def full() -> None:
+        for _ in range(full_frames):
+            chess.redraw()
+            chess.draw()
+
+    def selection() -> None:
+        for frame in range(selection_frames):
+            chess.board.select(square if frame % 2 == 0 else None)
+            chess.update_screen = True
+            chess.draw()
+
+    try:
+        return {
+            "draw.full": BenchResult(best_time(full, repeat) / full_frames * 1000, "ms/frame",
+                                     higher_is_better=False, noise_floor=0.5),
+            "draw.selection": BenchResult(best_time(selection, repeat) / selection_frames * 1000, "ms/frame",
+                                          higher_is_better=False, noise_floor=0.1)
+        }
+    finally:
+        pygame.quit()
+
+
+BENCH_FUNCTIONS: Dict[str, Callable[[int, int], Dict[str, BenchResult]]] = {
+    "fen": bench_fen, "movegen": bench_movegen, "perft": bench_perft, "search": bench_search, "draw": bench_draw
+}
+
+
+def run_benchmarks(names: Iterable[str] = BENCHMARKS, repeat: int = 3, scale: int = 1,
+                   verbose: bool = True) -> Dict[str, Any]:
+    """
+    Runs benchmarks and collects their results with enough about the machine to tell whether two runs compare
+    :param names: Benchmarks to run, from BENCHMARKS
+    :param repeat: Runs of each measurement, the fastest is kept
+    :param scale: Multiplier on the work of the throughput benchmarks
+    :param verbose: Print results as they come in
+    :return: Report, as written to JSON
+    """
+    results: Dict[str, BenchResult] = {}
+    for name in names:
+        start = time.perf_counter()
+        batch = BENCH_FUNCTIONS[name](repeat, scale)
+        if verbose:
+            if not batch:
+                print(f"{name}: skipped")
+            for key, result in batch.items():
+                print(f"{key:28} {result.value:>14.2f} {result.unit}")
+            print(f"{name}: {time.perf_counter() - start:.1f}s")
+        results.update(batch)
+    return {
+        "version": BENCH_VERSION,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "scale": scale,
+        "results": {key: asdict(result) for key, result in results.items()}
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float = DEFAULT_THRESHOLD) -> Tuple[List[str], List[str]]:
+    """
+    Compares a report against a baseline report
+    :param report: Report from run_benchmarks
+    :param baseline: Earlier report, loaded from JSON
+    :param threshold: Relative change beyond which a result counts as a regression, as long as the change is also
+    above the result's noise floor
+    :return: (lines describing every shared result, names of the regressed results)
+    """
+    if baseline.get("version") != report["version"]:
+        raise ValueError(f"baseline is from bench version {baseline.get('version')}, not {report['version']}")
+    lines, regressions = [], []
+    for key, result in report["results"].items():
+        old = baseline["results"].get(key)
+        if old is None or not old["value"]:
+            continue
+        change = result["value"] / old["value"] - 1
+        # Positive is better whichever way the result is measured
+        gain = change if result["higher_is_better"] else -change
+        regressed = gain < -threshold and abs(result["value"] - old["value"]) > result.get("noise_floor", 0.0)
+        if regressed:
+            regressions.append(key)
+        lines.append(f"{key:28} {old['value']:>14.2f} -> {result['value']:>14.2f} {result['unit']:12} "
+                     f"{change:+8.1%}{'  REGRESSION' if regressed else ''}")
+    return lines, regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the engine and GUI hot paths")
+    parser.add_argument("--only", help=f"comma separated benchmarks to run, from {','.join(BENCHMARKS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each measurement, the fastest is kept")
+    parser.add_argument("--scale", type=int, default=1, help="multiplier on the work of the throughput benchmarks")
+    parser.add_argument("--output", "-o", help="write the results as JSON")
+    parser.add_argument("--compare", help="baseline JSON to compare against, exits with 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.only.split(",")] if args.only else BENCHMARKS
+    unknown = [name for name in names if name not in BENCH_FUNCTIONS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    report = run_benchmarks(names, args.repeat, args.scale)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            lines, regressions = compare(report, json.load(file), args.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("No regressions")
@@ -0,0 +1,252 @@
+# Bitboard Position Representation
+# Nischay Bharadwaj (N-tronics)
+
+from array import array
+from game_constants import Piece
+from vector import Vec2
+from zobrist import PIECE_KEYS, compute_key
+from typing import *
+
+# Squares are indexed 0..63 with index = y * 8 + x, so that index 0 is the
+# top left grid square [0 0] (a8) and index 63 is the bottom right one [7 7] (h1).
+# This keeps bit indices in line with the board[x, y] grid coordinates.
+WHITE = 0
+BLACK = 1
+
+PAWN = 0
+KNIGHT = 1
+BISHOP = 2
+ROOK = 3
+QUEEN = 4
+KING = 5
+
+EMPTY = -1
+
+# Piece codes are color * 6 + type, i.e. 0..5 for white and 6..11 for black
+PIECE_CHARS = "PNBRQKpnbrqk"
+PIECE_TYPES: List[Piece.Type] = [Piece.PAWN, Piece.KNIGHT, Piece.BISHOP, Piece.ROOK, Piece.QUEEN, Piece.KING]
+COLORS: List[Piece.Color] = [Piece.WHITE, Piece.BLACK]
+
+FULL = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+RANK_8 = 0xFF
+RANK_1 = RANK_8 << 56
+
+# Castling rights bits
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+CASTLING_CHARS = "KQkq"
+
+
+def square_index(x: int, y: int) -> int:
+    """
+    Converts grid coordinates to a square index
+    :param x: grid X coordinate
+    :param y: grid Y coordinate
+    :return: int
+    """
+    return y * 8 + x
+
+
+def square_coords(sq: int) -> Vec2:
+    """
+    Converts a square index to grid coordinates
+    :param sq: Square index
+    :return: Vec2(grid X coordinate, grid Y coordinate)
+    """
+    return Vec2(sq & 7, sq >> 3)
+
+
+def square_name(sq: int) -> str:
+    """
+    Returns the algebraic name of a square, e.g. 0 -> "a8"
+    :param sq: Square index
+    :return: str
+    """
+    return "abcdefgh"[sq & 7] + str(8 - (sq >> 3))
+
+
+def parse_square(name: str) -> int:
+    """
+    Converts an algebraic square name to a square index, e.g. "a8" -> 0
+    :param name: Algebraic square name
+    :return: int
+    """
+    return (8 - int(name[1])) * 8 + "abcdefgh".index(name[0])
+
+
+def piece_code(type_: Piece.Type, color: Piece.Color) -> int:
+    """
+    Returns the piece code of a piece type and color
+    :param type_: Type of the piece
+    :param color: Color of the piece
+    :return: int
+    """
+    return PIECE_TYPES.index(type_) + (6 if color == Piece.BLACK else 0)
+
+
+def code_color(code: int) -> Piece.Color:
+    return Piece.WHITE if code < 6 else Piece.BLACK
+
+
+def code_type(code: int) -> Piece.Type:
+    return PIECE_TYPES[code % 6]
+
+
+def iter_bits(bb: int) -> Generator[int, None, None]:
+    """
+    Yields the indices of all set bits of a bitboard, lowest first
+    :param bb: Bitboard
+    :return: Generator of square indices
+    """
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+_EMPTY_MAILBOX = array("b", [EMPTY] * 64)
+
+
+class BitBoard:
+    __slots__ = (
+        "pieces", "occupancy", "occupied", "mailbox", "side", "castling", "ep", "halfmove", "fullmove", "key",
+        "key_history"
+    )
+
+    def __init__(self):
+        # One bitboard per piece code
+        self.pieces: List[int] = [0] * 12
+        # Occupancy per color and for both colors
+        self.occupancy: List[int] = [0, 0]
+        self.occupied: int = 0
+        # Piece code on every square for O(1) "what is on this square" queries, one signed byte each
+        self.mailbox: array = array("b", _EMPTY_MAILBOX)
+        self.side: int = WHITE
+        self.castling: int = 0
+        # Square a pawn can capture en passant onto, or EMPTY
+        self.ep: int = EMPTY
+        self.halfmove: int = 0
+        self.fullmove: int = 1
+        # Zobrist key of the position and the keys of the positions before each move played
+        self.key: int = compute_key(self)
+        self.key_history: List[int] = []
+
+    def clear(self) -> None:
+        """
+        Removes all pieces from the board
+        :return: None
+        """
+        for i in range(12):
+            self.pieces[i] = 0
+        self.occupancy[WHITE] = self.occupancy[BLACK] = self.occupied = 0
+        self.mailbox[:] = _EMPTY_MAILBOX
+        self.halfmove = 0
+        self.fullmove = 1
+        self.key_history.clear()
+        self.rehash()
+
+    def load_mailbox(self, mailbox: array) -> None:
+        """
+        Replaces all pieces at once from a piece code per square, rebuilding the bitboards in one pass
+        Faster than set_piece for whole positions. The key is not updated, call rehash once the rest of the state is set
+        :param mailbox: array("b") of 64 piece codes or EMPTY in square index order
+        :return: None
+        """
+        self.mailbox[:] = mailbox
+        pieces = self.pieces
+        for code in range(12):
+            pieces[code] = 0
+        for sq, code in enumerate(mailbox):
+            if code != EMPTY:
+                pieces[code] |= 1 << sq
+        self.occupancy[WHITE] = pieces[0] | pieces[1] | pieces[2] | pieces[3] | pieces[4] | pieces[5]
+        self.occupancy[BLACK] = pieces[6] | pieces[7] | pieces[8] | pieces[9] | pieces[10] | pieces[11]
+        self.occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+        self.key_history.clear()
+
+    def rehash(self) -> None:
+        """
+        Recomputes the Zobrist key, needed after side, castling or en passant state is set directly
+        :return: None
+        """
+        self.key = compute_key(self)
+
+    def piece_at(self, sq: int) -> int:
+        return self.mailbox[sq]
+
+    def set_piece(self, sq: int, code: int) -> None:
+        """
+        Places a piece on a square, replacing whatever was there
+        :param sq: Square index
+        :param code: Piece code
+        :return: None
+        """
+        if self.mailbox[sq] != EMPTY:
+            self.remove_piece(sq)
+        bit = 1 << sq
+        self.pieces[code] |= bit
+        self.occupancy[code // 6] |= bit
+        self.occupied |= bit
+        self.mailbox[sq] = code
+        self.key ^= PIECE_KEYS[code][sq]
+
+    def remove_piece(self, sq: int) -> int:
+        """
+        Removes the piece on a square
+        :param sq: Square index
+        :return: Code of the removed piece or EMPTY
+        """
+        code = self.mailbox[sq]
+        if code != EMPTY:
+            mask = ~(1 << sq)
+            self.pieces[code] &= mask
+            self.occupancy[code // 6] &= mask
+            self.occupied &= mask
+            self.mailbox[sq] = EMPTY
+            self.key ^= PIECE_KEYS[code][sq]
+        return code
+
+    def load(self, other: "BitBoard") -> None:
+        """
+        Replaces this position with a copy of another, in place so references to this BitBoard stay valid
+        :param other: Position to copy
+        :return: None
+        """
+        self.pieces[:] = other.pieces
+        self.occupancy[:] = other.occupancy
+        self.occupied = other.occupied
+        self.mailbox[:] = other.mailbox
+        self.side = other.side
+        self.castling = other.castling
+        self.ep = other.ep
+        self.halfmove = other.halfmove
+        self.fullmove = other.fullmove
+        self.key = other.key
+        self.key_history[:] = other.key_history
+
+    def copy(self) -> "BitBoard":
+        bb = BitBoard.__new__(BitBoard)
+        bb.pieces = self.pieces[:]
+        bb.occupancy = self.occupancy[:]
+        bb.occupied = self.occupied
+        bb.mailbox = self.mailbox[:]
+        bb.side = self.side
+        bb.castling = self.castling
+        bb.ep = self.ep
+        bb.halfmove = self.halfmove
+        bb.fullmove = self.fullmove
+        bb.key = self.key
+        bb.key_history = self.key_history[:]
+        return bb
+
+    def __repr__(self):
+        rows = []
+        for y in range(8):
+            rows.append("".join(
+                "." if code == EMPTY else PIECE_CHARS[code] for code in self.mailbox[y * 8: y * 8 + 8]
+            ))
+        return "\n".join(rows)
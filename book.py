@@ -0,0 +1,223 @@
+# Polyglot Opening Books
+# Nischay Bharadwaj (N-tronics)
+
+import os
+import mmap
+import random
+import struct
+from bitboard import BitBoard, EMPTY, WHITE, PAWN, WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, \
+    BLACK_QUEENSIDE
+from attacks import PAWN_ATTACKS
+from moves import PROMOTION, KING_CASTLE, QUEEN_CASTLE
+from movegen import generate_legal_moves
+from polyglot_keys import POLYGLOT_RANDOM
+from typing import *
+
+# Book entries are 16 bytes, big endian: key, move, weight and a learn field, sorted by key
+ENTRY = struct.Struct(">QHHI")
+_KEY = struct.Struct(">Q")
+
+# Piece code to Polyglot piece kind, which orders black before white within each type
+_POLYGLOT_KIND: List[int] = [2 * (code % 6) + (1 if code < 6 else 0) for code in range(12)]
+_CASTLING_OFFSETS: List[Tuple[int, int]] = [
+    (WHITE_KINGSIDE, 768), (WHITE_QUEENSIDE, 769), (BLACK_KINGSIDE, 770), (BLACK_QUEENSIDE, 771)
+]
+# Polyglot writes castling as the king taking its own rook, by the king's destination square
+_CASTLING_TARGETS: Dict[int, int] = {62: 63, 58: 56, 6: 7, 2: 0}
+
+
+def polyglot_key(bb: BitBoard) -> int:
+    """
+    Computes the Polyglot book key of a position. It differs from our Zobrist key, which uses other random numbers
+    :param bb: Position
+    :return: 64 bit key
+    """
+    key = 0
+    for sq, code in enumerate(bb.mailbox):
+        if code != EMPTY:
+            # Polyglot counts rows up from rank 1, our square index counts down from rank 8
+            key ^= POLYGLOT_RANDOM[64 * _POLYGLOT_KIND[code] + 8 * (7 - (sq >> 3)) + (sq & 7)]
+    for right, offset in _CASTLING_OFFSETS:
+        if bb.castling & right:
+            key ^= POLYGLOT_RANDOM[offset]
+    # The en passant file only counts if a pawn could actually capture there
+    if bb.ep != EMPTY and PAWN_ATTACKS[bb.side ^ 1][bb.ep] & bb.pieces[bb.side * 6 + PAWN]:
+        key ^= POLYGLOT_RANDOM[772 + (bb.ep & 7)]
+    if bb.side == WHITE:
+        key ^= POLYGLOT_RANDOM[780]
+    return key
+
+
+def encode_book_move(move: int) -> int:
+    """
+    Converts a move to its Polyglot encoding
+    :param move: Move
+    :return: 16 bit Polyglot move
+    """
+    frm, to, flag = move & 63, (move >> 6) & 63, move >> 12
+    if flag in (KING_CASTLE, QUEEN_CASTLE):
+        to = _CASTLING_TARGETS[to]
+    book_move = (to & 7) | (7 - (to >> 3)) << 3 | (frm & 7) << 6 | (7 - (frm >> 3)) << 9
+    if flag & PROMOTION:
+        book_move |= ((flag & 3) + 1) << 12
+    return book_move
+
+
+def decode_book_move(book_move: int, legal_moves: List[int]) -> int | None:
+    """
+    Finds the legal move a Polyglot move stands for
+    :param book_move: 16 bit Polyglot move
+    :param legal_moves: Legal moves of the position
+    :return: Move, or None if it isn't legal here, e.g. after a key collision
+    """
+    to = (book_move & 7) | (7 - (book_move >> 3 & 7)) << 3
+    frm = (book_move >> 6 & 7) | (7 - (book_move >> 9 & 7)) << 3
+    promotion = book_move >> 12 & 7
+    for move in legal_moves:
+        flag = move >> 12
+        if move & 63 != frm:
+            continue
+        target = _CASTLING_TARGETS[(move >> 6) & 63] if flag in (KING_CASTLE, QUEEN_CASTLE) else (move >> 6) & 63
+        if target == to and (((flag & 3) + 1 if flag & PROMOTION else 0) == promotion):
+            return move
+    return None
+
+
+class OpeningBook:
+    def __init__(self, path: str):
+        """
+        Polyglot .bin opening book, memory-mapped and searched by binary search so no entries are loaded up front
+        :param path: Path of the book
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.count = size // ENTRY.size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _key_at(self, index: int) -> int:
+        return _KEY.unpack_from(self.mmap, index * ENTRY.size)[0]
+
+    def entries(self, key: int) -> Generator[Tuple[int, int, int], None, None]:
+        """
+        Yields the entries of a key
+        :param key: Polyglot key
+        :return: Generator of (Polyglot move, weight, learn)
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        while low < self.count:
+            entry_key, book_move, weight, learn = ENTRY.unpack_from(self.mmap, low * ENTRY.size)
+            if entry_key != key:
+                break
+            yield book_move, weight, learn
+            low += 1
+
+    def moves(self, bb: BitBoard) -> List[Tuple[int, int]]:
+        """
+        Returns the book moves of a position that are legal there
+        :param bb: Position
+        :return: List of (move, weight), as ordered in the book
+        """
+        legal_moves = generate_legal_moves(bb)
+        found = []
+        for book_move, weight, _ in self.entries(polyglot_key(bb)):
+            move = decode_book_move(book_move, legal_moves)
+            if move is not None:
+                found.append((move, weight))
+        return found
+
+    def choose(self, bb: BitBoard, rng: random.Random | None = None) -> int | None:
+        """
+        Picks a book move for a position
+        :param bb: Position
+        :param rng: Picks moves with probability by weight if given, otherwise the heaviest move is played
+        :return: Move, or None if the position isn't in the book
+        """
+        moves = [(move, weight) for move, weight in self.moves(bb) if weight > 0]
+        if not moves:
+            return None
+        if rng is None:
+            return max(moves, key=lambda entry: entry[1])[0]
+        return rng.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+    def close(self) -> None:
+        if self.mmap is not None:
+            self.mmap.close()
+
+    def __enter__(self) -> "OpeningBook":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def build_book(pgn_paths: Iterable[str], path: str, max_ply: int = 24, min_count: int = 1) -> int:
+    """
+    Builds a Polyglot book from PGN files. Moves are weighted 2 per win and 1 per draw for the side that played them
+    :param pgn_paths: PGN files to read
+    :param path: Path of the book to write
+    :param max_ply: Only moves up to this ply of each game go in
+    :param min_count: Leave out moves played fewer times than this
+    :return: Number of entries written
+    """
+    import game
+    import pgn
+
+    counts: Dict[Tuple[int, int], List[int]] = {}
+    engine = game.ChessEngine(False)
+    for pgn_path in pgn_paths:
+        for pgn_game in pgn.read_games(pgn_path):
+            scores = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}.get(pgn_game.result, (0, 0))
+            try:
+                engine.load_fen(pgn_game.start_fen)
+            except ValueError:
+                continue
+            for san in pgn_game.moves[:max_ply]:
+                try:
+                    move = pgn.parse_san(engine.bitboard, san)
+                except pgn.PGNError:
+                    break
+                entry = counts.setdefault((polyglot_key(engine.bitboard), encode_book_move(move)), [0, 0])
+                entry[0] += 1
+                entry[1] += scores[engine.bitboard.side]
+                engine.make_move(move)
+
+    entries = [(key, book_move, weight) for (key, book_move), (count, weight) in counts.items() if count >= min_count]
+    # Weights have to fit in 16 bits
+    scale = max((weight for _, _, weight in entries), default=0) / 0xFFFF
+    entries.sort(key=lambda entry: (entry[0], -entry[2]))
+    with open(path, "wb") as file:
+        for key, book_move, weight in entries:
+            file.write(ENTRY.pack(key, book_move, int(weight / scale) if scale > 1 else weight, 0))
+    return len(entries)
+
+
+if __name__ == "__main__":
+    import argparse
+    import game
+    from moves import move_to_uci
+
+    parser = argparse.ArgumentParser(description="Build a Polyglot opening book from PGN files, or look up a position")
+    parser.add_argument("book", help="book file")
+    parser.add_argument("--build", nargs="+", metavar="PGN", help="PGN files to build the book from")
+    parser.add_argument("--max-ply", type=int, default=24, help="deepest ply of each game to add")
+    parser.add_argument("--min-count", type=int, default=1, help="leave out moves played fewer times")
+    parser.add_argument("--fen", default=game.start_fen, help="position to look up")
+    args = parser.parse_args()
+
+    if args.build:
+        print(f"Wrote {build_book(args.build, args.book, args.max_ply, args.min_count)} entries to {args.book}")
+    engine = game.ChessEngine(False)
+    engine.load_fen(args.fen)
+    with OpeningBook(args.book) as opening_book:
+        for book_move, book_weight in opening_book.moves(engine.bitboard):
+            print(f"{move_to_uci(book_move)} {book_weight}")
@@ -0,0 +1,30 @@
+# On-disk Cache
+# Nischay Bharadwaj (N-tronics)
+
+import os
+from typing import *
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+
+def cache_path(name: str) -> str | None:
+    """
+    Returns the path of a file in the cache directory, creating the directory if needed
+    :param name: File name, should encode everything the cached data depends on
+    :return: str, or None if the cache directory can't be created
+    """
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+    except OSError:
+        return None
+    return os.path.join(CACHE_DIR, name)
+
+
+def source_stamp(path: str) -> str:
+    """
+    Returns a short stamp that changes whenever a file changes, for naming cache files derived from it
+    :param path: Path of the source file
+    :return: str
+    """
+    stat = os.stat(path)
+    return f"{stat.st_size:x}-{int(stat.st_mtime):x}"
@@ -0,0 +1,143 @@
+# Static Evaluation
+# Nischay Bharadwaj (N-tronics)
+
+from bitboard import BitBoard, WHITE, KING
+from typing import *
+
+PIECE_VALUES: List[int] = [100, 320, 330, 500, 900, 0]
+
+# Piece-square tables from white's point of view, laid out like the board with a8 first (square index order).
+# Values from the Simplified Evaluation Function by Tomasz Michniewski
+PST: List[List[int]] = [
+    # Pawn
+    [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0
+    ],
+    # Knight
+    [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50
+    ],
+    # Bishop
+    [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20
+    ],
+    # Rook
+    [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0
+    ],
+    # Queen
+    [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20
+    ],
+    # King, middle game
+    [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20
+    ]
+]
+
+KING_ENDGAME_PST: List[int] = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50
+]
+
+# Game phase weight of each piece type, 24 with all minor and major pieces on the board
+PHASE_WEIGHTS: List[int] = [0, 1, 1, 2, 4, 0]
+MAX_PHASE = 24
+
+
+def _piece_square_values(table: List[int], value: int) -> List[List[int]]:
+    """
+    Combines a white piece-square table with a material value for both colors, black seeing the board flipped
+    :param table: Piece-square table from white's point of view
+    :param value: Material value
+    :return: [white values by square, black values by square], black values negated
+    """
+    return [
+        [value + table[sq] for sq in range(64)],
+        [-(value + table[sq ^ 56]) for sq in range(64)]
+    ]
+
+
+# VALUES[piece code][square], material plus position, positive for white and negative for black
+VALUES: List[List[int]] = [[] for _ in range(12)]
+for _type in range(6):
+    VALUES[_type], VALUES[6 + _type] = _piece_square_values(PST[_type], PIECE_VALUES[_type])
+KING_ENDGAME_VALUES: List[List[int]] = _piece_square_values(KING_ENDGAME_PST, 0)
+
+
+def evaluate(bb: BitBoard) -> int:
+    """
+    Scores a position by material and piece placement, tapering the king table towards the endgame
+    :param bb: Position
+    :return: Score in centipawns from the side to move's point of view
+    """
+    score = 0
+    phase = 0
+    pieces = bb.pieces
+    for code in range(12):
+        if code % 6 == KING:
+            continue
+        values = VALUES[code]
+        bits = pieces[code]
+        while bits:
+            lsb = bits & -bits
+            bits ^= lsb
+            score += values[lsb.bit_length() - 1]
+            phase += PHASE_WEIGHTS[code % 6]
+
+    phase = min(phase, MAX_PHASE)
+    for color in (0, 1):
+        ksq = pieces[color * 6 + KING].bit_length() - 1
+        if ksq != -1:
+            score += (VALUES[color * 6 + KING][ksq] * phase + KING_ENDGAME_VALUES[color][ksq] * (MAX_PHASE - phase)) \
+                // MAX_PHASE
+
+    return score if bb.side == WHITE else -score
@@ -0,0 +1,181 @@
+# FEN Parsing and Generation
+# Nischay Bharadwaj (N-tronics)
+
+from array import array
+from bitboard import BitBoard, EMPTY, WHITE, BLACK, PAWN, KING, PIECE_CHARS, CASTLING_CHARS, RANK_8, RANK_1, \
+    WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE, square_name, parse_square
+from movegen import is_square_attacked, king_square
+from typing import *
+
+
+class FENError(ValueError):
+    pass
+
+
+# Digits expand to that many "." so the placement becomes 8 ranks of 8 characters
+_EXPAND = str.maketrans({str(n): "." * n for n in range(1, 9)})
+# Placement character to piece code as a signed byte, "." is EMPTY and anything else is marked invalid with 0x7F
+_INVALID = 0x7F
+_CHAR_CODES = bytes(
+    PIECE_CHARS.index(chr(c)) if chr(c) in PIECE_CHARS else (EMPTY & 0xFF if chr(c) == "." else _INVALID)
+    for c in range(256)
+)
+# Piece code (as an unsigned byte) to placement character, "1" for an empty square
+_CODE_CHARS = bytes(
+    ord(PIECE_CHARS[c]) if c < 12 else ord("1") for c in range(256)
+)
+_RUNS = [("1" * n, str(n)) for n in range(8, 1, -1)]
+
+# King and rook home squares each castling right needs
+_CASTLING_HOMES: List[Tuple[int, int, int, int]] = [
+    (WHITE_KINGSIDE, 60, 63, WHITE), (WHITE_QUEENSIDE, 60, 56, WHITE),
+    (BLACK_KINGSIDE, 4, 7, BLACK), (BLACK_QUEENSIDE, 4, 0, BLACK)
+]
+
+
+def parse_fen(fen: str, bb: BitBoard | None = None, validate: bool = True) -> BitBoard:
+    """
+    Loads a FEN string. The move clocks may be left out, as in EPD, and default to 0 and 1
+    :param fen: FEN string
+    :param bb: Position to load into, a new one is created if None
+    :param validate: Also check that the position makes sense: one king a side, no pawns on the back ranks,
+    castling rights backed by king and rook, a real en passant square and the side not to move not in check
+    :return: The position
+    """
+    fields = fen.split()
+    if not 4 <= len(fields) <= 6:
+        raise FENError(f"Expected 6 fields, got {len(fields)} in {fen!r}")
+    placement, side, castling, ep = fields[:4]
+
+    ranks = placement.translate(_EXPAND).split("/")
+    if len(ranks) != 8 or any(len(rank) != 8 for rank in ranks):
+        raise FENError(f"Placement {placement!r} doesn't describe 8 ranks of 8 squares")
+    codes = array("b")
+    codes.frombytes("".join(ranks).encode("ascii", "replace").translate(_CHAR_CODES))
+    if _INVALID in codes:
+        raise FENError(f"Invalid piece character in {placement!r}")
+
+    if side not in ("w", "b"):
+        raise FENError(f"Side to move must be w or b, got {side!r}")
+    side = WHITE if side == "w" else BLACK
+
+    rights = 0
+    if castling != "-":
+        for k in castling:
+            index = CASTLING_CHARS.find(k)
+            if index == -1 or rights & 1 << index:
+                raise FENError(f"Invalid castling rights {castling!r}")
+            rights |= 1 << index
+
+    if ep != "-" and (len(ep) != 2 or ep[0] not in "abcdefgh" or ep[1] != ("6" if side == WHITE else "3")):
+        raise FENError(f"Invalid en passant square {ep!r}")
+
+    try:
+        halfmove = int(fields[4]) if len(fields) > 4 else 0
+        fullmove = int(fields[5]) if len(fields) > 5 else 1
+    except ValueError:
+        raise FENError(f"Move clocks must be numbers in {fen!r}") from None
+    if halfmove < 0 or fullmove < 1:
+        raise FENError(f"Move clocks out of range in {fen!r}")
+
+    # Every field is checked before bb is touched and bb is put back if validation fails, so a rejected FEN leaves
+    # it as it was
+    saved = bb.copy() if bb is not None and validate else None
+    bb = bb or BitBoard()
+    bb.load_mailbox(codes)
+    bb.side = side
+    bb.castling = rights
+    bb.ep = EMPTY if ep == "-" else parse_square(ep)
+    bb.halfmove = halfmove
+    bb.fullmove = fullmove
+    bb.rehash()
+    if validate:
+        try:
+            validate_position(bb)
+        except FENError:
+            if saved is not None:
+                bb.load(saved)
+            raise
+    return bb
+
+
+def validate_position(bb: BitBoard) -> None:
+    """
+    Checks that a position could come up in a game, raising FENError if not
+    :param bb: Position
+    :return: None
+    """
+    for color, name in ((WHITE, "white"), (BLACK, "black")):
+        kings = bin(bb.pieces[color * 6 + KING]).count("1")
+        if kings != 1:
+            raise FENError(f"Expected one {name} king, found {kings}")
+    if (bb.pieces[PAWN] | bb.pieces[6 + PAWN]) & (RANK_8 | RANK_1):
+        raise FENError("Pawns on the first or last rank")
+
+    for right, king_sq, rook_sq, color in _CASTLING_HOMES:
+        if bb.castling & right and (bb.mailbox[king_sq] != color * 6 + KING or bb.mailbox[rook_sq] != color * 6 + 3):
+            raise FENError(f"Castling right {CASTLING_CHARS[right.bit_length() - 1]} "
+                           f"without king and rook on their squares")
+
+    if bb.ep != EMPTY:
+        # The pawn that just double pushed sits in front of the square, which is empty along with the one behind it
+        them = bb.side ^ 1
+        pawn_sq = bb.ep + (8 if bb.side == WHITE else -8)
+        behind = bb.ep - (8 if bb.side == WHITE else -8)
+        if bb.mailbox[pawn_sq] != them * 6 + PAWN or bb.mailbox[bb.ep] != EMPTY or bb.mailbox[behind] != EMPTY:
+            raise FENError(f"En passant square {square_name(bb.ep)} without a pawn that just moved two squares")
+
+    if is_square_attacked(bb, king_square(bb, bb.side ^ 1), bb.side):
+        raise FENError("The side not to move is in check")
+
+
+def format_fen(bb: BitBoard) -> str:
+    """
+    Writes a position as a six field FEN string
+    :param bb: Position
+    :return: str
+    """
+    squares = bb.mailbox.tobytes().translate(_CODE_CHARS).decode("ascii")
+    placement = "/".join(squares[i:i + 8] for i in range(0, 64, 8))
+    for run, digit in _RUNS:
+        placement = placement.replace(run, digit)
+    castling = "".join(k for i, k in enumerate(CASTLING_CHARS) if bb.castling & 1 << i) or "-"
+    ep = square_name(bb.ep) if bb.ep != EMPTY else "-"
+    return f"{placement} {'w' if bb.side == WHITE else 'b'} {castling} {ep} {bb.halfmove} {bb.fullmove}"
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Measure FEN parsing and generation speed")
+    parser.add_argument("file", nargs="?", help="file with one FEN per line, the perft positions if left out")
+    parser.add_argument("--repeat", type=int, default=20000, help="parses of each position")
+    parser.add_argument("--no-validate", action="store_true", help="skip position validation")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file) as file:
+            fens = [line.split(";")[0].strip() for line in file if line.strip() and not line.startswith("#")]
+        repeat = max(1, args.repeat // len(fens))
+    else:
+        from perft import PERFT_POSITIONS
+        fens = [fen for _, fen, _ in PERFT_POSITIONS]
+        repeat = args.repeat
+
+    bb = BitBoard()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for fen in fens:
+            parse_fen(fen, bb, not args.no_validate)
+    parse_time = time.perf_counter() - start
+    positions = [parse_fen(fen) for fen in fens]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for position in positions:
+            format_fen(position)
+    format_time = time.perf_counter() - start
+
+    count = repeat * len(fens)
+    print(f"parse: {count} FENs in {parse_time:.3f}s, {int(count / parse_time)} FENs/s")
+    print(f"format: {count} FENs in {format_time:.3f}s, {int(count / format_time)} FENs/s")
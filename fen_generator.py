@@ -15,7 +15,7 @@ class FENGenerator:
         self.chess = Chess()
         pygame.display.set_caption("FEN Generator")
         self.board = self.chess.board
-        self.board.load_fen(game.empty_fen)
+        self.board.load_fen(game.empty_fen, False)
         self.piece_type = Piece.KING
 
     def start(self):
@@ -3,94 +3,134 @@
 
 from pieces import *
 from square import Square
+from bitboard import BitBoard, EMPTY, COLORS, square_index, iter_bits, piece_code, code_color, code_type
+from moves import move_to_uci
+import movegen
+from attack_maps import AttackMap, compute_attack_map
+from move_cache import MoveCache, MoveSet
+import positions
+from fen import parse_fen, format_fen
 
 power_pieces: List[Piece.Type] = [
     Piece.ROOK, Piece.KNIGHT, Piece.BISHOP, Piece.QUEEN, Piece.KING, Piece.BISHOP, Piece.KNIGHT, Piece.ROOK
 ]
 start_fen = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
-empty_fen = "8/8/8/8/8/8/8/8 w KQkq - 0 1"
+empty_fen = "8/8/8/8/8/8/8/8 w - - 0 1"
+
+
+class BoardView:
+    def __init__(self, bitboard: BitBoard, attack_map: Callable[[], AttackMap] | None = None):
+        """
+        board[x, y] style access to a BitBoard through Square objects
+        Piece objects are only created when a square is looked at and its piece changed since the last look
+        :param bitboard: BitBoard to view
+        :param attack_map: Returns the attack map of the current position, used to fill in Square.attacks
+        """
+        self.bitboard = bitboard
+        self.attack_map = attack_map
+        self.squares: List[Square] = [Square(sq) for sq in range(64)]
+
+    def __getitem__(self, coords: Tuple[int, int]) -> Square:
+        x, y = coords
+        sq = square_index(x, y)
+        sqr: Square = self.squares[sq]
+        code = self.bitboard.mailbox[sq]
+        if code == EMPTY:
+            sqr.piece = None
+        elif sqr.piece is None or sqr.piece.code != code:
+            sqr.piece = create_piece(code_type(code))(Vec2(x, y), code_color(code))
+        if self.attack_map is not None:
+            sqr.attack_counts = self.attack_map().counts[sq]
+        return sqr
 
 
 class ChessEngine:
     def __init__(self, load_start_fen: bool = True):
-        # This array is the internal representation of a chess board
-        self.board: np.ndarry = np.empty((8, 8), dtype=Square)
-        for i in range(8):
-            for j in range(8):
-                self.board[i, j] = Square(Vec2(i, j), Piece.WHITE if (i + j) % 2 == 0 else Piece.BLACK)
-
-        # Keeps track of piece position according to color to avoid a board search
-        self.piece_positions: Dict[str, Set[Vec2]] = {
-            Piece.WHITE: set([]),
-            Piece.BLACK: set([])
-        }
-        self.turn: Piece.Color = Piece.WHITE
+        # The position lives in a set of bitboards, self.board gives board[x, y] access to it
+        self.bitboard = BitBoard()
+        self.board: BoardView = BoardView(self.bitboard, self.attack_map)
         self.selected_square: Square | None = None
 
+        # Moves played since the last load_fen and the undo information to take each one back
+        self.move_stack: List[int] = []
+        self.undo_stack: List[int] = []
+        # Attack map of the position after each move, built when first asked for, so taking a move back restores
+        # the previous map without recomputing it
+        self.attack_maps: List[AttackMap | None] = [None]
+        # Legal moves of recently seen positions, so clicking around a position never regenerates them
+        self.move_cache = MoveCache()
+        # Preallocated buffer the staged generators write 16 bit moves into, see pseudo_legal_moves
+        self.move_buffer = movegen.new_move_buffer()
+
         if load_start_fen:
             self.load_fen(start_fen)
-        self.load_fen("8/2npp3/1Qb5/5B2/8/4q3/2PP1N2/8 w KQkq - 0 1")
+
+    @property
+    def turn(self) -> Piece.Color:
+        return COLORS[self.bitboard.side]
+
+    @turn.setter
+    def turn(self, color: Piece.Color) -> None:
+        self.bitboard.side = COLORS.index(color)
+        self.bitboard.rehash()
+
+    @property
+    def key(self) -> int:
+        """
+        Zobrist key of the current position, kept up to date incrementally
+        :return: 64 bit key
+        """
+        return self.bitboard.key
+
+    @property
+    def piece_positions(self) -> Dict[Piece.Color, Set[Vec2]]:
+        """
+        Positions of the pieces of each color, built from the occupancy bitboards
+        :return: Dict[Color, Set[Vec2]]
+        """
+        return {
+            color: set(Vec2(sq & 7, sq >> 3) for sq in iter_bits(self.bitboard.occupancy[i]))
+            for i, color in enumerate(COLORS)
+        }
 
     def clear_board(self):
-        self.load_fen(empty_fen)
+        self.load_fen(empty_fen, False)
 
-    def load_fen(self, fen: str) -> None:
+    def load_fen(self, fen: str, validate: bool = True) -> None:
         """
-        Loads a FEN string
+        Loads a FEN string, see fen.parse_fen
         :param fen: str
+        :param validate: Reject positions that can't come up in a game, e.g. without kings. Turned off for editing
+        :return: None
+        """
+        parse_fen(fen, self.bitboard, validate)
+        self.move_stack.clear()
+        self.undo_stack.clear()
+        self.attack_maps[:] = [None]
+
+    def generate_fen(self) -> str:
+        return format_fen(self.bitboard)
+
+    def to_bytes(self) -> bytes:
+        """
+        Packs the position into a fixed 40 byte record, see positions.py
+        :return: bytes
+        """
+        return positions.encode_position(self.bitboard)
+
+    def load_bytes(self, data: bytes | memoryview) -> None:
+        """
+        Loads a position packed by to_bytes
+        :param data: 40 byte record
         :return: None
         """
-        fields = fen.split()
-        self.piece_positions[Piece.WHITE].clear()
-        self.piece_positions[Piece.BLACK].clear()
-
-        # Piece Position
-        for i, row in enumerate(fields[0].split("/")):
-            j = 0
-            for k in row:
-                if k.isnumeric():
-                    for _ in range(j, j + int(k)):
-                        self.board[_, i].piece = None
-                    j += int(k)
-                else:
-                    color = Piece.WHITE if k.isupper() else Piece.BLACK
-                    self.piece_positions[color].add(Vec2(j, i))
-                    self.place_piece(Vec2(j, i), k.lower(), color)
-                    j += 1
-
-        # Turn
-        self.turn = Piece.WHITE if fields[1] == "w" else Piece.BLACK
-
-    def generate_fen(self):
-        fen = ""
-        # Pieces
-        for i in range(8):
-            empty = 0
-            for j in range(8):
-                sqr = self.board[j, i]
-                if sqr.has_piece():
-                    if empty > 0:
-                        fen += str(empty)
-                        empty = 0
-                    fen += sqr.piece.type.upper() if sqr.piece.color == Piece.WHITE else sqr.piece.type.lower()
-                else:
-                    empty += 1
-            if empty > 0:
-                fen += str(empty)
-            if i != 7:
-                fen += "/"
-        fen += " "
-        # Turn
-        fen += self.turn + " "
-
-        fen += "KQkq - 0 1"
-
-        return fen
+        positions.decode_position(data, self.bitboard)
+        self.move_stack.clear()
+        self.undo_stack.clear()
+        self.attack_maps[:] = [None]
 
     def place_piece(self, pos: Vec2, type_: str, color: str) -> None:
-        self.board[pos.x, pos.y].piece = create_piece(type_)(Vec2(pos.x, pos.y), color)
-        self.piece_positions[Piece.opposite_color(color)].discard(pos)
-        self.piece_positions[color].add(pos)
+        self.bitboard.set_piece(square_index(pos.x, pos.y), piece_code(type_, color))
 
     def remove_piece(self, pos: Vec2) -> None:
         """
@@ -98,10 +138,102 @@ class ChessEngine:
         :param pos: Vec2 containing the coords of the piece to remove
         :return: None
         """
-        sqr: Square = self.board[pos.x, pos.y]
-        if sqr.has_piece():
-            self.piece_positions[sqr.piece.color].discard(pos)
-            sqr.piece = None
+        self.bitboard.remove_piece(square_index(pos.x, pos.y))
+
+    def legal_moves(self) -> List[int]:
+        """
+        Returns all legal moves of the side to move, generated once per position
+        :return: List of moves, see moves.py for the encoding. Shared with the move cache, so don't modify it
+        """
+        return self.move_cache.get(self.bitboard).moves
+
+    def move_set(self) -> MoveSet:
+        """
+        Returns the legal moves of the side to move indexed by from-square
+        :return: MoveSet
+        """
+        return self.move_cache.get(self.bitboard)
+
+    def pseudo_legal_moves(self) -> Tuple[int, int]:
+        """
+        Writes the pseudo-legal moves of the side to move into self.move_buffer, captures and queen promotions first
+        and quiet moves after them. Moves may leave the king in check, movegen.is_legal filters them
+        :return: (end of the captures, number of moves)
+        """
+        captures = movegen.generate_captures(self.bitboard, self.move_buffer)
+        return captures, movegen.generate_quiets(self.bitboard, self.move_buffer, captures)
+
+    def make_move(self, move: int) -> None:
+        """
+        Plays a legal move, updating only the squares it touches
+        :param move: Move from legal_moves()
+        :return: None
+        """
+        self.undo_stack.append(movegen.make_move(self.bitboard, move))
+        self.move_stack.append(move)
+        self.attack_maps.append(None)
+
+    def unmake_move(self) -> int:
+        """
+        Takes back the last move played with make_move
+        :return: The move taken back
+        """
+        move = self.move_stack.pop()
+        movegen.unmake_move(self.bitboard, move, self.undo_stack.pop())
+        self.attack_maps.pop()
+        return move
+
+    def attack_map(self) -> AttackMap:
+        """
+        Returns the attack map of the current position, building it on first use
+        Maps are kept per move played, and rebuilt if the position was edited since
+        :return: AttackMap
+        """
+        attack_map = self.attack_maps[-1]
+        if attack_map is None or attack_map.key != self.bitboard.key:
+            attack_map = self.attack_maps[-1] = compute_attack_map(self.bitboard)
+        return attack_map
+
+    def is_square_attacked(self, pos: Vec2, by: Piece.Color) -> bool:
+        """
+        Checks whether a color attacks a square
+        :param pos: Vec2(grid X coordinate, grid Y coordinate)
+        :param by: Attacking color
+        :return: bool
+        """
+        return self.attack_map().is_attacked(square_index(pos.x, pos.y), COLORS.index(by))
+
+    def in_check(self) -> bool:
+        return self.attack_map().checkers != 0
+
+    def is_pinned(self, pos: Vec2) -> bool:
+        """
+        Checks whether a piece of the side to move is pinned to its king
+        :param pos: Vec2(grid X coordinate, grid Y coordinate)
+        :return: bool
+        """
+        return bool(self.attack_map().pinned >> square_index(pos.x, pos.y) & 1)
+
+    def perft(self, depth: int) -> int:
+        """
+        Counts the leaf nodes of the legal move tree from the current position
+        :param depth: Depth in plies
+        :return: Number of leaf nodes
+        """
+        return movegen.perft(self.bitboard, depth)
+
+    def divide(self, depth: int) -> Dict[str, int]:
+        """
+        Perft split by root move, for finding which move a wrong node count comes from
+        :param depth: Depth in plies
+        :return: Dict of UCI move string to leaf node count
+        """
+        counts = {}
+        for move in self.legal_moves():
+            self.make_move(move)
+            counts[move_to_uci(move)] = movegen.perft(self.bitboard, depth - 1)
+            self.unmake_move()
+        return counts
 
     @staticmethod
     def valid_coords(coords: Vec2) -> bool:
@@ -130,8 +262,13 @@ class ChessEngine:
             self.selected_square = None
         else:
             self.selected_square = self.board[coords.x, coords.y]
-            self.selected_square.piece.selected = True
-            self.selected_square.piece.compute_valid_moves(self.board)
+            piece = self.selected_square.piece
+            piece.selected = True
+            if piece.color == self.turn:
+                targets = self.move_set().targets.get(square_index(coords.x, coords.y), 0)
+                piece.valid_moves = [Vec2(to & 7, to >> 3) for to in iter_bits(targets)]
+            else:
+                piece.compute_valid_moves(self.board)
 
     def handle_click(self, pos: Vec2) -> None:
         """
@@ -140,8 +277,15 @@ class ChessEngine:
         :return: None
         """
         sqr_clicked: Square = self.board[pos.x, pos.y]
-        # TODO: Valid moves takes precedence over reselection
-        if sqr_clicked.has_piece():
+        # Valid moves take precedence over reselection
+        if self.selected_square is not None and self.selected_square.piece.color == self.turn \
+                and pos in self.selected_square.piece.valid_moves:
+            frm = square_index(self.selected_square.pos.x, self.selected_square.pos.y)
+            # Queen promotions come first in the legal move list, so promotions default to a queen
+            move = self.move_set().find(frm, square_index(pos.x, pos.y))
+            self.select(None)
+            self.make_move(move)
+        elif sqr_clicked.has_piece():
             self.select(pos)
         else:
             self.select(None)
@@ -0,0 +1,356 @@
+# Instrumentation
+# Nischay Bharadwaj (N-tronics)
+
+import os
+import sys
+import time
+import json
+import atexit
+import marshal
+import functools
+import importlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import *
+
+# Functions timed by enable() when no others are named, as "module.Class.function" or "module.function"
+DEFAULT_TARGETS: List[str] = [
+    "game.ChessEngine.load_fen", "game.ChessEngine.place_piece", "game.ChessEngine.legal_moves",
+    "game.ChessEngine.select", "game.ChessEngine.make_move", "game.ChessEngine.unmake_move",
+    "game.ChessEngine.attack_map", "fen.parse_fen", "fen.format_fen", "movegen.generate_legal_moves",
+    "evaluation.evaluate", "search.Searcher.search", "main.Chess.draw"
+]
+# NTCHESS_PROFILE=1 times DEFAULT_TARGETS, any other value is a comma separated list of targets.
+# The report goes to NTCHESS_PROFILE_OUT on exit, as JSON or as a pstats dump if it ends in .prof
+PROFILE_ENV = "NTCHESS_PROFILE"
+PROFILE_OUT_ENV = "NTCHESS_PROFILE_OUT"
+
+
+@dataclass
+class FunctionStats:
+    calls: int = 0
+    # Seconds, including everything the function calls
+    total: float = 0.0
+    # Slowest single call, to tell latency spikes from steady cost
+    slowest: float = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+
+@dataclass
+class SearchStats:
+    searches: int = 0
+    nodes: int = 0
+    tt_probes: int = 0
+    tt_hits: int = 0
+    # Nodes that failed high, stored in the table as lower bounds
+    cutoffs: int = 0
+    # Nodes of each finished iteration of the last search, by depth
+    iteration_nodes: List[int] = field(default_factory=list)
+
+    @property
+    def branching_factor(self) -> float:
+        """
+        Effective branching factor of the last search, the mean growth in nodes from one iteration to the next
+        :return: float, 0 with fewer than two iterations
+        """
+        nodes = [n for n in self.iteration_nodes if n > 0]
+        if len(nodes) < 2:
+            return 0.0
+        return (nodes[-1] / nodes[0]) ** (1 / (len(nodes) - 1))
+
+
+# Everything recorded since the last reset, keyed by target name
+functions: Dict[str, FunctionStats] = {}
+counters: Dict[str, int] = {}
+search_stats: Dict[str, SearchStats] = {}
+# Originals of the patched targets, to restore them by disable()
+_patched: Dict[str, Tuple[Any, str, Any, Any]] = {}
+
+
+def _timed(name: str, func: Callable) -> Callable:
+    stats = functions.setdefault(name, FunctionStats())
+    perf_counter = time.perf_counter
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            stats.calls += 1
+            stats.total += elapsed
+            if elapsed > stats.slowest:
+                stats.slowest = elapsed
+
+    return wrapper
+
+
+def _loaded_module(name: str) -> Any:
+    """
+    Finds an imported module, including the script being run, which is imported as __main__ and not under its name
+    :param name: Module name
+    :return: Module, or None if it isn't imported
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    script = getattr(sys.modules.get("__main__"), "__file__", None) or ""
+    if os.path.splitext(os.path.basename(script))[0] == name:
+        return sys.modules["__main__"]
+    return None
+
+
+def enable(targets: Iterable[str] | None = None) -> List[str]:
+    """
+    Starts timing functions by wrapping them in place. Nothing is wrapped until this is called, so instrumentation
+    costs nothing while it's off. Functions imported by name elsewhere (from movegen import ...) are wrapped there too
+    :param targets: Names as in DEFAULT_TARGETS. Defaults are skipped if their module isn't imported yet, named ones
+    are imported
+    :return: Targets that were wrapped
+    """
+    enabled = []
+    for target in targets if targets is not None else DEFAULT_TARGETS:
+        if target in _patched:
+            continue
+        parts = target.split(".")
+        owner = _loaded_module(parts[0])
+        if owner is None:
+            if targets is None:
+                continue
+            owner = importlib.import_module(parts[0])
+        for part in parts[1:-1]:
+            owner = getattr(owner, part)
+        original = owner.__dict__[parts[-1]] if isinstance(owner, type) else getattr(owner, parts[-1])
+        wrapper = _timed(target, original)
+        setattr(owner, parts[-1], wrapper)
+        # Rebind module level functions in every module that imported them by name
+        rebound = []
+        if not isinstance(owner, type):
+            for module in list(sys.modules.values()):
+                namespace = getattr(module, "__dict__", {})
+                for attribute, value in list(namespace.items()):
+                    if value is original:
+                        namespace[attribute] = wrapper
+                        rebound.append((namespace, attribute))
+        _patched[target] = (owner, parts[-1], original, rebound)
+        enabled.append(target)
+    return enabled
+
+
+def disable() -> None:
+    """
+    Puts every wrapped function back, the recorded stats are kept
+    :return: None
+    """
+    for owner, attribute, original, rebound in _patched.values():
+        setattr(owner, attribute, original)
+        for namespace, name in rebound:
+            namespace[name] = original
+    _patched.clear()
+
+
+def reset() -> None:
+    """
+    Clears everything recorded, wrapped functions keep recording
+    :return: None
+    """
+    for stats in functions.values():
+        stats.calls, stats.total, stats.slowest = 0, 0.0, 0.0
+    counters.clear()
+    search_stats.clear()
+
+
+def count(name: str, amount: int = 1) -> None:
+    counters[name] = counters.get(name, 0) + amount
+
+
+@contextmanager
+def timer(name: str) -> Generator[None, None, None]:
+    """
+    Times a block under a name, recorded like a wrapped function
+    :param name: Name to record under
+    """
+    stats = functions.setdefault(name, FunctionStats())
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.calls += 1
+        stats.total += elapsed
+        stats.slowest = max(stats.slowest, elapsed)
+
+
+def instrument_search(searcher: "Searcher | ParallelSearcher", name: str = "search") -> SearchStats:
+    """
+    Records node counts, table hits, cutoffs and iteration sizes of every search a searcher runs from now on.
+    The searcher's methods are shadowed on the instance, the search code itself is untouched
+    :param searcher: Searcher to watch
+    :param name: Name the stats are kept under in search_stats
+    :return: SearchStats, updated after every search
+    """
+    stats = search_stats.setdefault(name, SearchStats())
+    tt = searcher.tt
+    search = searcher.search
+    store = tt.store
+
+    def counting_store(key: int, move: int, depth: int, bound: int, score: int) -> None:
+        if bound == LOWER:
+            stats.cutoffs += 1
+        store(key, move, depth, bound, score)
+
+    def instrumented_search(bb, limits=None, on_info=None):
+        stats.iteration_nodes = []
+        probes, hits = tt.probes, tt.hits
+
+        def record(info) -> None:
+            stats.iteration_nodes.append(info.nodes)
+            if on_info is not None:
+                on_info(info)
+
+        try:
+            return search(bb, limits, record)
+        finally:
+            stats.searches += 1
+            stats.nodes += searcher.total_nodes() if hasattr(searcher, "total_nodes") else searcher.nodes
+            stats.tt_probes += tt.probes - probes
+            stats.tt_hits += tt.hits - hits
+
+    from transposition import LOWER
+    tt.store = counting_store
+    searcher.search = instrumented_search
+    return stats
+
+
+def uninstrument_search(searcher: "Searcher | ParallelSearcher") -> None:
+    searcher.__dict__.pop("search", None)
+    searcher.tt.__dict__.pop("store", None)
+
+
+def report() -> Dict[str, Any]:
+    """
+    Everything recorded, as plain data for JSON
+    :return: dict
+    """
+    return {
+        "functions": {
+            name: {**asdict(stats), "mean": stats.mean} for name, stats in functions.items() if stats.calls
+        },
+        "counters": dict(counters),
+        "search": {
+            name: {**asdict(stats), "branching_factor": stats.branching_factor}
+            for name, stats in search_stats.items()
+        }
+    }
+
+
+def write_json(path: str) -> None:
+    with open(path, "w") as file:
+        json.dump(report(), file, indent=2)
+
+
+def write_pstats(path: str) -> None:
+    """
+    Writes the function timings in the format cProfile dumps, for pstats, snakeviz and other profile viewers.
+    Times are inclusive, so they appear as both own and cumulative time
+    :param path: Output file
+    :return: None
+    """
+    entries = {}
+    for name, stats in functions.items():
+        if not stats.calls:
+            continue
+        patched = _patched.get(name)
+        code = getattr(patched[2], "__code__", None) if patched else None
+        location = (code.co_filename, code.co_firstlineno) if code else ("~", 0)
+        entries[(*location, name)] = (stats.calls, stats.calls, stats.total, stats.total, {})
+    with open(path, "wb") as file:
+        marshal.dump(entries, file)
+
+
+@contextmanager
+def cprofile(path: str) -> Generator[None, None, None]:
+    """
+    Runs a block under the full cProfile, every function call counted, and dumps the result
+    :param path: Output file, readable by pstats
+    """
+    import cProfile
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+
+
+def format_report() -> str:
+    lines = [f"{'function':40} {'calls':>10} {'total ms':>10} {'mean us':>10} {'max ms':>10}"]
+    for name, stats in sorted(functions.items(), key=lambda item: -item[1].total):
+        if stats.calls:
+            lines.append(f"{name:40} {stats.calls:>10} {stats.total * 1000:>10.1f} {stats.mean * 1e6:>10.1f} "
+                         f"{stats.slowest * 1000:>10.2f}")
+    for name, value in counters.items():
+        lines.append(f"{name:40} {value:>10}")
+    for name, stats in search_stats.items():
+        hit_rate = stats.tt_hits / stats.tt_probes if stats.tt_probes else 0.0
+        lines.append(f"{name}: {stats.searches} searches, {stats.nodes} nodes, {stats.tt_probes} TT probes "
+                     f"({hit_rate:.1%} hits), {stats.cutoffs} cutoffs, branching factor {stats.branching_factor:.2f}")
+    return "\n".join(lines)
+
+
+def _write_report(path: str | None) -> None:
+    if not path:
+        sys.stderr.write(format_report() + "\n")
+    elif path.endswith(".prof"):
+        write_pstats(path)
+    else:
+        write_json(path)
+
+
+def enable_from_environment() -> bool:
+    """
+    Enables instrumentation if NTCHESS_PROFILE is set and writes the report on exit, so deployments switch it on
+    without code changes
+    :return: True if it was enabled
+    """
+    value = os.environ.get(PROFILE_ENV)
+    if not value or value == "0":
+        return False
+    enable(None if value == "1" else [target.strip() for target in value.split(",") if target.strip()])
+    atexit.register(_write_report, os.environ.get(PROFILE_OUT_ENV))
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+    import game
+    from search import Searcher, SearchLimits
+
+    parser = argparse.ArgumentParser(description="Search a position with instrumentation on and report where the "
+                                                 "time went")
+    parser.add_argument("--fen", default=game.start_fen, help="position to search")
+    parser.add_argument("--depth", type=int, default=5, help="search depth")
+    parser.add_argument("--json", help="write the report as JSON")
+    parser.add_argument("--pstats", help="write the function timings as a pstats dump")
+    parser.add_argument("--cprofile", help="also run the search under cProfile and dump it here")
+    args = parser.parse_args()
+
+    enable(DEFAULT_TARGETS[:-1])
+    engine = game.ChessEngine(False)
+    engine.load_fen(args.fen)
+    searcher = Searcher()
+    instrument_search(searcher)
+    if args.cprofile:
+        with cprofile(args.cprofile):
+            searcher.search(engine.bitboard, SearchLimits(depth=args.depth))
+    else:
+        searcher.search(engine.bitboard, SearchLimits(depth=args.depth))
+    print(format_report())
+    if args.json:
+        write_json(args.json)
+    if args.pstats:
+        write_pstats(args.pstats)
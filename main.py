@@ -3,17 +3,59 @@
 
 import pygame
 import os
+import time
+import random
 import game
-from sys import exit as sys_exit
-from square import Square
-from pieces import BasePiece
+import search
+from analysis import AnalysisWorker
+from book import OpeningBook
+from tablebases import Tablebases
+from sys import exit as sys_exit, argv
+from bitboard import EMPTY, square_index, code_color, code_type
+from cache import cache_path, source_stamp
+from moves import move_to_uci
 from game_constants import Piece, PColors
 from vector import *
 from typing import *
 
 
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+# Column of each piece type in images/piece-collection.png, white pieces on the top row and black on the bottom one
+ATLAS_ORDER: List[Piece.Type] = [Piece.KING, Piece.QUEEN, Piece.BISHOP, Piece.KNIGHT, Piece.ROOK, Piece.PAWN]
+
+
+def load_scaled_image(name: str, size: Tuple[int, int]) -> pygame.Surface:
+    """
+    Loads an image from images/ scaled to a size, caching the scaled pixels on disk
+    so later launches skip decoding and scaling the full size PNG
+    :param name: File name in images/
+    :param size: (width, height) to scale to
+    :return: pygame.Surface with per pixel alpha
+    """
+    source = os.path.join(IMAGES_DIR, name)
+    path = cache_path(f"{os.path.splitext(name)[0]}-{size[0]}x{size[1]}-{source_stamp(source)}.rgba")
+    if path is not None and os.path.exists(path):
+        with open(path, "rb") as file:
+            pixels = file.read()
+        if len(pixels) == size[0] * size[1] * 4:
+            return pygame.image.frombytes(pixels, size, "RGBA")
+
+    surface = pygame.transform.scale(pygame.image.load(source), size)
+    if path is not None:
+        try:
+            with open(path, "wb") as file:
+                file.write(pygame.image.tobytes(surface, "RGBA"))
+        except OSError:
+            pass
+    return surface
+
+
 class Chess:
-    def __init__(self):
+    def __init__(self, book_path: str | None = None, analyse: bool = False):
+        """
+        :param book_path: Polyglot opening book the engine plays from before it starts searching
+        :param analyse: Start with background analysis on, it can be toggled with A
+        """
         # Pygame init
         self.WIN_DIMENS = Vec2(600, 600)
         self.WIN = pygame.display.set_mode(self.WIN_DIMENS.get_tuple())
@@ -23,27 +65,36 @@ class Chess:
 
         # Draw occurs only if this flag is set
         self.update_screen = True
+        # Cell states on screen as returned by cell_states, None until the first full draw
+        self.drawn_cells: List[int] | None = None
 
         # Game control constants
         self.grid_offset = Vec2(21, 8)
         self.cell_size = Vec2(71.5, 71)
         self.grid_dimens = self.cell_size * Vec2(8, 8)
         self.board = game.ChessEngine()
+        # Engine moves are searched for at most this many seconds
+        self.think_time = 1.0
+        self.searcher = search.Searcher(tablebases=Tablebases())
+        self.book = OpeningBook(book_path) if book_path else None
+        self.book_rng = random.Random()
+        # Analysis runs in another process and streams its results into the window title
+        self.analysis: AnalysisWorker | None = AnalysisWorker() if analyse else None
+        self.analysed_key: int | None = None
+        self.analysed_side = 0
 
-        # Loading and scale images
-        self.board_img = pygame.transform.scale(
-            pygame.image.load(os.path.join(os.getcwd(), "images", "chess-board.png")),
-            self.WIN_DIMENS.get_tuple()
-        )
+        # Load images, pieces are cut out of a single atlas scaled to a whole number of cells
+        self.board_img = load_scaled_image("chess-board.png", self.WIN_DIMENS.get_tuple()).convert()
+        sprite_size = int(self.cell_size.x), int(self.cell_size.y)
+        atlas = load_scaled_image(
+            "piece-collection.png", (sprite_size[0] * len(ATLAS_ORDER), sprite_size[1] * 2)
+        ).convert_alpha()
         self.piece_imgs: Dict[Piece.Color, Dict[Piece.Type, pygame.Surface]] = {
-            Piece.WHITE: {piece_type: pygame.transform.scale(
-                pygame.image.load(os.path.join(os.getcwd(), "images", f"w{BasePiece.get_name(piece_type)}.png")),
-                self.cell_size.get_tuple()
-            ) for piece_type in set(game.power_pieces + [Piece.PAWN])},
-            Piece.BLACK: {piece_type: pygame.transform.scale(
-                pygame.image.load(os.path.join(os.getcwd(), "images", f"b{BasePiece.get_name(piece_type)}.png")),
-                self.cell_size.get_tuple()
-            ) for piece_type in set(game.power_pieces + [Piece.PAWN])}
+            color: {
+                piece_type: atlas.subsurface(
+                    (column * sprite_size[0], row * sprite_size[1], *sprite_size)
+                ) for column, piece_type in enumerate(ATLAS_ORDER)
+            } for row, color in enumerate([Piece.WHITE, Piece.BLACK])
         }
 
     def window_coords_to_grid_coords(self, w_coords: Vec2) -> Vec2 | None:
@@ -81,61 +132,159 @@ class Chess:
         if not self.update_screen:
             return
         self.update_screen = False
-        self.WIN.blit(self.board_img, (0, 0))
-
-        # Draws grid lines
-        # for i in range(9):
-        #     pygame.draw.line(self.WIN, (255, 0, 0),
-        #           (self.grid_offset.x + self.cell_size.x * i, self.grid_offset.y),
-        #           (self.grid_offset.x + self.cell_size.x * i, self.grid_offset.y + self.cell_size.y * 8),
-        #           1
-        #     )
-        # for i in range(9):
-        #     pygame.draw.line(self.WIN, (255, 0, 0),
-        #           (self.grid_offset.x, self.grid_offset.y + self.cell_size.y * i),
-        #           (self.grid_offset.x + self.cell_size.x * 8, self.grid_offset.y + self.cell_size.y * i),
-        #           1
-        #     )
-
-        if self.board.selected_square is not None:
-            # Draw orange highlight on selected piece
-            pygame.draw.rect(self.WIN, PColors.ORANGE_HL, (
-                *self.grid_coords_to_window_coords(self.board.selected_square.pos).get_tuple(),
-                *self.cell_size.get_tuple()
-            ))
-            # Draw red highlight on valid moves
-            for move in self.board.selected_square.piece.valid_moves:
-                pygame.draw.rect(self.WIN, PColors.RED_HL, (
-                    *self.grid_coords_to_window_coords(move).get_tuple(), *self.cell_size.get_tuple()
-                ))
-
-        for piece_positions in self.board.piece_positions.values():
-            for g_coords in piece_positions:
-                sqr: Square = self.board.board[g_coords.x, g_coords.y]
-                if sqr.has_piece():
-                    coords: Vec2 = self.grid_coords_to_window_coords(sqr.piece.pos)
-                    self.WIN.blit(self.piece_imgs[sqr.piece.color][sqr.piece.type], coords.get_tuple())
-                else:
-                    raise Exception(f"Invalid {g_coords} in piece position set")
-
-        pygame.display.update()
+
+        cells = self.cell_states()
+        full = self.drawn_cells is None
+        if full:
+            # The frame around the grid is only ever painted here
+            self.WIN.blit(self.board_img, (0, 0))
+            changed = range(64)
+        else:
+            changed = [sq for sq in range(64) if cells[sq] != self.drawn_cells[sq]]
+        self.drawn_cells = cells
+        if not changed:
+            return
+
+        # Only the cells whose piece or highlight changed are repainted and pushed to the display
+        rects = []
+        for sq in changed:
+            rect = self.cell_rect(sq)
+            self.WIN.blit(self.board_img, rect, rect)
+            highlight, code = cells[sq] >> 4, (cells[sq] & 15) - 1
+            if highlight:
+                pygame.draw.rect(self.WIN, PColors.ORANGE_HL if highlight == 1 else PColors.RED_HL, rect)
+            if code != EMPTY:
+                self.WIN.blit(self.piece_imgs[code_color(code)][code_type(code)], rect)
+            rects.append(rect)
+
+        if full:
+            pygame.display.update()
+        else:
+            pygame.display.update(rects)
+
+    def cell_rect(self, sq: int) -> pygame.Rect:
+        """
+        Window rectangle of a cell, rounded so neighbouring cells neither overlap nor leave gaps
+        :param sq: Square index
+        :return: pygame.Rect
+        """
+        x, y = sq % 8, sq // 8
+        left = int(self.grid_offset.x + self.cell_size.x * x)
+        top = int(self.grid_offset.y + self.cell_size.y * y)
+        return pygame.Rect(
+            left, top,
+            int(self.grid_offset.x + self.cell_size.x * (x + 1)) - left,
+            int(self.grid_offset.y + self.cell_size.y * (y + 1)) - top
+        )
+
+    def cell_states(self) -> List[int]:
+        """
+        What every cell should show, packed as highlight << 4 | (piece code + 1)
+        with highlight 0 for none, 1 for the selected square and 2 for a move target
+        :return: List of 64 ints in square index order
+        """
+        cells = [code + 1 for code in self.board.bitboard.mailbox]
+        selected = self.board.selected_square
+        if selected is not None:
+            cells[square_index(selected.pos.x, selected.pos.y)] |= 1 << 4
+            for move in selected.piece.valid_moves:
+                cells[square_index(move.x, move.y)] |= 2 << 4
+        return cells
+
+    def redraw(self) -> None:
+        """
+        Forces the next draw to repaint the whole window, e.g. after it was covered or resized
+        :return: None
+        """
+        self.drawn_cells = None
+        self.update_screen = True
+
+    def engine_move(self) -> None:
+        """
+        Plays a book move if the position is in the opening book, otherwise searches it and plays the best move found
+        :return: None
+        """
+        move = self.book.choose(self.board.bitboard, self.book_rng) if self.book is not None else None
+        if move is None:
+            result = self.searcher.search(self.board.bitboard, search.SearchLimits(movetime=self.think_time))
+            move = result.pv[0] if result.pv else None
+            if move is not None:
+                pygame.display.set_caption(f"Chess - engine played {move_to_uci(move)}, depth {result.depth}")
+        else:
+            pygame.display.set_caption(f"Chess - engine played {move_to_uci(move)} from the book")
+        if move is not None:
+            self.board.select(None)
+            self.board.make_move(move)
+            self.update_screen = True
+
+    def toggle_analysis(self) -> None:
+        if self.analysis is None:
+            self.analysis = AnalysisWorker()
+        else:
+            self.analysis.close()
+            self.analysis = None
+            pygame.display.set_caption("Chess")
+        self.analysed_key = None
+
+    def update_analysis(self) -> None:
+        """
+        Sends the position to the analysis worker when it changed and shows the newest result, never blocking
+        :return: None
+        """
+        if self.analysis is None:
+            return
+        if self.board.key != self.analysed_key:
+            self.analysed_key = self.board.key
+            self.analysed_side = self.board.bitboard.side
+            self.analysis.analyse(self.board.bitboard)
+            pygame.display.set_caption("Chess - analysing")
+        info = self.analysis.poll()
+        if info is not None:
+            # Scores are shown from white's point of view
+            score = info.score if self.analysed_side == 0 else -info.score
+            mate = info.mate_in if self.analysed_side == 0 or info.mate_in is None else -info.mate_in
+            shown = f"#{mate}" if mate is not None else f"{score / 100:+.2f}"
+            pygame.display.set_caption(
+                f"Chess - depth {info.depth} {shown} {' '.join(move_to_uci(move) for move in info.pv[:8])}"
+            )
+
+    def quit(self) -> None:
+        if self.analysis is not None:
+            self.analysis.close()
+        pygame.quit()
+        sys_exit(0)
 
     def start(self):
         while True:
             self.clock.tick(self.FPS)
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys_exit(0)
+                    self.quit()
                 if event.type == pygame.MOUSEBUTTONDOWN and pygame.mouse.get_pressed()[0]:
                     g_coords: Vec2 = self.window_coords_to_grid_coords(Vec2(*pygame.mouse.get_pos()))
                     if g_coords:
                         self.update_screen = True
                         self.board.handle_click(g_coords)
+                if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    self.redraw()
+                if event.type == pygame.KEYUP and event.key == pygame.K_SPACE:
+                    self.engine_move()
+                if event.type == pygame.KEYUP and event.key == pygame.K_a:
+                    self.toggle_analysis()
 
+            self.update_analysis()
             self.draw()
 
 
 if __name__ == "__main__":
-    chess = Chess()
+    import instrumentation
+    start_time = time.perf_counter()
+    # Off unless NTCHESS_PROFILE is set, see instrumentation.py
+    instrumentation.enable_from_environment()
+    chess = Chess(argv[argv.index("--book") + 1] if "--book" in argv[:-1] else None, "--analyse" in argv)
+    if "--startup-time" in argv:
+        # Time from here to the first frame on screen, run twice to see the cached startup
+        chess.draw()
+        print(f"Startup took {(time.perf_counter() - start_time) * 1000:.1f}ms")
+        sys_exit(0)
     chess.start()
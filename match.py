@@ -0,0 +1,344 @@
+# Self-play Matches
+# Nischay Bharadwaj (N-tronics)
+
+import os
+import math
+import time
+import importlib
+import multiprocessing as mp
+from dataclasses import dataclass, field
+import game
+from bitboard import BitBoard, WHITE, KNIGHT, BISHOP, KING
+from movegen import in_check
+from search import SearchLimits
+from typing import *
+
+# Games still going after this many plies are scored as draws
+MAX_PLIES = 400
+
+
+@dataclass
+class EngineConfig:
+    name: str
+    # "module:Class" of the searcher, any class with the interface of search.Searcher
+    searcher: str = "search:Searcher"
+    hash_mb: float = 16
+    # Fixed limits per move, used instead of the time control when set
+    depth: int | None = None
+    nodes: int | None = None
+
+    @staticmethod
+    def parse(spec: str) -> "EngineConfig":
+        """
+        Parses "name=new,searcher=my_search:Searcher,hash_mb=32,depth=6"
+        :param spec: Comma separated key=value pairs, name is required
+        :return: EngineConfig
+        """
+        values: Dict[str, Any] = dict(pair.split("=", 1) for pair in spec.split(",") if pair)
+        for key, cast in (("hash_mb", float), ("depth", int), ("nodes", int)):
+            if key in values:
+                values[key] = cast(values[key])
+        return EngineConfig(**values)
+
+    def create(self) -> Any:
+        module, class_name = self.searcher.split(":")
+        return getattr(importlib.import_module(module), class_name)(tt_size_mb=self.hash_mb)
+
+
+@dataclass
+class TimeControl:
+    # Seconds on the clock at the start and added after every move
+    base: float = 10.0
+    increment: float = 0.1
+
+    @staticmethod
+    def parse(spec: str) -> "TimeControl":
+        """
+        Parses "base+increment" in seconds, e.g. "10+0.1"
+        :param spec: Time control
+        :return: TimeControl
+        """
+        base, _, increment = spec.partition("+")
+        return TimeControl(float(base), float(increment or 0))
+
+    def budget(self, time_left: float) -> float:
+        """
+        Time to spend on a move, the same split as the UCI engine uses
+        :param time_left: Seconds left on the clock
+        :return: Seconds
+        """
+        return max(min(time_left / 30 + self.increment * 0.8, time_left * 0.5 - 0.05), 0.01)
+
+
+@dataclass
+class GameResult:
+    index: int
+    opening: str
+    white: str
+    black: str
+    # "1-0", "0-1" or "1/2-1/2"
+    result: str
+    reason: str
+    moves: List[int] = field(default_factory=list)
+    nodes: int = 0
+    seconds: float = 0.0
+
+
+def insufficient_material(bb: BitBoard) -> bool:
+    """
+    Checks whether neither side can mate: bare kings, a single minor piece, or bishops all on one square color
+    :param bb: Position
+    :return: bool
+    """
+    minors = 0
+    bishops = 0
+    for code in range(12):
+        if code % 6 == KING or not bb.pieces[code]:
+            continue
+        if code % 6 not in (KNIGHT, BISHOP):
+            return False
+        minors += bin(bb.pieces[code]).count("1")
+        if code % 6 == BISHOP:
+            bishops |= bb.pieces[code]
+    if minors <= 1:
+        return True
+    # Bishops that all stay on one square color can't force mate
+    light = 0xAA55AA55AA55AA55
+    return bin(bishops).count("1") == minors and (not bishops & light or not bishops & ~light)
+
+
+def game_over(bb: BitBoard, legal_moves: List[int]) -> Tuple[str, str] | None:
+    """
+    Checks the rules that end a game
+    :param bb: Position
+    :param legal_moves: Legal moves of the position
+    :return: (result, reason), or None if the game goes on
+    """
+    if not legal_moves:
+        if in_check(bb):
+            return ("0-1" if bb.side == WHITE else "1-0"), "checkmate"
+        return "1/2-1/2", "stalemate"
+    if bb.halfmove >= 100:
+        return "1/2-1/2", "fifty move rule"
+    history = bb.key_history
+    if sum(1 for i in range(len(history) - 2, max(len(history) - bb.halfmove, 0) - 1, -2)
+           if history[i] == bb.key) >= 2:
+        return "1/2-1/2", "threefold repetition"
+    if insufficient_material(bb):
+        return "1/2-1/2", "insufficient material"
+    return None
+
+
+def play_game(job: Tuple[int, str, EngineConfig, EngineConfig, TimeControl]) -> GameResult:
+    """
+    Plays one game between two engines
+    :param job: (game index, opening FEN, white, black, time control)
+    :return: GameResult
+    """
+    index, opening, white, black, time_control = job
+    engine = game.ChessEngine(False)
+    engine.load_fen(opening)
+    searchers = [white.create(), black.create()]
+    configs = [white, black]
+    clocks = [time_control.base, time_control.base]
+    result = GameResult(index, opening, white.name, black.name, "1/2-1/2", "move limit")
+    start = time.perf_counter()
+    for _ in range(MAX_PLIES):
+        ended = game_over(engine.bitboard, engine.legal_moves())
+        if ended is not None:
+            result.result, result.reason = ended
+            break
+        side = engine.bitboard.side
+        config = configs[side]
+        if config.depth is not None or config.nodes is not None:
+            limits = SearchLimits(depth=config.depth, nodes=config.nodes)
+        else:
+            limits = SearchLimits(movetime=time_control.budget(clocks[side]))
+        move_start = time.perf_counter()
+        info = searchers[side].search(engine.bitboard, limits)
+        if limits.movetime is not None:
+            clocks[side] -= time.perf_counter() - move_start
+            if clocks[side] < 0:
+                result.result, result.reason = ("0-1" if side == WHITE else "1-0"), "time forfeit"
+                break
+            clocks[side] += time_control.increment
+        result.nodes += info.nodes
+        if not info.pv:
+            result.result, result.reason = ("0-1" if side == WHITE else "1-0"), "no move"
+            break
+        engine.make_move(info.pv[0])
+        result.moves.append(info.pv[0])
+    result.seconds = time.perf_counter() - start
+    for searcher in searchers:
+        if hasattr(searcher, "close"):
+            searcher.close()
+    return result
+
+
+@dataclass
+class MatchStats:
+    wins: int = 0
+    draws: int = 0
+    losses: int = 0
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    @property
+    def score(self) -> float:
+        return (self.wins + self.draws / 2) / self.games if self.games else 0.5
+
+    def variance(self) -> float:
+        mean = self.score
+        if not self.games:
+            return 0.0
+        return (self.wins * (1 - mean) ** 2 + self.draws * (0.5 - mean) ** 2 + self.losses * mean ** 2) / self.games
+
+    def elo(self) -> Tuple[float, float]:
+        """
+        Elo difference of the first engine and its 95% error margin
+        :return: (elo, margin)
+        """
+        score = min(max(self.score, 1e-6), 1 - 1e-6)
+        elo = -400 * math.log10(1 / score - 1)
+        if not self.games:
+            return elo, math.inf
+        deviation = math.sqrt(self.variance() / self.games)
+        high = min(score + 1.96 * deviation, 1 - 1e-6)
+        low = max(score - 1.96 * deviation, 1e-6)
+        return elo, (-400 * math.log10(1 / high - 1) + 400 * math.log10(1 / low - 1)) / 2
+
+    def llr(self, elo0: float, elo1: float) -> float:
+        """
+        Log likelihood ratio of H1 (elo1) against H0 (elo0), using the normal approximation of the score
+        :param elo0: Elo difference of the null hypothesis
+        :param elo1: Elo difference of the alternative
+        :return: float
+        """
+        variance = self.variance()
+        if not self.games or variance == 0:
+            return 0.0
+        s0 = 1 / (1 + 10 ** (-elo0 / 400))
+        s1 = 1 / (1 + 10 ** (-elo1 / 400))
+        return self.games * (s1 - s0) * (2 * self.score - s0 - s1) / (2 * variance)
+
+
+def sprt_bounds(alpha: float, beta: float) -> Tuple[float, float]:
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def read_openings(path: str | None) -> List[str]:
+    """
+    Reads opening positions, one FEN or EPD line each. Every one is checked by loading it
+    :param path: File of positions, the start position only if None
+    :return: List of FENs
+    """
+    if path is None:
+        return [game.start_fen]
+    from batch import read_fens
+    engine = game.ChessEngine(False)
+    openings = []
+    for fen, _ in read_fens(path):
+        engine.load_fen(fen)
+        openings.append(engine.generate_fen())
+    return openings
+
+
+def run_match(first: EngineConfig, second: EngineConfig, openings: List[str], games: int,
+              time_control: TimeControl, workers: int | None = None, sprt: Tuple[float, float] | None = None,
+              alpha: float = 0.05, beta: float = 0.05,
+              on_result: Callable[[GameResult, MatchStats], None] | None = None) -> Tuple[MatchStats, List[GameResult]]:
+    """
+    Plays a match across a process pool. Every opening is played twice with colors swapped
+    :param first: Engine the statistics are for
+    :param second: Its opponent
+    :param openings: Start positions, cycled through
+    :param games: Number of games, at most
+    :param time_control: Clock of both engines, unless an engine has fixed limits
+    :param workers: Number of games played at once, defaults to the CPU count
+    :param sprt: (elo0, elo1) to stop as soon as the sequential probability ratio test accepts either
+    :param alpha: False positive rate of the SPRT
+    :param beta: False negative rate of the SPRT
+    :param on_result: Called with every game and the running statistics as games finish
+    :return: (MatchStats, games in the order they finished)
+    """
+    def jobs() -> Generator[Tuple[int, str, EngineConfig, EngineConfig, TimeControl], None, None]:
+        for i in range(games):
+            opening = openings[(i // 2) % len(openings)]
+            yield (i, opening, first, second, time_control) if i % 2 == 0 else (i, opening, second, first, time_control)
+
+    stats = MatchStats()
+    results = []
+    lower, upper = sprt_bounds(alpha, beta)
+    with mp.Pool(workers or os.cpu_count()) as pool:
+        for result in pool.imap_unordered(play_game, jobs()):
+            results.append(result)
+            if result.result == "1/2-1/2":
+                stats.draws += 1
+            elif (result.result == "1-0") == (result.white == first.name):
+                stats.wins += 1
+            else:
+                stats.losses += 1
+            if on_result is not None:
+                on_result(result, stats)
+            if sprt is not None and not lower < stats.llr(*sprt) < upper:
+                # Leaving the pool terminates the games still running
+                break
+    return stats, results
+
+
+if __name__ == "__main__":
+    import argparse
+    import pgn
+
+    parser = argparse.ArgumentParser(description="Play engine against engine in parallel and measure the Elo "
+                                                 "difference")
+    parser.add_argument("--engine1", default="name=new", help="engine the results are for, as name=...,searcher="
+                                                              "module:Class,hash_mb=...,depth=...,nodes=...")
+    parser.add_argument("--engine2", default="name=base", help="opponent, same format")
+    parser.add_argument("--openings", help="file of opening FENs or EPD lines")
+    parser.add_argument("--games", type=int, default=100, help="number of games")
+    parser.add_argument("--tc", default="10+0.1", help="time control, base+increment in seconds")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="games played at once")
+    parser.add_argument("--sprt", nargs=2, type=float, metavar=("ELO0", "ELO1"), help="stop early by SPRT")
+    parser.add_argument("--alpha", type=float, default=0.05, help="false positive rate of the SPRT")
+    parser.add_argument("--beta", type=float, default=0.05, help="false negative rate of the SPRT")
+    parser.add_argument("--pgn", help="write the games to a PGN file")
+    args = parser.parse_args()
+
+    first, second = EngineConfig.parse(args.engine1), EngineConfig.parse(args.engine2)
+    if first.name == second.name:
+        parser.error("the engines need different names")
+
+    def report(result: GameResult, stats: MatchStats) -> None:
+        elo, margin = stats.elo()
+        line = f"game {result.index + 1:>4}: {result.white} - {result.black} {result.result} ({result.reason})  " \
+               f"+{stats.wins} ={stats.draws} -{stats.losses}  elo {elo:+.1f} +/- {margin:.1f}"
+        if args.sprt:
+            line += f"  llr {stats.llr(*args.sprt):.2f}"
+        print(line, flush=True)
+
+    start = time.perf_counter()
+    match_stats, finished = run_match(first, second, read_openings(args.openings), args.games,
+                                      TimeControl.parse(args.tc), args.workers, tuple(args.sprt) if args.sprt else None,
+                                      args.alpha, args.beta, on_result=report)
+    elo, margin = match_stats.elo()
+    print(f"\n{first.name} vs {second.name}: {match_stats.games} games in {time.perf_counter() - start:.1f}s, "
+          f"score {match_stats.score:.3f}, elo {elo:+.1f} +/- {margin:.1f}")
+    if args.sprt:
+        llr = match_stats.llr(*args.sprt)
+        lower_bound, upper_bound = sprt_bounds(args.alpha, args.beta)
+        verdict = "H1 accepted" if llr >= upper_bound else ("H0 accepted" if llr <= lower_bound else "inconclusive")
+        print(f"SPRT [{args.sprt[0]}, {args.sprt[1]}]: llr {llr:.2f} ({lower_bound:.2f}, {upper_bound:.2f}), {verdict}")
+    if args.pgn:
+        # Engines with fixed depth or nodes ignore the clock, a match of only those has no time control
+        fixed = [config.depth is not None or config.nodes is not None for config in (first, second)]
+        time_control = "-" if all(fixed) else args.tc
+        pgn.write_games((
+            pgn.game_from_moves(result.moves, result.opening, {
+                "Event": f"{first.name} vs {second.name}", "Round": str(result.index + 1),
+                "White": result.white, "Black": result.black, "Termination": result.reason,
+                "TimeControl": time_control
+            }, result.result) for result in sorted(finished, key=lambda result: result.index)
+        ), args.pgn)
@@ -0,0 +1,79 @@
+# Legal Move Cache
+# Nischay Bharadwaj (N-tronics)
+
+from collections import OrderedDict
+from bitboard import BitBoard
+from movegen import generate_legal_moves
+from typing import *
+
+# Positions kept by default, a few hundred bytes each
+MOVE_CACHE_SIZE = 4096
+
+
+class MoveSet:
+    __slots__ = ("moves", "by_square", "targets")
+
+    def __init__(self, moves: List[int]):
+        """
+        Legal moves of a position, indexed by the square they move from
+        :param moves: Legal moves, see moves.py for the encoding
+        """
+        self.moves = moves
+        self.by_square: Dict[int, List[int]] = {}
+        # Bitboard of the squares each from-square can move to
+        self.targets: Dict[int, int] = {}
+        for move in moves:
+            frm = move & 63
+            self.by_square.setdefault(frm, []).append(move)
+            self.targets[frm] = self.targets.get(frm, 0) | 1 << ((move >> 6) & 63)
+
+    def moves_from(self, sq: int) -> List[int]:
+        return self.by_square.get(sq, [])
+
+    def find(self, frm: int, to: int) -> int | None:
+        """
+        Looks up the move between two squares, the queen promotion if there are several
+        :param frm: From square
+        :param to: To square
+        :return: Move, or None if it isn't legal
+        """
+        for move in self.by_square.get(frm, ()):
+            if (move >> 6) & 63 == to:
+                return move
+        return None
+
+
+class MoveCache:
+    def __init__(self, size: int = MOVE_CACHE_SIZE):
+        """
+        Legal moves of recently seen positions by Zobrist key, least recently used ones are dropped beyond size
+        :param size: Maximum number of positions kept
+        """
+        self.size = size
+        self.entries: OrderedDict[int, MoveSet] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, bb: BitBoard) -> MoveSet:
+        """
+        Returns the legal moves of a position, generating them on the first request
+        :param bb: Position
+        :return: MoveSet, shared between callers and not to be modified
+        """
+        entry = self.entries.get(bb.key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(bb.key)
+            return entry
+        self.misses += 1
+        entry = self.entries[bb.key] = MoveSet(generate_legal_moves(bb))
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,574 @@
+# Legal Move Generation
+# Nischay Bharadwaj (N-tronics)
+
+from array import array
+from bitboard import *
+from attacks import *
+from moves import *
+from zobrist import PIECE_KEYS, CASTLING_KEYS, EP_KEYS, SIDE_KEY
+from typing import *
+
+# Castling rights that survive a move from or to a square, so moving a king or rook (or capturing one) clears them
+CASTLING_MASK: List[int] = [15] * 64
+CASTLING_MASK[0] &= ~BLACK_QUEENSIDE
+CASTLING_MASK[4] &= ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASK[7] &= ~BLACK_KINGSIDE
+CASTLING_MASK[56] &= ~WHITE_QUEENSIDE
+CASTLING_MASK[60] &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[63] &= ~WHITE_KINGSIDE
+
+# Rook from and to squares of a castling move, indexed by the king's destination square
+CASTLING_ROOK: Dict[int, Tuple[int, int]] = {62: (63, 61), 58: (56, 59), 6: (7, 5), 2: (0, 3)}
+
+
+def attackers_to(bb: BitBoard, sq: int, occupied: int) -> int:
+    """
+    Returns all pieces of both colors attacking a square
+    :param bb: Position
+    :param sq: Square index
+    :param occupied: Occupancy to use for sliding attacks
+    :return: Bitboard of attackers
+    """
+    p = bb.pieces
+    return (
+        (PAWN_ATTACKS[BLACK][sq] & p[PAWN])
+        | (PAWN_ATTACKS[WHITE][sq] & p[6 + PAWN])
+        | (KNIGHT_ATTACKS[sq] & (p[KNIGHT] | p[6 + KNIGHT]))
+        | (KING_ATTACKS[sq] & (p[KING] | p[6 + KING]))
+        | (rook_attacks(sq, occupied) & (p[ROOK] | p[QUEEN] | p[6 + ROOK] | p[6 + QUEEN]))
+        | (bishop_attacks(sq, occupied) & (p[BISHOP] | p[QUEEN] | p[6 + BISHOP] | p[6 + QUEEN]))
+    )
+
+
+def is_square_attacked(bb: BitBoard, sq: int, by: int, occupied: int | None = None) -> bool:
+    """
+    Checks whether a square is attacked by a color
+    :param bb: Position
+    :param sq: Square index
+    :param by: Attacking color
+    :param occupied: Occupancy to use for sliding attacks, defaults to the current one
+    :return: bool
+    """
+    if occupied is None:
+        occupied = bb.occupied
+    p = bb.pieces
+    base = by * 6
+    if PAWN_ATTACKS[by ^ 1][sq] & p[base + PAWN] or KNIGHT_ATTACKS[sq] & p[base + KNIGHT] \
+            or KING_ATTACKS[sq] & p[base + KING]:
+        return True
+    if ROOK_TABLE[sq][occupied & ROOK_MASKS[sq]] & (p[base + ROOK] | p[base + QUEEN]):
+        return True
+    return bool(BISHOP_TABLE[sq][occupied & BISHOP_MASKS[sq]] & (p[base + BISHOP] | p[base + QUEEN]))
+
+
+def slider_blockers(bb: BitBoard, sq: int, by: int) -> int:
+    """
+    Returns the pieces of either color that are the only piece between a square and a slider of a color aiming at it.
+    With the king's square and the enemy's sliders these are the pinned pieces and, among the enemy's own pieces,
+    the ones that can give discovered check
+    :param bb: Position
+    :param sq: Square index, usually a king's
+    :param by: Color of the sliders
+    :return: Bitboard of blockers
+    """
+    p = bb.pieces
+    base = by * 6
+    occupied = bb.occupied
+    # Sliders that would attack the square on an empty board, narrowed down to those with one piece in between
+    snipers = (
+        (ROOK_TABLE[sq][0] & (p[base + ROOK] | p[base + QUEEN]))
+        | (BISHOP_TABLE[sq][0] & (p[base + BISHOP] | p[base + QUEEN]))
+    )
+    blockers = 0
+    while snipers:
+        lsb = snipers & -snipers
+        snipers ^= lsb
+        between = BETWEEN[sq][lsb.bit_length() - 1] & occupied
+        if between and not between & (between - 1):
+            blockers |= between
+    return blockers
+
+
+def king_square(bb: BitBoard, color: int) -> int:
+    """
+    Returns the square of a color's king, or EMPTY if it has none
+    :param bb: Position
+    :param color: WHITE or BLACK
+    :return: int
+    """
+    return bb.pieces[color * 6 + KING].bit_length() - 1
+
+
+def in_check(bb: BitBoard) -> bool:
+    ksq = king_square(bb, bb.side)
+    return ksq != EMPTY and is_square_attacked(bb, ksq, bb.side ^ 1)
+
+
+def _add_pawn_moves(moves: List[int], frm: int, targets: int, flag: int, promoting: bool) -> None:
+    while targets:
+        lsb = targets & -targets
+        to = lsb.bit_length() - 1
+        targets ^= lsb
+        if promoting:
+            base = frm | to << 6 | (PROMOTION | flag) << 12
+            moves.append(base | 3 << 12)
+            moves.append(base | 2 << 12)
+            moves.append(base | 1 << 12)
+            moves.append(base)
+        else:
+            moves.append(frm | to << 6 | flag << 12)
+
+
+def generate_legal_moves(bb: BitBoard) -> List[int]:
+    """
+    Generates all legal moves of the side to move
+    Pins and checks are worked out up front so no move has to be made to test its legality
+    :param bb: Position
+    :return: List of moves
+    """
+    moves: List[int] = []
+    append = moves.append
+    us = bb.side
+    them = us ^ 1
+    p = bb.pieces
+    base = us * 6
+    own = bb.occupancy[us]
+    enemy = bb.occupancy[them]
+    occupied = bb.occupied
+    ksq = p[base + KING].bit_length() - 1
+
+    checkers = 0
+    pinned = 0
+    if ksq != EMPTY:
+        checkers = attackers_to(bb, ksq, occupied) & enemy
+        # Enemy sliders that would attack the king if our pieces were out of the way
+        snipers = (
+            (ROOK_TABLE[ksq][enemy & ROOK_MASKS[ksq]] & (p[6 * them + ROOK] | p[6 * them + QUEEN]))
+            | (BISHOP_TABLE[ksq][enemy & BISHOP_MASKS[ksq]] & (p[6 * them + BISHOP] | p[6 * them + QUEEN]))
+        )
+        while snipers:
+            lsb = snipers & -snipers
+            snipers ^= lsb
+            blockers = BETWEEN[ksq][lsb.bit_length() - 1] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pinned |= blockers
+
+        # King moves, testing each target with the king lifted off the board so it can't hide behind itself
+        without_king = occupied ^ (1 << ksq)
+        targets = KING_ATTACKS[ksq] & ~own
+        while targets:
+            lsb = targets & -targets
+            targets ^= lsb
+            to = lsb.bit_length() - 1
+            if not is_square_attacked(bb, to, them, without_king):
+                append(ksq | to << 6 | (CAPTURE if lsb & enemy else QUIET) << 12)
+
+        # In double check only the king can move
+        if checkers & (checkers - 1):
+            return moves
+
+    if checkers:
+        checker = checkers.bit_length() - 1
+        target_mask = checkers | BETWEEN[ksq][checker]
+    else:
+        target_mask = FULL
+
+    # Knights, bishops, rooks and queens
+    for type_index in (KNIGHT, BISHOP, ROOK, QUEEN):
+        pieces = p[base + type_index]
+        while pieces:
+            lsb = pieces & -pieces
+            pieces ^= lsb
+            frm = lsb.bit_length() - 1
+            if type_index == KNIGHT:
+                if lsb & pinned:
+                    continue
+                targets = KNIGHT_ATTACKS[frm]
+            elif type_index == BISHOP:
+                targets = BISHOP_TABLE[frm][occupied & BISHOP_MASKS[frm]]
+            elif type_index == ROOK:
+                targets = ROOK_TABLE[frm][occupied & ROOK_MASKS[frm]]
+            else:
+                targets = ROOK_TABLE[frm][occupied & ROOK_MASKS[frm]] | BISHOP_TABLE[frm][occupied & BISHOP_MASKS[frm]]
+            targets &= ~own & target_mask
+            if lsb & pinned:
+                targets &= LINE[ksq][frm]
+            while targets:
+                tb = targets & -targets
+                targets ^= tb
+                append(frm | (tb.bit_length() - 1) << 6 | (CAPTURE if tb & enemy else QUIET) << 12)
+
+    # Pawns
+    pawns = p[base + PAWN]
+    if us == WHITE:
+        push, start_lo, start_hi, promo_lo, promo_hi = -8, 48, 55, 8, 15
+    else:
+        push, start_lo, start_hi, promo_lo, promo_hi = 8, 8, 15, 48, 55
+    while pawns:
+        lsb = pawns & -pawns
+        pawns ^= lsb
+        frm = lsb.bit_length() - 1
+        promoting = promo_lo <= frm <= promo_hi
+        line = LINE[ksq][frm] if lsb & pinned else FULL
+
+        to = frm + push
+        if not occupied & (1 << to):
+            if (1 << to) & target_mask & line:
+                _add_pawn_moves(moves, frm, 1 << to, QUIET, promoting)
+            if start_lo <= frm <= start_hi:
+                to2 = to + push
+                if not occupied & (1 << to2) and (1 << to2) & target_mask & line:
+                    append(frm | to2 << 6 | DOUBLE_PUSH << 12)
+
+        captures = PAWN_ATTACKS[us][frm]
+        if captures & enemy & target_mask & line:
+            _add_pawn_moves(moves, frm, captures & enemy & target_mask & line, CAPTURE, promoting)
+
+        if bb.ep != EMPTY and captures & (1 << bb.ep):
+            # En passant removes two pieces from the same rank, so test it directly
+            captured = bb.ep - push
+            after = occupied ^ lsb ^ (1 << captured) | (1 << bb.ep)
+            if ksq == EMPTY or not (
+                attackers_to(bb, ksq, after) & enemy & after & ~(1 << captured)
+            ):
+                append(frm | bb.ep << 6 | EP_CAPTURE << 12)
+
+    # Castling
+    if bb.castling and not checkers and ksq != EMPTY:
+        if us == WHITE:
+            if bb.castling & WHITE_KINGSIDE and not occupied & 0x6000000000000000 \
+                    and not is_square_attacked(bb, 61, them) and not is_square_attacked(bb, 62, them):
+                append(60 | 62 << 6 | KING_CASTLE << 12)
+            if bb.castling & WHITE_QUEENSIDE and not occupied & 0x0E00000000000000 \
+                    and not is_square_attacked(bb, 59, them) and not is_square_attacked(bb, 58, them):
+                append(60 | 58 << 6 | QUEEN_CASTLE << 12)
+        else:
+            if bb.castling & BLACK_KINGSIDE and not occupied & 0x60 \
+                    and not is_square_attacked(bb, 5, them) and not is_square_attacked(bb, 6, them):
+                append(4 | 6 << 6 | KING_CASTLE << 12)
+            if bb.castling & BLACK_QUEENSIDE and not occupied & 0x0E \
+                    and not is_square_attacked(bb, 3, them) and not is_square_attacked(bb, 2, them):
+                append(4 | 2 << 6 | QUEEN_CASTLE << 12)
+
+    return moves
+
+
+# Pseudo-legal moves of any position fit in this many entries of a move buffer
+MAX_MOVES = 256
+
+
+def new_move_buffer(plies: int = 1) -> array:
+    """
+    Allocates a move buffer for the staged generators, MAX_MOVES entries per ply so every ply of a search can use its
+    own slice
+    :param plies: Number of plies
+    :return: array('H') of 16 bit moves
+    """
+    return array("H", bytes(2 * MAX_MOVES * plies))
+
+
+def _write_targets(buffer: array, count: int, frm: int, targets: int, flag: int) -> int:
+    while targets:
+        lsb = targets & -targets
+        targets ^= lsb
+        buffer[count] = frm | (lsb.bit_length() - 1) << 6 | flag << 12
+        count += 1
+    return count
+
+
+def generate_captures(bb: BitBoard, buffer: array, count: int = 0) -> int:
+    """
+    First stage of staged generation: writes the pseudo-legal captures and queen promotions of the side to move
+    into a buffer. Moves may leave the own king in check, see is_legal
+    :param bb: Position
+    :param buffer: Move buffer from new_move_buffer
+    :param count: Index to start writing at
+    :return: Index after the last move written
+    """
+    us = bb.side
+    p = bb.pieces
+    base = us * 6
+    enemy = bb.occupancy[us ^ 1]
+    occupied = bb.occupied
+
+    for type_index in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+        pieces = p[base + type_index]
+        while pieces:
+            lsb = pieces & -pieces
+            pieces ^= lsb
+            frm = lsb.bit_length() - 1
+            if type_index == KNIGHT:
+                targets = KNIGHT_ATTACKS[frm]
+            elif type_index == BISHOP:
+                targets = BISHOP_TABLE[frm][occupied & BISHOP_MASKS[frm]]
+            elif type_index == ROOK:
+                targets = ROOK_TABLE[frm][occupied & ROOK_MASKS[frm]]
+            elif type_index == QUEEN:
+                targets = ROOK_TABLE[frm][occupied & ROOK_MASKS[frm]] | BISHOP_TABLE[frm][occupied & BISHOP_MASKS[frm]]
+            else:
+                targets = KING_ATTACKS[frm]
+            count = _write_targets(buffer, count, frm, targets & enemy, CAPTURE)
+
+    pawns = p[base + PAWN]
+    push, promo_lo, promo_hi = (-8, 8, 15) if us == WHITE else (8, 48, 55)
+    while pawns:
+        lsb = pawns & -pawns
+        pawns ^= lsb
+        frm = lsb.bit_length() - 1
+        captures = PAWN_ATTACKS[us][frm]
+        if promo_lo <= frm <= promo_hi:
+            targets = captures & enemy
+            while targets:
+                tb = targets & -targets
+                targets ^= tb
+                move = frm | (tb.bit_length() - 1) << 6 | PROMOTION_CAPTURE << 12
+                for promotion in (3, 2, 1, 0):
+                    buffer[count] = move | promotion << 12
+                    count += 1
+            if not occupied >> (frm + push) & 1:
+                buffer[count] = frm | (frm + push) << 6 | (PROMOTION | 3) << 12
+                count += 1
+        else:
+            count = _write_targets(buffer, count, frm, captures & enemy, CAPTURE)
+        if bb.ep != EMPTY and captures >> bb.ep & 1:
+            buffer[count] = frm | bb.ep << 6 | EP_CAPTURE << 12
+            count += 1
+    return count
+
+
+def generate_quiets(bb: BitBoard, buffer: array, count: int = 0) -> int:
+    """
+    Second stage of staged generation: writes the pseudo-legal moves generate_captures leaves out, i.e. quiet moves,
+    under-promotions without capture and castling. Castling is only written when fully legal
+    :param bb: Position
+    :param buffer: Move buffer from new_move_buffer
+    :param count: Index to start writing at
+    :return: Index after the last move written
+    """
+    us = bb.side
+    them = us ^ 1
+    p = bb.pieces
+    base = us * 6
+    empty = ~bb.occupied & FULL
+    occupied = bb.occupied
+
+    for type_index in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+        pieces = p[base + type_index]
+        while pieces:
+            lsb = pieces & -pieces
+            pieces ^= lsb
+            frm = lsb.bit_length() - 1
+            if type_index == KNIGHT:
+                targets = KNIGHT_ATTACKS[frm]
+            elif type_index == BISHOP:
+                targets = BISHOP_TABLE[frm][occupied & BISHOP_MASKS[frm]]
+            elif type_index == ROOK:
+                targets = ROOK_TABLE[frm][occupied & ROOK_MASKS[frm]]
+            elif type_index == QUEEN:
+                targets = ROOK_TABLE[frm][occupied & ROOK_MASKS[frm]] | BISHOP_TABLE[frm][occupied & BISHOP_MASKS[frm]]
+            else:
+                targets = KING_ATTACKS[frm]
+            count = _write_targets(buffer, count, frm, targets & empty, QUIET)
+
+    pawns = p[base + PAWN]
+    push, start_lo, start_hi, promo_lo, promo_hi = (-8, 48, 55, 8, 15) if us == WHITE else (8, 8, 15, 48, 55)
+    while pawns:
+        lsb = pawns & -pawns
+        pawns ^= lsb
+        frm = lsb.bit_length() - 1
+        to = frm + push
+        if occupied >> to & 1:
+            continue
+        if promo_lo <= frm <= promo_hi:
+            for promotion in (2, 1, 0):
+                buffer[count] = frm | to << 6 | (PROMOTION | promotion) << 12
+                count += 1
+            continue
+        buffer[count] = frm | to << 6
+        count += 1
+        if start_lo <= frm <= start_hi and not occupied >> (to + push) & 1:
+            buffer[count] = frm | (to + push) << 6 | DOUBLE_PUSH << 12
+            count += 1
+
+    if bb.castling and not in_check(bb):
+        for right, ksq, to, path, crossed in _CASTLES[us]:
+            if bb.castling & right and not occupied & path and not is_square_attacked(bb, crossed, them) \
+                    and not is_square_attacked(bb, to, them):
+                buffer[count] = ksq | to << 6 | (KING_CASTLE if to > ksq else QUEEN_CASTLE) << 12
+                count += 1
+    return count
+
+
+# Castling right, king square, king destination, squares that must be empty and the square the king crosses
+_CASTLES: List[List[Tuple[int, int, int, int, int]]] = [
+    [(WHITE_KINGSIDE, 60, 62, 0x6000000000000000, 61), (WHITE_QUEENSIDE, 60, 58, 0x0E00000000000000, 59)],
+    [(BLACK_KINGSIDE, 4, 6, 0x60, 5), (BLACK_QUEENSIDE, 4, 2, 0x0E, 3)]
+]
+
+
+def is_legal(bb: BitBoard, move: int) -> bool:
+    """
+    Checks that a pseudo-legal move doesn't leave the own king in check. Searches that play the move anyway can
+    instead test leaves_king_in_check after make_move and save the second make
+    :param bb: Position
+    :param move: Move from generate_captures or generate_quiets
+    :return: bool
+    """
+    undo = make_move(bb, move)
+    legal = not leaves_king_in_check(bb)
+    unmake_move(bb, move, undo)
+    return legal
+
+
+def leaves_king_in_check(bb: BitBoard) -> bool:
+    """
+    Checks whether the side that just moved left its king in check
+    :param bb: Position after the move
+    :return: bool
+    """
+    ksq = bb.pieces[(bb.side ^ 1) * 6 + KING].bit_length() - 1
+    return ksq != EMPTY and is_square_attacked(bb, ksq, bb.side)
+
+
+def make_move(bb: BitBoard, move: int) -> int:
+    """
+    Plays a move on a position in place, touching only the squares the move changes
+    :param bb: Position
+    :param move: Legal move to play
+    :return: Undo information for unmake_move
+    """
+    frm = move & 63
+    to = (move >> 6) & 63
+    flag = move >> 12
+    mailbox = bb.mailbox
+    pieces = bb.pieces
+    occupancy = bb.occupancy
+    us = bb.side
+    code = mailbox[frm]
+    from_bit = 1 << frm
+    to_bit = 1 << to
+    bb.key_history.append(bb.key)
+    key = bb.key ^ SIDE_KEY ^ CASTLING_KEYS[bb.castling]
+    if bb.ep != EMPTY:
+        key ^= EP_KEYS[bb.ep & 7]
+
+    # Undo information packed into one int: halfmove << 15 | (ep + 1) << 8 | castling << 4 | (captured + 1)
+    captured = EMPTY
+    if flag & CAPTURE:
+        cap_sq = to if flag != EP_CAPTURE else (to + 8 if us == WHITE else to - 8)
+        captured = mailbox[cap_sq]
+        cap_bit = 1 << cap_sq
+        pieces[captured] ^= cap_bit
+        occupancy[us ^ 1] ^= cap_bit
+        bb.occupied ^= cap_bit
+        mailbox[cap_sq] = EMPTY
+        key ^= PIECE_KEYS[captured][cap_sq]
+    undo = bb.halfmove << 15 | (bb.ep + 1) << 8 | bb.castling << 4 | (captured + 1)
+
+    placed = us * 6 + (flag & 3) + 1 if flag & PROMOTION else code
+    pieces[code] ^= from_bit
+    pieces[placed] |= to_bit
+    occupancy[us] ^= from_bit | to_bit
+    bb.occupied ^= from_bit
+    bb.occupied |= to_bit
+    mailbox[frm] = EMPTY
+    mailbox[to] = placed
+    key ^= PIECE_KEYS[code][frm] ^ PIECE_KEYS[placed][to]
+
+    if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+        rook_from, rook_to = CASTLING_ROOK[to]
+        rook = mailbox[rook_from]
+        rook_bits = (1 << rook_from) | (1 << rook_to)
+        pieces[rook] ^= rook_bits
+        occupancy[us] ^= rook_bits
+        bb.occupied ^= rook_bits
+        mailbox[rook_from] = EMPTY
+        mailbox[rook_to] = rook
+        key ^= PIECE_KEYS[rook][rook_from] ^ PIECE_KEYS[rook][rook_to]
+
+    bb.castling &= CASTLING_MASK[frm] & CASTLING_MASK[to]
+    key ^= CASTLING_KEYS[bb.castling]
+    if flag == DOUBLE_PUSH:
+        bb.ep = (frm + to) >> 1
+        key ^= EP_KEYS[frm & 7]
+    else:
+        bb.ep = EMPTY
+    bb.key = key
+    bb.halfmove = 0 if captured != EMPTY or code % 6 == PAWN else bb.halfmove + 1
+    if us == BLACK:
+        bb.fullmove += 1
+    bb.side = us ^ 1
+    return undo
+
+
+def unmake_move(bb: BitBoard, move: int, undo: int) -> None:
+    """
+    Takes back a move played with make_move
+    :param bb: Position the move was played on
+    :param move: Move to take back
+    :param undo: Undo information returned by make_move
+    :return: None
+    """
+    frm = move & 63
+    to = (move >> 6) & 63
+    flag = move >> 12
+    mailbox = bb.mailbox
+    pieces = bb.pieces
+    occupancy = bb.occupancy
+    us = bb.side ^ 1
+    placed = mailbox[to]
+    code = us * 6 + PAWN if flag & PROMOTION else placed
+    from_bit = 1 << frm
+    to_bit = 1 << to
+
+    pieces[placed] ^= to_bit
+    pieces[code] |= from_bit
+    occupancy[us] ^= from_bit | to_bit
+    bb.occupied ^= to_bit
+    bb.occupied |= from_bit
+    mailbox[to] = EMPTY
+    mailbox[frm] = code
+
+    captured = (undo & 15) - 1
+    if captured != EMPTY:
+        cap_sq = to if flag != EP_CAPTURE else (to + 8 if us == WHITE else to - 8)
+        cap_bit = 1 << cap_sq
+        pieces[captured] |= cap_bit
+        occupancy[us ^ 1] |= cap_bit
+        bb.occupied |= cap_bit
+        mailbox[cap_sq] = captured
+    elif flag == KING_CASTLE or flag == QUEEN_CASTLE:
+        rook_from, rook_to = CASTLING_ROOK[to]
+        rook = mailbox[rook_to]
+        rook_bits = (1 << rook_from) | (1 << rook_to)
+        pieces[rook] ^= rook_bits
+        occupancy[us] ^= rook_bits
+        bb.occupied ^= rook_bits
+        mailbox[rook_to] = EMPTY
+        mailbox[rook_from] = rook
+
+    bb.castling = undo >> 4 & 15
+    bb.ep = (undo >> 8 & 127) - 1
+    bb.halfmove = undo >> 15
+    if us == BLACK:
+        bb.fullmove -= 1
+    bb.side = us
+    bb.key = bb.key_history.pop()
+
+
+def perft(bb: BitBoard, depth: int) -> int:
+    """
+    Counts the leaf nodes of the legal move tree to a given depth
+    :param bb: Position
+    :param depth: Depth in plies
+    :return: Number of leaf nodes
+    """
+    moves = generate_legal_moves(bb)
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        undo = make_move(bb, move)
+        nodes += perft(bb, depth - 1)
+        unmake_move(bb, move, undo)
+    return nodes
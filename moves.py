@@ -0,0 +1,84 @@
+# Move Encoding
+# Nischay Bharadwaj (N-tronics)
+
+from bitboard import square_name, parse_square
+from typing import *
+
+# A move is a 16 bit int: from square (6 bits) | to square (6 bits) << 6 | flag (4 bits) << 12
+QUIET = 0
+DOUBLE_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EP_CAPTURE = 5
+# Promotion flags carry the promoted piece type (KNIGHT..QUEEN) in their low 2 bits, + CAPTURE for captures
+PROMOTION = 8
+PROMOTION_CAPTURE = 12
+
+NULL_MOVE = 0
+PROMOTION_CHARS = "nbrq"
+
+
+def encode_move(frm: int, to: int, flag: int = QUIET) -> int:
+    return frm | to << 6 | flag << 12
+
+
+def move_from(move: int) -> int:
+    return move & 63
+
+
+def move_to(move: int) -> int:
+    return (move >> 6) & 63
+
+
+def move_flag(move: int) -> int:
+    return move >> 12
+
+
+def is_capture(move: int) -> bool:
+    return bool(move >> 12 & CAPTURE)
+
+
+def is_promotion(move: int) -> bool:
+    return bool(move >> 12 & PROMOTION)
+
+
+def promotion_type(move: int) -> int:
+    """
+    Returns the type index (bitboard.KNIGHT..bitboard.QUEEN) a move promotes to
+    :param move: Promotion move
+    :return: int
+    """
+    return (move >> 12 & 3) + 1
+
+
+def move_to_uci(move: int) -> str:
+    """
+    Converts a move to its UCI long algebraic notation, e.g. "e2e4" or "e7e8q"
+    :param move: Move
+    :return: str
+    """
+    if move == NULL_MOVE:
+        return "0000"
+    uci = square_name(move & 63) + square_name((move >> 6) & 63)
+    if move >> 12 & PROMOTION:
+        uci += PROMOTION_CHARS[move >> 12 & 3]
+    return uci
+
+
+def match_uci(uci: str, moves: Iterable[int]) -> int | None:
+    """
+    Finds the move matching a UCI string among a list of moves
+    :param uci: UCI move string
+    :param moves: Candidate moves, usually the legal moves of the position
+    :return: Matching move or None
+    """
+    frm, to = parse_square(uci[0:2]), parse_square(uci[2:4])
+    promotion = PROMOTION_CHARS.index(uci[4]) if len(uci) > 4 else -1
+    for move in moves:
+        if move & 63 == frm and (move >> 6) & 63 == to:
+            if promotion == -1 and not move >> 12 & PROMOTION:
+                return move
+            if promotion != -1 and move >> 12 & PROMOTION and move >> 12 & 3 == promotion:
+                return move
+    return None
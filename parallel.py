@@ -0,0 +1,211 @@
+# Parallel Search
+# Nischay Bharadwaj (N-tronics)
+
+import os
+import time
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from bitboard import BitBoard
+from moves import move_to_uci
+from search import Searcher, SearchLimits, SearchInfo
+from transposition import TranspositionTable, table_entries, ENTRY_BYTES
+from typing import *
+
+# Seconds between checks that the helpers a search waits on are still alive
+RESULT_POLL = 0.5
+
+
+class _CountingSearcher(Searcher):
+    def __init__(self, tt: TranspositionTable, counters: memoryview, worker: int):
+        """
+        Searcher that publishes its node count in shared memory so the main process can report total nps
+        :param tt: Shared transposition table
+        :param counters: Shared array of one node counter per worker
+        :param worker: Index of this worker's counter
+        """
+        super().__init__(tt)
+        self.counters = counters
+        self.worker = worker
+
+    def check_limits(self) -> None:
+        self.counters[self.worker] = self.nodes
+        super().check_limits()
+
+
+def _helper_main(worker: int, shm_name: str, tt_size_mb: float, workers: int, jobs: mp.Queue, results: mp.Queue,
+                 stop_event: mp.Event) -> None:
+    """
+    Helper process loop: searches every position it is sent on the shared table until told to stop
+    :param worker: Worker index, 0 is the main process
+    :param shm_name: Name of the shared memory block holding the table and node counters
+    :param tt_size_mb: Size of the table
+    :param workers: Total number of workers
+    :param jobs: Queue of (BitBoard, SearchLimits) jobs, None to exit
+    :param results: Queue to put (worker, SearchInfo) on after each search
+    :param stop_event: Set by the main process when its search is done
+    :return: None
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    table_bytes = table_entries(tt_size_mb) * ENTRY_BYTES
+    tt = TranspositionTable(tt_size_mb, buffer=shm.buf)
+    counters = shm.buf[table_bytes:table_bytes + workers * 8].cast("Q")
+    searcher = _CountingSearcher(tt, counters, worker)
+    searcher.stop_event = stop_event
+    # Half the helpers skip the first iteration, so they are a ply ahead of the others and fill the table for them
+    searcher.start_depth = 1 + worker % 2
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        bb, limits = job
+        results.put((worker, searcher.search(bb, limits)))
+
+    tt.keys.release()
+    tt.data.release()
+    counters.release()
+    shm.close()
+
+
+class ParallelSearcher:
+    def __init__(self, workers: int | None = None, tt_size_mb: float = 64):
+        """
+        Lazy SMP search: every worker process searches the same position on one transposition table in shared memory.
+        Helpers mostly fill the table for each other and the main search, which decides when to stop.
+        :param workers: Number of searching processes including the main one, defaults to the CPU count
+        :param tt_size_mb: Size of the shared table
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.tt_size_mb = tt_size_mb
+        table_bytes = table_entries(tt_size_mb) * ENTRY_BYTES
+        self.shm = shared_memory.SharedMemory(create=True, size=table_bytes + self.workers * 8)
+        self.tt = TranspositionTable(tt_size_mb, buffer=self.shm.buf)
+        self.counters = self.shm.buf[table_bytes:table_bytes + self.workers * 8].cast("Q")
+        self.searcher = _CountingSearcher(self.tt, self.counters, 0)
+
+        self.stop_event = mp.Event()
+        self.results = mp.Queue()
+        self.jobs: List[mp.Queue] = []
+        self.processes: List[mp.Process] = []
+        for worker in range(1, self.workers):
+            jobs = mp.Queue()
+            process = mp.Process(
+                target=_helper_main,
+                args=(worker, self.shm.name, tt_size_mb, self.workers, jobs, self.results, self.stop_event),
+                daemon=True
+            )
+            process.start()
+            self.jobs.append(jobs)
+            self.processes.append(process)
+
+    @property
+    def tablebases(self) -> "Tablebases | None":
+        # Only the main search probes, helpers don't reach the root's endgame positions any sooner
+        return self.searcher.tablebases
+
+    @tablebases.setter
+    def tablebases(self, tablebases: "Tablebases | None") -> None:
+        self.searcher.tablebases = tablebases
+
+    def total_nodes(self) -> int:
+        return sum(self.counters[worker] for worker in range(self.workers))
+
+    def stop(self) -> None:
+        self.searcher.stop()
+
+    def search(self, bb: BitBoard, limits: SearchLimits | None = None,
+               on_info: Callable[[SearchInfo], None] | None = None) -> SearchInfo:
+        """
+        Searches a position on all workers, with the same interface as Searcher.search
+        Reported node counts and nps are totals over all workers
+        :param bb: Position to search
+        :param limits: Limits of the main search, helpers run until it finishes
+        :param on_info: Called with the result of every finished iteration of the main search
+        :return: Result of the deepest finished search among the workers
+        """
+        limits = limits or SearchLimits()
+        self.stop_event.clear()
+        for worker in range(self.workers):
+            self.counters[worker] = 0
+        # Helpers only share the depth limit, time and node limits are enforced by stopping them.
+        # Helpers that died are skipped, the search goes on with the rest
+        pending: Dict[int, mp.Process] = {}
+        for worker, (process, jobs) in enumerate(zip(self.processes, self.jobs), 1):
+            if process.is_alive():
+                jobs.put((bb.copy(), SearchLimits(depth=limits.depth)))
+                pending[worker] = process
+
+        def report(info: SearchInfo) -> None:
+            self.counters[0] = self.searcher.nodes
+            info.nodes = self.total_nodes()
+            on_info(info)
+
+        try:
+            best = self.searcher.search(bb, limits, report if on_info is not None else None)
+        finally:
+            self.stop_event.set()
+        self.counters[0] = self.searcher.nodes
+
+        nodes = self.searcher.nodes
+        while pending:
+            try:
+                worker, result = self.results.get(timeout=RESULT_POLL)
+            except queue.Empty:
+                # A helper that died mid-search never answers, the result is made of the ones that do
+                pending = {worker: process for worker, process in pending.items() if process.is_alive()}
+                continue
+            pending.pop(worker, None)
+            nodes += result.nodes
+            # Prefer a deeper result from a helper, it saw everything the main search did and more
+            if result.depth > best.depth and result.pv:
+                best = result
+        best.nodes = nodes
+        best.time = time.perf_counter() - self.searcher.start_time
+        return best
+
+    def close(self) -> None:
+        """
+        Stops the helper processes and frees the shared memory
+        :return: None
+        """
+        self.stop_event.set()
+        for jobs in self.jobs:
+            jobs.put(None)
+        for process in self.processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+        self.jobs.clear()
+        self.processes.clear()
+        # Views into the block have to be released before it can be closed
+        self.tt.keys.release()
+        self.tt.data.release()
+        self.counters.release()
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self) -> "ParallelSearcher":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import game
+
+    parser = argparse.ArgumentParser(description="Search a position on several processes")
+    parser.add_argument("--fen", default=game.start_fen, help="position to search")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of search processes")
+    parser.add_argument("--movetime", type=float, default=5.0, help="time limit in seconds")
+    parser.add_argument("--depth", type=int, help="maximum depth in plies")
+    parser.add_argument("--hash", type=float, default=64, help="shared transposition table size in MB")
+    args = parser.parse_args()
+
+    engine = game.ChessEngine(False)
+    engine.load_fen(args.fen)
+    with ParallelSearcher(args.workers, args.hash) as searcher:
+        result = searcher.search(engine.bitboard, SearchLimits(args.depth, args.movetime), print)
+    print(f"workers {args.workers} nodes {result.nodes} nps {result.nps}")
+    print(f"bestmove {move_to_uci(result.pv[0]) if result.pv else '0000'}")
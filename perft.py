@@ -0,0 +1,84 @@
+# Perft Benchmark
+# Nischay Bharadwaj (N-tronics)
+
+import argparse
+import time
+import game
+from typing import *
+
+# Standard perft positions with their known node counts per depth (chessprogramming.org/Perft_Results)
+PERFT_POSITIONS: List[Tuple[str, str, List[int]]] = [
+    ("start", game.start_fen, [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603]),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594])
+]
+
+
+def run_perft(fen: str, depth: int, engine: game.ChessEngine | None = None) -> Tuple[int, float]:
+    """
+    Runs perft on a position and times it
+    :param fen: FEN string of the position
+    :param depth: Depth in plies
+    :param engine: Engine to run on, a fresh one is created if None
+    :return: (nodes, seconds)
+    """
+    engine = engine or game.ChessEngine(False)
+    engine.load_fen(fen)
+    start = time.perf_counter()
+    nodes = engine.perft(depth)
+    return nodes, time.perf_counter() - start
+
+
+def run_suite(max_depth: int = 3, verbose: bool = True) -> Tuple[bool, int, float]:
+    """
+    Runs every standard position up to a depth, checking the node counts
+    :param max_depth: Deepest depth to run, capped by the known counts of each position
+    :param verbose: Print a line per position and depth
+    :return: (all counts correct, total nodes, total seconds)
+    """
+    engine = game.ChessEngine(False)
+    passed = True
+    total_nodes, total_time = 0, 0.0
+    for name, fen, expected in PERFT_POSITIONS:
+        for depth in range(1, min(max_depth, len(expected)) + 1):
+            nodes, seconds = run_perft(fen, depth, engine)
+            total_nodes += nodes
+            total_time += seconds
+            ok = nodes == expected[depth - 1]
+            passed &= ok
+            if verbose:
+                status = "ok" if ok else f"FAIL expected {expected[depth - 1]}"
+                print(f"{name:<12} depth {depth}  {nodes:>10} nodes  {seconds:8.3f}s  "
+                      f"{nodes / max(seconds, 1e-9):>10.0f} nps  {status}")
+    return passed, total_nodes, total_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perft move generator test and benchmark")
+    parser.add_argument("--depth", type=int, default=3, help="depth to run the standard positions to")
+    parser.add_argument("--fen", help="run a single position instead of the standard ones")
+    parser.add_argument("--divide", action="store_true", help="split the node count of --fen by root move")
+    args = parser.parse_args()
+
+    if args.fen:
+        if args.divide:
+            engine = game.ChessEngine(False)
+            engine.load_fen(args.fen)
+            start = time.perf_counter()
+            counts = engine.divide(args.depth)
+            elapsed = time.perf_counter() - start
+            for move, count in sorted(counts.items()):
+                print(f"{move}: {count}")
+            nodes = sum(counts.values())
+        else:
+            nodes, elapsed = run_perft(args.fen, args.depth)
+        print(f"\nNodes: {nodes}  Time: {elapsed:.3f}s  NPS: {nodes / max(elapsed, 1e-9):.0f}")
+    else:
+        passed, nodes, elapsed = run_suite(args.depth)
+        print(f"\nTotal: {nodes} nodes in {elapsed:.3f}s, {nodes / max(elapsed, 1e-9):.0f} nps")
+        print("All counts correct" if passed else "Node count mismatch")
+        exit(0 if passed else 1)
@@ -0,0 +1,323 @@
+# PGN Reading and Writing
+# Nischay Bharadwaj (N-tronics)
+
+import re
+from dataclasses import dataclass, field
+import game
+from bitboard import BitBoard, PIECE_CHARS, PAWN, square_name, parse_square
+from moves import PROMOTION, CAPTURE, KING_CASTLE, QUEEN_CASTLE, PROMOTION_CHARS
+from movegen import generate_legal_moves, make_move, unmake_move, in_check
+from typing import *
+
+# Tags every PGN game has, written first and in this order
+SEVEN_TAG_ROSTER: List[str] = ["Event", "Site", "Date", "Round", "White", "Black", "Result"]
+RESULTS: List[str] = ["1-0", "0-1", "1/2-1/2", "*"]
+
+# Greedy value, some writers leave quotes inside values unescaped
+_TAG_RE = re.compile(r'\[\s*(\w+)\s+"(.*)"\s*]')
+# Comments and variations come out as single tokens, so they can be skipped without looking inside
+_TOKEN_RE = re.compile(r'\{[^}]*}?|;.*|\(|\)|\$\d+|\d+\.+|1-0|0-1|1/2-1/2|\*|[^\s{};()$]+')
+_SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQnbrq]))?$')
+
+
+class PGNError(ValueError):
+    pass
+
+
+@dataclass
+class PGNGame:
+    headers: Dict[str, str] = field(default_factory=dict)
+    # Mainline moves in SAN, comments and variations are dropped
+    moves: List[str] = field(default_factory=list)
+    result: str = "*"
+
+    @property
+    def start_fen(self) -> str:
+        return self.headers.get("FEN", game.start_fen)
+
+
+def move_to_san(bb: BitBoard, move: int, legal_moves: List[int] | None = None) -> str:
+    """
+    Converts a legal move to standard algebraic notation, e.g. "Nbd7", "exd6", "e8=Q+" or "O-O#"
+    :param bb: Position the move is played from, left unchanged
+    :param move: Move
+    :param legal_moves: Legal moves of the position if already generated
+    :return: str
+    """
+    legal_moves = legal_moves if legal_moves is not None else generate_legal_moves(bb)
+    frm, to, flag = move & 63, (move >> 6) & 63, move >> 12
+    piece_type = bb.mailbox[frm] % 6
+
+    if flag == KING_CASTLE:
+        san = "O-O"
+    elif flag == QUEEN_CASTLE:
+        san = "O-O-O"
+    elif piece_type == PAWN:
+        san = square_name(frm)[0] + "x" if flag & CAPTURE else ""
+        san += square_name(to)
+        if flag & PROMOTION:
+            san += "=" + PROMOTION_CHARS[flag & 3].upper()
+    else:
+        san = PIECE_CHARS[piece_type]
+        # Other pieces of the same type that can also reach the square
+        rivals = [other & 63 for other in legal_moves if (other >> 6) & 63 == to and other != move
+                  and other & 63 != frm and bb.mailbox[other & 63] % 6 == piece_type]
+        if rivals:
+            if all(rival & 7 != frm & 7 for rival in rivals):
+                san += square_name(frm)[0]
+            elif all(rival >> 3 != frm >> 3 for rival in rivals):
+                san += square_name(frm)[1]
+            else:
+                san += square_name(frm)
+        if flag & CAPTURE:
+            san += "x"
+        san += square_name(to)
+
+    undo = make_move(bb, move)
+    try:
+        if in_check(bb):
+            san += "#" if not generate_legal_moves(bb) else "+"
+    finally:
+        unmake_move(bb, move, undo)
+    return san
+
+
+def parse_san(bb: BitBoard, san: str, legal_moves: List[int] | None = None) -> int:
+    """
+    Finds the legal move a SAN string stands for. Check marks and annotations like "!?" are ignored
+    :param bb: Position the move is played from
+    :param san: Move in standard algebraic notation
+    :param legal_moves: Legal moves of the position if already generated
+    :return: Move
+    """
+    legal_moves = legal_moves if legal_moves is not None else generate_legal_moves(bb)
+    text = san.rstrip("+#!?")
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        flag = KING_CASTLE if len(text) == 3 else QUEEN_CASTLE
+        for move in legal_moves:
+            if move >> 12 == flag:
+                return move
+        raise PGNError(f"Illegal castling {san} in {bb}")
+
+    match = _SAN_RE.match(text)
+    if match is None:
+        raise PGNError(f"Invalid SAN move {san!r}")
+    piece, from_file, from_rank, to_name, promotion = match.groups()
+    piece_type = PIECE_CHARS.index(piece) if piece else PAWN
+    to = parse_square(to_name)
+
+    found = None
+    for move in legal_moves:
+        frm = move & 63
+        if (move >> 6) & 63 != to or bb.mailbox[frm] % 6 != piece_type:
+            continue
+        if from_file is not None and "abcdefgh"[frm & 7] != from_file:
+            continue
+        if from_rank is not None and str(8 - (frm >> 3)) != from_rank:
+            continue
+        if move >> 12 & PROMOTION:
+            if promotion is None or PROMOTION_CHARS[move >> 12 & 3] != promotion.lower():
+                continue
+        elif promotion is not None:
+            continue
+        if found is not None:
+            raise PGNError(f"Ambiguous SAN move {san!r}")
+        found = move
+    if found is None:
+        raise PGNError(f"Illegal SAN move {san!r}")
+    return found
+
+
+def read_games(source: str | TextIO) -> Generator[PGNGame, None, None]:
+    """
+    Reads games from PGN one at a time, keeping only the game being read in memory
+    :param source: Path of a PGN file or an open text stream
+    :return: Generator of PGNGame
+    """
+    if isinstance(source, str):
+        with open(source, encoding="utf-8", errors="replace") as file:
+            yield from read_games(file)
+        return
+
+    current = PGNGame()
+    in_movetext = False
+    # Open brace comment spanning lines, and how many variations deep we are
+    in_comment = False
+    variation_depth = 0
+    for line in source:
+        if in_comment:
+            end = line.find("}")
+            if end == -1:
+                continue
+            line = line[end + 1:]
+            in_comment = False
+        elif line.startswith("%"):
+            continue
+
+        stripped = line.strip()
+        if stripped.startswith("[") and variation_depth == 0:
+            if in_movetext:
+                yield current
+                current = PGNGame()
+                in_movetext = False
+            tag = _TAG_RE.match(stripped)
+            if tag is not None:
+                current.headers[tag.group(1)] = tag.group(2).replace('\\"', '"').replace("\\\\", "\\")
+            continue
+
+        for token in _TOKEN_RE.finditer(line):
+            token = token.group()
+            if token[0] == "{":
+                in_comment = not token.endswith("}")
+                continue
+            if token[0] == ";":
+                break
+            in_movetext = True
+            if token == "(":
+                variation_depth += 1
+            elif token == ")":
+                variation_depth = max(variation_depth - 1, 0)
+            elif variation_depth or token[0] == "$" or token[0].isdigit() and token.endswith("."):
+                continue
+            elif token in RESULTS:
+                current.result = token
+                yield current
+                current = PGNGame()
+                in_movetext = False
+            else:
+                current.moves.append(token)
+
+    if in_movetext or current.headers:
+        yield current
+
+
+def replay(pgn_game: PGNGame, fens: bool = False, engine: game.ChessEngine | None = None) \
+        -> Generator[Tuple[int, BitBoard | str], None, None]:
+    """
+    Plays through the mainline of a game, yielding the position after every ply
+    :param pgn_game: Game to replay
+    :param fens: Yield FEN strings instead of the position
+    :param engine: Engine to replay on, reused between games to save allocations. A new one is created if None
+    :return: Generator of (move, position after it). The position is the engine's BitBoard, updated in place,
+    copy it to keep it
+    """
+    engine = engine or game.ChessEngine(False)
+    engine.load_fen(pgn_game.start_fen)
+    for san in pgn_game.moves:
+        move = parse_san(engine.bitboard, san)
+        engine.make_move(move)
+        yield move, engine.generate_fen() if fens else engine.bitboard
+
+
+def game_from_moves(moves: Iterable[int], start_fen: str = game.start_fen, headers: Dict[str, str] | None = None,
+                    result: str = "*") -> PGNGame:
+    """
+    Builds a PGNGame from engine moves, converting them to SAN
+    :param moves: Legal moves in order from the start position
+    :param start_fen: Start position, written as a FEN tag if it isn't the standard one
+    :param headers: Tags of the game, the seven tag roster is filled in with "?" where missing
+    :param result: Result of the game
+    :return: PGNGame
+    """
+    pgn_game = PGNGame({tag: "?" for tag in SEVEN_TAG_ROSTER}, [], result)
+    pgn_game.headers.update(headers or {})
+    pgn_game.headers["Result"] = result
+    if start_fen != game.start_fen:
+        pgn_game.headers["SetUp"] = "1"
+        pgn_game.headers["FEN"] = start_fen
+
+    engine = game.ChessEngine(False)
+    engine.load_fen(start_fen)
+    for move in moves:
+        pgn_game.moves.append(move_to_san(engine.bitboard, move))
+        engine.make_move(move)
+    return pgn_game
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def format_game(pgn_game: PGNGame, width: int = 79) -> str:
+    """
+    Writes a game as PGN text, tags first followed by the movetext wrapped to a line width
+    :param pgn_game: Game
+    :param width: Maximum movetext line length
+    :return: str ending with a blank line
+    """
+    headers = dict(pgn_game.headers)
+    headers["Result"] = pgn_game.result
+    lines = [f'[{tag} "{_escape(headers.get(tag, "?"))}"]' for tag in SEVEN_TAG_ROSTER]
+    lines += [
+        f'[{tag} "{_escape(value)}"]'
+        for tag, value in headers.items() if tag not in SEVEN_TAG_ROSTER
+    ]
+    lines.append("")
+
+    fields = pgn_game.start_fen.split()
+    black_first = len(fields) > 1 and fields[1] == "b"
+    number = int(fields[5]) if len(fields) > 5 else 1
+    tokens = []
+    for i, san in enumerate(pgn_game.moves):
+        ply = i + black_first
+        if ply % 2 == 0:
+            tokens.append(f"{number + ply // 2}. {san}")
+        elif i == 0:
+            tokens.append(f"{number}... {san}")
+        else:
+            tokens.append(san)
+    tokens.append(pgn_game.result)
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > width:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+def write_games(games: Iterable[PGNGame], target: str | TextIO) -> int:
+    """
+    Writes games to a PGN file one at a time, so a generator of games is never held in memory
+    :param games: Games to write
+    :param target: Path of the file to write or an open text stream
+    :return: Number of games written
+    """
+    if isinstance(target, str):
+        with open(target, "w", encoding="utf-8") as file:
+            return write_games(games, file)
+    count = 0
+    for pgn_game in games:
+        target.write(format_game(pgn_game))
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Replay every game of a PGN file, checking that all moves are legal")
+    parser.add_argument("file", help="PGN file")
+    parser.add_argument("--fens", action="store_true", help="print the FEN after every ply")
+    args = parser.parse_args()
+
+    games = plies = errors = 0
+    start = time.perf_counter()
+    replay_engine = game.ChessEngine(False)
+    for pgn_game in read_games(args.file):
+        games += 1
+        try:
+            for _, position in replay(pgn_game, args.fens, replay_engine):
+                plies += 1
+                if args.fens:
+                    print(position)
+        except PGNError as e:
+            errors += 1
+            print(f"Game {games} ({pgn_game.headers.get('White', '?')} - {pgn_game.headers.get('Black', '?')}): {e}")
+    seconds = time.perf_counter() - start
+    print(f"{games} games, {plies} plies in {seconds:.3f}s ({int(plies / seconds) if seconds > 0 else 0} plies/s), "
+          f"{errors} errors")
@@ -1,29 +1,18 @@
 # Piece Classes
 # Nischay Bharadwaj (N-tronics)
 
-import numpy as np
-from game_constants import Piece, dir_offsets
-from square import Square
+from game_constants import Piece
+from bitboard import COLORS, square_index, iter_bits, piece_code, code_color, code_type
+from attacks import KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, queen_attacks, rook_attacks, bishop_attacks, pawn_pushes
 from typing import *
 from vector import *
 
+if TYPE_CHECKING:
+    from game import BoardView
+
 
 class BasePiece:
-    @staticmethod
-    def generate_raw_moves(pos: Vec2, offsets: List[Vec2], depth: int = 8) -> Generator[Vec2, bool, None]:
-        """
-        Generates a list of valid squares that a piece can move to
-        :param pos: Current position of piece
-        :param offsets: List of offsets
-        :param depth: Number of times to check in each offset
-        :return: Generator of a move
-        """
-        for ofst in offsets:
-            for i in range(1, depth + 1):
-                sqr_coords = pos + ofst * i
-                if 0 <= sqr_coords.x <= 7 and 0 <= sqr_coords.y <= 7:
-                    if (yield sqr_coords):
-                        return
+    __slots__ = ("sq", "code", "selected", "valid_moves")
 
     @staticmethod
     def get_name(type_: Piece.Type) -> str:
@@ -41,32 +30,42 @@ class BasePiece:
             return "pawn"
 
     def __init__(self, pos: Vec2, color: Piece.Color, type_: Piece.Type):
-        self.pos = pos
-        self.color = color
-        self.type = type_
+        """
+        View of a piece on the board, kept as a square index and piece code
+        :param pos: Vec2(grid X coordinate, grid Y coordinate)
+        :param color: Color of the piece
+        :param type_: Type of the piece
+        """
+        self.sq: int = square_index(pos.x, pos.y)
+        self.code: int = piece_code(type_, color)
 
         self.selected: bool = False
-        self.stop_iteration: bool = False
         self.valid_moves: List[Vec2] = []
 
-    def compute_raw_moves(self, offsets: List[List[Vec2]], depth: int = 8) -> Generator[Vec2, None, None]:
+    @property
+    def pos(self) -> Vec2:
+        return Vec2(self.sq & 7, self.sq >> 3)
+
+    @property
+    def color(self) -> Piece.Color:
+        return code_color(self.code)
+
+    @property
+    def type(self) -> Piece.Type:
+        return code_type(self.code)
+
+    def square(self) -> int:
+        return self.sq
+
+    def set_valid_moves(self, targets: int, board: "BoardView") -> None:
         """
-        Wrapper around BasePiece.generate_raw_moves
-        :param offsets: List of offsets
-        :param depth: Number of times to check in each offset
-        :return:
+        Fills valid_moves from a bitboard of target squares, skipping squares held by own pieces
+        :param targets: Bitboard of target squares
+        :param board: Current board
+        :return: None
         """
-        for ofst in offsets:
-            raw_moves_gen = BasePiece.generate_raw_moves(self.pos, ofst, depth)
-            try:
-                next_sqr_coords = next(raw_moves_gen)
-                while next_sqr_coords:
-                    yield next_sqr_coords
-                    next_sqr_coords = raw_moves_gen.send(self.stop_iteration)
-            except StopIteration:
-                pass
-
-        self.stop_iteration = False
+        targets &= ~board.bitboard.occupancy[COLORS.index(self.color)]
+        self.valid_moves = [Vec2(sq & 7, sq >> 3) for sq in iter_bits(targets)]
 
     def is_white(self):
         return self.color == Piece.WHITE
@@ -76,89 +75,99 @@ class BasePiece:
 
 
 class King(BasePiece):
+    __slots__ = ()
+
     def __init__(self, pos: Vec2, color: Piece.Color):
         super().__init__(pos, color, Piece.KING)
 
-    def compute_valid_moves(self, board: np.ndarray) -> None:
+    def compute_valid_moves(self, board: "BoardView") -> None:
         """
         Computes valid moves for a King
-        :param board: Current board array
+        :param board: Current board
         :return: None
         """
-        self.valid_moves.clear()
-        for sqr_coords in self.compute_raw_moves([dir_offsets["cross"], dir_offsets["diagonal"]], 1):
-            sqr: Square = board[sqr_coords.x, sqr_coords.y]
-            if sqr.has_piece():
-                if sqr.piece.color != self.color:
-                    self.valid_moves.append(sqr_coords)
-            else:
-                self.valid_moves.append(sqr_coords)
+        self.set_valid_moves(KING_ATTACKS[self.square()], board)
 
 
 class Queen(BasePiece):
+    __slots__ = ()
+
     def __init__(self, pos: Vec2, color: Piece.Color):
         super().__init__(pos, color, Piece.QUEEN)
 
-    def compute_valid_moves(self, board: np.ndarray) -> None:
+    def compute_valid_moves(self, board: "BoardView") -> None:
         """
         Computes valid moves for a Queen
-        :param board: Current board array
+        :param board: Current board
         :return: None
         """
-        self.valid_moves.clear()
-        for sqr_coords in self.compute_raw_moves([dir_offsets["cross"], dir_offsets["diagonal"]]):
-            sqr: Square = board[sqr_coords.x, sqr_coords.y]
-            self.valid_moves.append(sqr_coords)
-            if sqr.has_piece() and sqr.piece.color == self.color:
-                self.stop_iteration = True
+        self.set_valid_moves(queen_attacks(self.square(), board.bitboard.occupied), board)
 
 
 class Rook(BasePiece):
+    __slots__ = ()
+
     def __init__(self, pos: Vec2, color: Piece.Color):
         super().__init__(pos, color, Piece.ROOK)
 
-    def compute_valid_moves(self, board: np.ndarray) -> None:
+    def compute_valid_moves(self, board: "BoardView") -> None:
         """
         Computes valid moves for a Rook
-        :param board: Current board array
+        :param board: Current board
         :return: None
         """
+        self.set_valid_moves(rook_attacks(self.square(), board.bitboard.occupied), board)
 
 
 class Bishop(BasePiece):
+    __slots__ = ()
+
     def __init__(self, pos: Vec2, color: Piece.Color):
         super().__init__(pos, color, Piece.BISHOP)
 
-    def compute_valid_moves(self, board: np.ndarray) -> None:
+    def compute_valid_moves(self, board: "BoardView") -> None:
         """
         Computes valid moves for a Bishop
-        :param board: Current board array
+        :param board: Current board
         :return: None
         """
+        self.set_valid_moves(bishop_attacks(self.square(), board.bitboard.occupied), board)
 
 
 class Knight(BasePiece):
+    __slots__ = ()
+
     def __init__(self, pos: Vec2, color: Piece.Color):
         super().__init__(pos, color, Piece.KNIGHT)
 
-    def compute_valid_moves(self, board: np.ndarray) -> None:
+    def compute_valid_moves(self, board: "BoardView") -> None:
         """
         Computes valid moves for a Knight
-        :param board: Current board array
+        :param board: Current board
         :return: None
         """
+        self.set_valid_moves(KNIGHT_ATTACKS[self.square()], board)
 
 
 class Pawn(BasePiece):
+    __slots__ = ()
+
     def __init__(self, pos: Vec2, color: Piece.Color):
         super().__init__(pos, color, Piece.PAWN)
 
-    def compute_valid_moves(self, board: np.ndarray) -> None:
+    def compute_valid_moves(self, board: "BoardView") -> None:
         """
         Computes valid moves for a Pawn
-        :param board: Current board array
+        :param board: Current board
         :return: None
         """
+        color = COLORS.index(self.color)
+        bitboard = board.bitboard
+        self.set_valid_moves(
+            pawn_pushes(self.square(), color, bitboard.occupied)
+            | PAWN_ATTACKS[color][self.square()] & bitboard.occupancy[color ^ 1],
+            board
+        )
 
 
 def create_piece(type_: Piece.Type) -> Type:
@@ -0,0 +1,225 @@
+# Binary Positions and Position Store
+# Nischay Bharadwaj (N-tronics)
+
+import os
+import mmap
+import struct
+from array import array
+from bitboard import BitBoard, EMPTY
+from typing import *
+
+# A position is a fixed 40 byte record:
+#   0..31  piece code + 1 of every square, two squares a byte with the even square in the low nibble, 0 is empty
+#   32     side to move | castling rights << 1
+#   33     en passant square, 255 for none
+#   34..35 halfmove clock, little endian
+#   36..37 fullmove number, little endian
+#   38..39 zero, keeps records 8 byte aligned
+POSITION_BYTES = 40
+NO_EP = 255
+
+# Store files start with a 16 byte header: magic, record size and a reserved word
+STORE_MAGIC = b"NTPOS\x00\x01\x00"
+_HEADER = struct.Struct("<8sII")
+HEADER_BYTES = _HEADER.size
+_CLOCKS = struct.Struct("<HH")
+# Piece codes as signed bytes of the low and high nibble of a board byte, for bytes.translate
+_LOW_CODES = bytes(((byte & 15) - 1) & 0xFF for byte in range(256))
+_HIGH_CODES = bytes(((byte >> 4) - 1) & 0xFF for byte in range(256))
+
+
+def encode_position(bb: BitBoard) -> bytes:
+    """
+    Packs a position into its 40 byte record
+    :param bb: Position
+    :return: bytes
+    """
+    mailbox = bb.mailbox
+    data = bytearray(POSITION_BYTES)
+    for i in range(32):
+        data[i] = (mailbox[2 * i] + 1) | (mailbox[2 * i + 1] + 1) << 4
+    data[32] = bb.side | bb.castling << 1
+    data[33] = NO_EP if bb.ep == EMPTY else bb.ep
+    _CLOCKS.pack_into(data, 34, min(bb.halfmove, 0xFFFF), min(bb.fullmove, 0xFFFF))
+    return bytes(data)
+
+
+def decode_position(data: bytes | memoryview, bb: BitBoard | None = None) -> BitBoard:
+    """
+    Unpacks a 40 byte record
+    :param data: Record, only the first 40 bytes are read
+    :param bb: Position to load into, a new one is created if None
+    :return: The position
+    """
+    bb = bb or BitBoard()
+    board = bytes(data[:32])
+    mailbox = bytearray(64)
+    mailbox[0::2] = board.translate(_LOW_CODES)
+    mailbox[1::2] = board.translate(_HIGH_CODES)
+    codes = array("b")
+    codes.frombytes(mailbox)
+    bb.load_mailbox(codes)
+    bb.side = data[32] & 1
+    bb.castling = data[32] >> 1 & 15
+    bb.ep = EMPTY if data[33] == NO_EP else data[33]
+    bb.halfmove, bb.fullmove = _CLOCKS.unpack_from(data, 34)
+    bb.rehash()
+    return bb
+
+
+def position_dtype() -> "numpy.dtype":
+    """
+    NumPy structured dtype of a record, for viewing stores and record buffers without copying
+    :return: numpy.dtype
+    """
+    import numpy as np
+    return np.dtype([
+        ("board", "u1", (32,)), ("state", "u1"), ("ep", "u1"), ("halfmove", "<u2"), ("fullmove", "<u2"),
+        ("padding", "u1", (2,))
+    ])
+
+
+def unpack_mailboxes(records: "numpy.ndarray") -> "numpy.ndarray":
+    """
+    Expands records to one piece code per square, vectorized
+    :param records: Array of position_dtype records
+    :return: (N, 64) int8 array of piece codes in square index order, EMPTY where there's no piece
+    """
+    import numpy as np
+    board = records["board"]
+    mailboxes = np.empty((len(records), 64), dtype=np.int8)
+    mailboxes[:, 0::2] = board & 15
+    mailboxes[:, 1::2] = board >> 4
+    mailboxes -= 1
+    return mailboxes
+
+
+def write_positions(path: str, positions: Iterable[BitBoard | bytes], append: bool = False) -> int:
+    """
+    Writes positions to a store file
+    :param path: Path of the store
+    :param positions: Positions or already encoded records
+    :param append: Add to an existing store instead of replacing it
+    :return: Number of positions written
+    """
+    append = append and os.path.exists(path)
+    count = 0
+    with open(path, "r+b" if append else "wb") as file:
+        if append:
+            _read_header(file, path)
+            file.seek(0, os.SEEK_END)
+        else:
+            file.write(_HEADER.pack(STORE_MAGIC, POSITION_BYTES, 0))
+        for position in positions:
+            file.write(position if isinstance(position, (bytes, bytearray)) else encode_position(position))
+            count += 1
+    return count
+
+
+def _read_header(file: BinaryIO, path: str) -> None:
+    magic, record_bytes, _ = _HEADER.unpack(file.read(HEADER_BYTES).ljust(HEADER_BYTES, b"\0"))
+    if magic != STORE_MAGIC or record_bytes != POSITION_BYTES:
+        raise ValueError(f"{path} is not a position store")
+
+
+class PositionStore:
+    def __init__(self, path: str):
+        """
+        Read-only, memory-mapped view of a store file written by write_positions
+        Records are only read from disk when accessed, so stores larger than memory open instantly
+        :param path: Path of the store
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            _read_header(file, path)
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = (len(self.mmap) - HEADER_BYTES) // POSITION_BYTES
+
+    def __len__(self) -> int:
+        return self.count
+
+    def record(self, index: int) -> bytes:
+        """
+        Returns the raw record of a position
+        :param index: Position index, negative counts from the end
+        :return: bytes
+        """
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(f"Position {index} out of range")
+        start = HEADER_BYTES + index * POSITION_BYTES
+        return self.mmap[start:start + POSITION_BYTES]
+
+    def __getitem__(self, index: int) -> BitBoard:
+        return decode_position(self.record(index))
+
+    def load(self, index: int, bb: BitBoard) -> BitBoard:
+        """
+        Loads a position into an existing BitBoard, saving the allocation when walking a store
+        :param index: Position index
+        :param bb: Position to overwrite
+        :return: bb
+        """
+        return decode_position(self.record(index), bb)
+
+    def __iter__(self) -> Generator[BitBoard, None, None]:
+        for index in range(self.count):
+            yield self[index]
+
+    def array(self) -> "numpy.ndarray":
+        """
+        NumPy view of all records, reading straight from the mapped file without copying
+        The view has to be deleted before the store is closed
+        :return: Read-only array of position_dtype records
+        """
+        import numpy as np
+        return np.frombuffer(self.mmap, dtype=position_dtype(), count=self.count, offset=HEADER_BYTES)
+
+    def close(self) -> None:
+        self.mmap.close()
+
+    def __enter__(self) -> "PositionStore":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import game
+
+    parser = argparse.ArgumentParser(description="Build a position store from FEN, EPD or PGN files, or inspect one")
+    parser.add_argument("store", help="position store file")
+    parser.add_argument("--fens", help="add the positions of a FEN or EPD file")
+    parser.add_argument("--pgn", help="add every position of every game in a PGN file")
+    parser.add_argument("--append", action="store_true", help="add to the store instead of replacing it")
+    args = parser.parse_args()
+
+    engine = game.ChessEngine(False)
+    start = time.perf_counter()
+    if args.fens or args.pgn:
+        def source() -> Generator[bytes, None, None]:
+            if args.fens:
+                from batch import read_fens
+                for fen, _ in read_fens(args.fens):
+                    engine.load_fen(fen)
+                    yield encode_position(engine.bitboard)
+            if args.pgn:
+                import pgn
+                for pgn_game in pgn.read_games(args.pgn):
+                    for _, bb in pgn.replay(pgn_game, engine=engine):
+                        yield encode_position(bb)
+
+        written = write_positions(args.store, source(), args.append)
+        print(f"Wrote {written} positions in {time.perf_counter() - start:.3f}s")
+
+    with PositionStore(args.store) as store:
+        start = time.perf_counter()
+        for i in range(len(store)):
+            store.load(i, engine.bitboard)
+        seconds = time.perf_counter() - start
+        print(f"{args.store}: {len(store)} positions, {os.path.getsize(args.store)} bytes, "
+              f"decoded in {seconds:.3f}s ({int(len(store) / seconds) if seconds > 0 else 0} positions/s)")
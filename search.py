@@ -0,0 +1,371 @@
+# Alpha-Beta Search
+# Nischay Bharadwaj (N-tronics)
+
+import time
+from dataclasses import dataclass, field
+from bitboard import BitBoard
+from evaluation import evaluate
+from moves import move_to_uci, CAPTURE, PROMOTION, EP_CAPTURE
+from movegen import generate_legal_moves, generate_captures, leaves_king_in_check, make_move, unmake_move, in_check, \
+    new_move_buffer, MAX_MOVES
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from typing import *
+
+if TYPE_CHECKING:
+    from tablebases import Tablebases
+
+INFINITY = 1000000
+MATE = 100000
+# Scores beyond this are mates, stored in the table relative to the node rather than the root
+MATE_BOUND = MATE - 1000
+MAX_PLY = 128
+
+# Victim and attacker order values for MVV-LVA, the king is never a victim
+_ORDER_VALUES: List[int] = [1, 3, 3, 5, 9, 10]
+
+
+@dataclass
+class SearchLimits:
+    depth: int | None = None
+    # Seconds
+    movetime: float | None = None
+    nodes: int | None = None
+
+
+@dataclass
+class SearchInfo:
+    depth: int
+    score: int
+    nodes: int
+    time: float
+    pv: List[int] = field(default_factory=list)
+
+    @property
+    def nps(self) -> int:
+        return int(self.nodes / self.time) if self.time > 0 else 0
+
+    @property
+    def mate_in(self) -> int | None:
+        """
+        Moves to mate if the score is a mate score, negative if the side to move gets mated
+        :return: int | None
+        """
+        if abs(self.score) < MATE_BOUND:
+            return None
+        plies = MATE - abs(self.score)
+        return (plies + 1) // 2 if self.score > 0 else -(plies // 2)
+
+    def __str__(self):
+        score = f"mate {self.mate_in}" if self.mate_in is not None else f"cp {self.score}"
+        return f"depth {self.depth} score {score} nodes {self.nodes} nps {self.nps} " \
+               f"time {int(self.time * 1000)} pv {' '.join(move_to_uci(move) for move in self.pv)}"
+
+
+class SearchAborted(Exception):
+    pass
+
+
+class Searcher:
+    def __init__(self, tt: TranspositionTable | None = None, tt_size_mb: float = 16,
+                 tablebases: "Tablebases | None" = None):
+        """
+        Negamax alpha-beta search with iterative deepening, quiescence search and a transposition table
+        :param tt: Table to use, shared between searches. A new one of tt_size_mb is created if None
+        :param tt_size_mb: Size of the table to create
+        :param tablebases: Endgame tables, positions they cover are scored without searching (see tablebases.py)
+        """
+        self.tt = tt or TranspositionTable(tt_size_mb)
+        self.tablebases = tablebases
+        self.killers: List[List[int]] = [[0, 0] for _ in range(MAX_PLY)]
+        self.history: List[List[int]] = [[0] * 64 for _ in range(64)]
+
+        self.bb: BitBoard | None = None
+        self.limits = SearchLimits()
+        self.nodes = 0
+        self.start_time = 0.0
+        self.deadline: float | None = None
+        self.stopped = False
+        # Anything with an is_set() method, e.g. a threading or multiprocessing Event, that stops the search when set
+        self.stop_event = None
+        # First iteration depth, helpers of a parallel search start at different depths to spread out
+        self.start_depth = 1
+        self.pv_table: List[List[int]] = [[] for _ in range(MAX_PLY + 1)]
+        # Staged generation writes the moves of each ply into its own slice, see movegen.generate_captures
+        self.move_buffer = new_move_buffer(MAX_PLY + 1)
+
+    def stop(self) -> None:
+        """
+        Asks a running search to stop, it returns the best move of the last finished iteration
+        Safe to call from another thread
+        :return: None
+        """
+        self.stopped = True
+
+    def search(self, bb: BitBoard, limits: SearchLimits | None = None,
+               on_info: Callable[[SearchInfo], None] | None = None) -> SearchInfo:
+        """
+        Searches a position by iterative deepening until a limit is hit
+        The position is searched in place and left as it was
+        :param bb: Position to search
+        :param limits: Depth, time and node limits, searches to MAX_PLY if all are None
+        :param on_info: Called with the result of every finished iteration
+        :return: SearchInfo of the deepest finished iteration, the best move is pv[0]
+        """
+        self.bb = bb
+        self.limits = limits or SearchLimits()
+        self.nodes = 0
+        self.stopped = False
+        self.start_time = time.perf_counter()
+        self.deadline = self.start_time + self.limits.movetime if self.limits.movetime is not None else None
+        self.tt.new_search()
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        for row in self.history:
+            for i in range(64):
+                row[i] >>= 2
+
+        root_moves = generate_legal_moves(bb)
+        best = SearchInfo(0, 0, 0, 0.0, root_moves[:1])
+        if not root_moves:
+            best.score = -MATE if in_check(bb) else 0
+            return best
+
+        if self.tablebases is not None and bin(bb.occupied).count("1") <= self.tablebases.max_pieces:
+            # Covered endgames are played straight from the tables
+            move = self.tablebases.best_move(bb)
+            if move is not None:
+                best = SearchInfo(0, self.tablebases.score(bb, 0), 1, time.perf_counter() - self.start_time, [move])
+                if on_info is not None:
+                    on_info(best)
+                return best
+
+        max_depth = min(self.limits.depth or MAX_PLY, MAX_PLY)
+        for depth in range(min(self.start_depth, max_depth), max_depth + 1):
+            try:
+                score = self.negamax(depth, -INFINITY, INFINITY, 0)
+            except SearchAborted:
+                break
+            best = SearchInfo(depth, score, self.nodes, time.perf_counter() - self.start_time, self.pv_table[0][:])
+            if on_info is not None:
+                on_info(best)
+            # A forced mate won't get any shorter by searching deeper
+            if abs(score) >= MATE_BOUND and MATE - abs(score) <= depth:
+                break
+            # Don't start an iteration that is unlikely to finish in time
+            if self.deadline is not None and time.perf_counter() - self.start_time > \
+                    (self.deadline - self.start_time) * 0.6:
+                break
+        best.nodes = self.nodes
+        best.time = time.perf_counter() - self.start_time
+        return best
+
+    def check_limits(self) -> None:
+        if self.stopped or (self.limits.nodes is not None and self.nodes >= self.limits.nodes) \
+                or (self.deadline is not None and time.perf_counter() >= self.deadline) \
+                or (self.stop_event is not None and self.stop_event.is_set()):
+            self.stopped = True
+            raise SearchAborted
+
+    def order_moves(self, moves: List[int], tt_move: int, ply: int) -> None:
+        """
+        Sorts moves best first: table move, captures by MVV-LVA, promotions, killers, then quiets by history
+        :param moves: Moves to sort in place
+        :param tt_move: Best move stored in the transposition table, or 0
+        :param ply: Distance from the root
+        :return: None
+        """
+        mailbox = self.bb.mailbox
+        killer1, killer2 = self.killers[ply]
+        history = self.history
+
+        def score(move: int) -> int:
+            if move == tt_move:
+                return 3000000
+            flag = move >> 12
+            if flag & CAPTURE:
+                victim = 0 if flag == EP_CAPTURE else mailbox[(move >> 6) & 63] % 6
+                return 2000000 + _ORDER_VALUES[victim] * 16 - _ORDER_VALUES[mailbox[move & 63] % 6]
+            if flag & PROMOTION:
+                return 1900000 + (flag & 3)
+            if move == killer1:
+                return 1800000
+            if move == killer2:
+                return 1700000
+            return history[move & 63][(move >> 6) & 63]
+
+        moves.sort(key=score, reverse=True)
+
+    def is_repetition(self) -> bool:
+        """
+        Checks whether the position occurred before, within the moves since the last capture or pawn move
+        :return: bool
+        """
+        bb = self.bb
+        history = bb.key_history
+        key = bb.key
+        # Only positions with the same side to move can repeat
+        for i in range(len(history) - 2, max(len(history) - bb.halfmove, 0) - 1, -2):
+            if history[i] == key:
+                return True
+        return False
+
+    def negamax(self, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            self.check_limits()
+        self.pv_table[ply] = []
+        bb = self.bb
+
+        if ply > 0 and (bb.halfmove >= 100 or self.is_repetition()):
+            return 0
+        if ply > 0 and self.tablebases is not None and bin(bb.occupied).count("1") <= self.tablebases.max_pieces:
+            score = self.tablebases.score(bb, ply)
+            if score is not None:
+                return score
+
+        checked = in_check(bb)
+        # Search one ply deeper when in check, so a check at the horizon doesn't hide a mate
+        if checked:
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiescence(alpha, beta, ply)
+
+        key = bb.key
+        tt_move = 0
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_move, tt_depth, bound, tt_score = entry
+            if ply > 0 and tt_depth >= depth:
+                if tt_score >= MATE_BOUND:
+                    tt_score -= ply
+                elif tt_score <= -MATE_BOUND:
+                    tt_score += ply
+                if bound == EXACT or (bound == LOWER and tt_score >= beta) or (bound == UPPER and tt_score <= alpha):
+                    return tt_score
+
+        moves = generate_legal_moves(bb)
+        if not moves:
+            return -MATE + ply if checked else 0
+        self.order_moves(moves, tt_move, ply)
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = 0
+        for move in moves:
+            undo = make_move(bb, move)
+            try:
+                score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                unmake_move(bb, move, undo)
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    self.pv_table[ply] = [move] + self.pv_table[ply + 1]
+                    if alpha >= beta:
+                        if not move >> 12 & (CAPTURE | PROMOTION):
+                            killers = self.killers[ply]
+                            if killers[0] != move:
+                                killers[1] = killers[0]
+                                killers[0] = move
+                            self.history[move & 63][(move >> 6) & 63] += depth * depth
+                        break
+
+        bound = LOWER if best_score >= beta else (EXACT if best_score > original_alpha else UPPER)
+        stored = best_score
+        if stored >= MATE_BOUND:
+            stored += ply
+        elif stored <= -MATE_BOUND:
+            stored -= ply
+        self.tt.store(key, best_move, depth, bound, stored)
+        return best_score
+
+    def quiescence(self, alpha: int, beta: int, ply: int) -> int:
+        """
+        Searches captures and promotions only until the position is quiet, so the evaluation isn't taken mid-exchange
+        :param alpha: Lower bound
+        :param beta: Upper bound
+        :param ply: Distance from the root
+        :return: Score from the side to move's point of view
+        """
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            self.check_limits()
+        self.pv_table[ply] = []
+        bb = self.bb
+        if ply >= MAX_PLY:
+            return evaluate(bb)
+
+        checked = in_check(bb)
+        if checked:
+            # Every evasion has to be looked at, standing pat isn't an option in check
+            moves = generate_legal_moves(bb)
+            if not moves:
+                return -MATE + ply
+            best_score = -INFINITY
+        else:
+            best_score = evaluate(bb)
+            if best_score >= beta:
+                return best_score
+            alpha = max(alpha, best_score)
+            # Only the capture stage is generated, legality is checked once a move is actually played
+            start = ply * MAX_MOVES
+            moves = self.move_buffer[start:generate_captures(bb, self.move_buffer, start)].tolist()
+        self.order_moves(moves, 0, ply)
+
+        for move in moves:
+            undo = make_move(bb, move)
+            if not checked and leaves_king_in_check(bb):
+                unmake_move(bb, move, undo)
+                continue
+            try:
+                score = -self.quiescence(-beta, -alpha, ply + 1)
+            finally:
+                unmake_move(bb, move, undo)
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    self.pv_table[ply] = [move] + self.pv_table[ply + 1]
+                    if alpha >= beta:
+                        break
+        return best_score
+
+
+if __name__ == "__main__":
+    import argparse
+    import game
+
+    parser = argparse.ArgumentParser(description="Search a position for the best move")
+    parser.add_argument("--fen", default=game.start_fen, help="position to search")
+    parser.add_argument("--depth", type=int, help="maximum depth in plies")
+    parser.add_argument("--movetime", type=float, help="time limit in seconds, 1 if no depth or node limit is given")
+    parser.add_argument("--nodes", type=int, help="node limit")
+    parser.add_argument("--book", help="Polyglot opening book to look the position up in before searching")
+    parser.add_argument("--tablebases", nargs="?", const="", metavar="DIR",
+                        help="use the built-in endgame tables (see tablebases.py), from DIR if given")
+    parser.add_argument("--syzygy", help="directory of Syzygy tables, needs python-chess")
+    args = parser.parse_args()
+    if args.movetime is None and args.depth is None and args.nodes is None:
+        args.movetime = 1.0
+
+    engine = game.ChessEngine(False)
+    engine.load_fen(args.fen)
+    book_move = None
+    if args.book:
+        from book import OpeningBook
+        with OpeningBook(args.book) as opening_book:
+            book_move = opening_book.choose(engine.bitboard)
+    if book_move is not None:
+        print("info string book move")
+        print(f"bestmove {move_to_uci(book_move)}")
+    else:
+        tablebases = None
+        if args.tablebases is not None or args.syzygy:
+            import tablebases as endgame_tables
+            tablebases = endgame_tables.Tablebases(args.tablebases or endgame_tables.TABLES_DIR, args.syzygy)
+        result = Searcher(tablebases=tablebases).search(engine.bitboard,
+                                                        SearchLimits(args.depth, args.movetime, args.nodes), print)
+        print(f"bestmove {move_to_uci(result.pv[0]) if result.pv else '0000'}")
@@ -7,13 +7,31 @@ from game_constants import Piece
 
 
 class Square:
-    def __init__(self, pos: Vec2, color: Piece.Color):
-        self.pos = pos
-        self.color = color
+    __slots__ = ("sq", "piece", "attack_counts")
+
+    def __init__(self, sq: int):
+        """
+        A board square, stored as its index with everything else derived from it
+        :param sq: Square index, y * 8 + x
+        """
+        self.sq = sq
         self.piece = None
-        self.attacks: Dict[Piece.Color, int] = {
-            Piece.WHITE: 0,
-            Piece.BLACK: 0
+        # Number of attackers of each color, white in the low byte and black in the next one
+        self.attack_counts: int = 0
+
+    @property
+    def pos(self) -> Vec2:
+        return Vec2(self.sq & 7, self.sq >> 3)
+
+    @property
+    def color(self) -> Piece.Color:
+        return Piece.WHITE if ((self.sq & 7) + (self.sq >> 3)) % 2 == 0 else Piece.BLACK
+
+    @property
+    def attacks(self) -> Dict[Piece.Color, int]:
+        return {
+            Piece.WHITE: self.attack_counts & 0xFF,
+            Piece.BLACK: self.attack_counts >> 8
         }
 
     def has_piece(self) -> bool:
@@ -28,7 +46,7 @@ class Square:
         Returns the color of the square
         :return: Color
         """
-        return Piece.WHITE if (self.pos.x + self.pos.y) % 2 == 0 else Piece.BLACK
+        return self.color
 
     def __repr__(self):
         return f"<S {self.color} at {self.pos}>"
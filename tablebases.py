@@ -0,0 +1,364 @@
+# Endgame Tablebases
+# Nischay Bharadwaj (N-tronics)
+
+import os
+import zlib
+import struct
+from collections import defaultdict
+from bitboard import BitBoard, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+from attacks import KING_ATTACKS, PAWN_ATTACKS, rook_attacks, queen_attacks
+from movegen import generate_legal_moves, make_move, unmake_move
+from search import MATE, MATE_BOUND, MAX_PLY
+from typing import *
+
+TABLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+# Endings with a table, by the type of the one piece besides the kings
+ENDINGS: Dict[int, str] = {QUEEN: "KQK", ROOK: "KRK", PAWN: "KPK"}
+# Kings and one more piece, all positions with fewer pieces are in the tables or drawn
+TABLE_PIECES = 3
+
+# A table has one byte per position, indexed by
+#   stm << 18 | strong king << 12 | weak king << 6 | piece
+# with the side that has the piece always white (black positions are flipped to match) and stm 0 when the strong
+# side is to move. A byte is 0 for a draw, ILLEGAL for an impossible position and otherwise
+# 1 + plies to mate with best play, a win for the strong side. Files hold the zlib compressed bytes after a header.
+TABLE_SIZE = 1 << 19
+ILLEGAL = 255
+_WEAK_TO_MOVE = 1 << 18
+TABLE_MAGIC = b"NTTB\x00\x01\x00\x00"
+_HEADER = struct.Struct("<8sI")
+
+# Syzygy wins are scored below mate scores, less the ply so shorter wins are preferred
+TB_WIN = MATE_BOUND - MAX_PLY - 1
+# Sign of a Syzygy WDL value for search: cursed wins and blessed losses (1 and -1) are draws
+_WDL_SIGN: Dict[int, int] = {2: 1, -2: -1}
+
+
+def _piece_attacks(piece_type: int, sq: int, occupied: int) -> int:
+    if piece_type == QUEEN:
+        return queen_attacks(sq, occupied)
+    if piece_type == ROOK:
+        return rook_attacks(sq, occupied)
+    return PAWN_ATTACKS[WHITE][sq]
+
+
+def generate_table(piece_type: int, promotions: Dict[int, bytes] | None = None) -> bytearray:
+    """
+    Solves king and piece against king by retrograde analysis: starting from the mates, every position is reached by
+    taking moves back, in order of distance to mate
+    :param piece_type: QUEEN, ROOK or PAWN
+    :param promotions: Tables of the pieces a pawn can promote to, by type, needed for PAWN
+    :return: Table as described above
+    """
+    table = bytearray(TABLE_SIZE)
+    # Legal moves of the weak king not known to lose yet, a weak position is lost once all of them are
+    counters = bytearray(TABLE_SIZE >> 1)
+    # Positions by plies to mate, still to be taken back from
+    buckets: Dict[int, List[int]] = defaultdict(list)
+    pawn = piece_type == PAWN
+
+    for wk in range(64):
+        for bk in range(64):
+            for p in range(64):
+                index = wk << 12 | bk << 6 | p
+                if wk == bk or p in (wk, bk) or KING_ATTACKS[wk] >> bk & 1 or (pawn and not 8 <= p < 56):
+                    table[index] = table[_WEAK_TO_MOVE | index] = ILLEGAL
+                    continue
+                # Attacks through the weak king's square, it can't step back along a line it's checked on
+                attacked = _piece_attacks(piece_type, p, 1 << wk | 1 << p)
+                if attacked >> bk & 1:
+                    table[index] = ILLEGAL
+                moves = KING_ATTACKS[bk] & ~(KING_ATTACKS[wk] | attacked | 1 << wk)
+                # Taking the piece is one of the moves when it's unprotected and never decremented, so a position
+                # where it can be taken is never lost
+                counters[index] = bin(moves).count("1")
+                if not moves and attacked >> bk & 1:
+                    table[_WEAK_TO_MOVE | index] = 1
+                    buckets[0].append(_WEAK_TO_MOVE | index)
+
+    if pawn:
+        # Promoting wins when the resulting position is lost for the weak side
+        for wk in range(64):
+            for bk in range(64):
+                for p in range(8, 16):
+                    index = wk << 12 | bk << 6 | p
+                    if table[index] == ILLEGAL or p - 8 in (wk, bk):
+                        continue
+                    best = 0
+                    for promoted in promotions.values():
+                        value = promoted[_WEAK_TO_MOVE | wk << 12 | bk << 6 | (p - 8)]
+                        if value != ILLEGAL and value and (not best or value < best):
+                            best = value
+                    if best:
+                        table[index] = best + 1
+                        buckets[best].append(index)
+
+    plies = 0
+    while buckets:
+        for index in buckets.pop(plies, []):
+            if table[index] != plies + 1:
+                # Improved since it was queued
+                continue
+            wk, bk, p = index >> 12 & 63, index >> 6 & 63, index & 63
+            if index & _WEAK_TO_MOVE:
+                # Every strong move into this position wins in one more ply
+                occupied = 1 << wk | 1 << bk | 1 << p
+                origins = [(king, p) for king in _bits(KING_ATTACKS[wk] & ~(occupied | KING_ATTACKS[bk]))]
+                if pawn:
+                    if p + 8 < 56 and not occupied >> (p + 8) & 1:
+                        origins.append((wk, p + 8))
+                        if 32 <= p < 40 and not occupied >> (p + 16) & 1:
+                            origins.append((wk, p + 16))
+                else:
+                    origins += [(wk, piece) for piece in _bits(_piece_attacks(piece_type, p, occupied) & ~occupied)]
+                for king, piece in origins:
+                    origin = king << 12 | bk << 6 | piece
+                    if table[origin] != ILLEGAL and (not table[origin] or table[origin] > plies + 2):
+                        table[origin] = plies + 2
+                        buckets[plies + 1].append(origin)
+            else:
+                # Weak positions lose once every move leads to a won position
+                for king in _bits(KING_ATTACKS[bk] & ~(1 << wk | 1 << p | KING_ATTACKS[wk])):
+                    origin = _WEAK_TO_MOVE | wk << 12 | king << 6 | p
+                    if table[origin]:
+                        continue
+                    counters[origin & ~_WEAK_TO_MOVE] -= 1
+                    if not counters[origin & ~_WEAK_TO_MOVE]:
+                        table[origin] = plies + 2
+                        buckets[plies + 1].append(origin)
+        plies += 1
+    return table
+
+
+def _bits(bits: int) -> Generator[int, None, None]:
+    while bits:
+        lsb = bits & -bits
+        bits ^= lsb
+        yield lsb.bit_length() - 1
+
+
+def table_path(name: str, directory: str = TABLES_DIR) -> str:
+    return os.path.join(directory, f"{name}.ntb")
+
+
+def write_table(path: str, table: bytes) -> None:
+    with open(path, "wb") as file:
+        file.write(_HEADER.pack(TABLE_MAGIC, len(table)))
+        file.write(zlib.compress(bytes(table), 9))
+
+
+def read_table(path: str) -> bytes:
+    with open(path, "rb") as file:
+        magic, size = _HEADER.unpack(file.read(_HEADER.size).ljust(_HEADER.size, b"\0"))
+        if magic != TABLE_MAGIC or size != TABLE_SIZE:
+            raise ValueError(f"{path} is not a tablebase file")
+        table = zlib.decompress(file.read())
+    if len(table) != TABLE_SIZE:
+        raise ValueError(f"{path} is truncated")
+    return table
+
+
+def generate_tables(directory: str = TABLES_DIR) -> List[str]:
+    """
+    Generates all built-in tables into a directory
+    :param directory: Directory to write to, created if needed
+    :return: Paths written
+    """
+    os.makedirs(directory, exist_ok=True)
+    tables: Dict[int, bytes] = {}
+    paths = []
+    for piece_type in (QUEEN, ROOK, PAWN):
+        tables[piece_type] = generate_table(piece_type, {QUEEN: tables.get(QUEEN), ROOK: tables.get(ROOK)})
+        paths.append(table_path(ENDINGS[piece_type], directory))
+        write_table(paths[-1], tables[piece_type])
+    return paths
+
+
+class Tablebases:
+    def __init__(self, directory: str = TABLES_DIR, syzygy_path: str | None = None):
+        """
+        Perfect play in endgames, from the built-in tables found in a directory (see generate_tables) and optionally
+        from Syzygy tables, which are read with python-chess
+        :param directory: Directory of the built-in tables, missing tables are skipped
+        :param syzygy_path: Directory of Syzygy .rtbw/.rtbz files
+        """
+        self.tables: Dict[int, bytes] = {}
+        for piece_type, name in ENDINGS.items():
+            path = table_path(name, directory)
+            if os.path.exists(path):
+                self.tables[piece_type] = read_table(path)
+
+        self.syzygy = None
+        self.syzygy_pieces = 0
+        if syzygy_path:
+            import chess.syzygy
+            self.syzygy = chess.syzygy.open_tablebase(syzygy_path)
+            names = [os.path.splitext(name)[0] for name in os.listdir(syzygy_path) if name.endswith(".rtbw")]
+            self.syzygy_pieces = max((len(name) - 1 for name in names), default=0)
+        self.max_pieces = max(TABLE_PIECES if self.tables else 0, self.syzygy_pieces)
+
+    def probe(self, bb: BitBoard) -> Tuple[int, int] | None:
+        """
+        Looks a position up in the built-in tables
+        :param bb: Position
+        :return: (result, plies to mate) where result is 1 if the side to move mates, -1 if it gets mated and 0 for a
+        draw, None if the position isn't covered
+        """
+        if bin(bb.occupied).count("1") > TABLE_PIECES:
+            return None
+        piece_sq, piece_code = -1, -1
+        for code in range(12):
+            if code % 6 != KING and bb.pieces[code]:
+                piece_sq, piece_code = bb.pieces[code].bit_length() - 1, code
+        if piece_code == -1 or piece_code % 6 in (KNIGHT, BISHOP):
+            # Bare kings, or a minor piece that can't mate
+            return 0, 0
+        table = self.tables.get(piece_code % 6)
+        if table is None:
+            return None
+        strong = piece_code // 6
+        # The strong side is white in the tables, black's positions are mirrored top to bottom
+        flip = 56 if strong == BLACK else 0
+        wk = (bb.pieces[strong * 6 + KING].bit_length() - 1) ^ flip
+        bk = (bb.pieces[(strong ^ 1) * 6 + KING].bit_length() - 1) ^ flip
+        weak_to_move = bb.side != strong
+        value = table[(_WEAK_TO_MOVE if weak_to_move else 0) | wk << 12 | bk << 6 | piece_sq ^ flip]
+        if value == ILLEGAL:
+            return None
+        if not value:
+            return 0, 0
+        return -1 if weak_to_move else 1, value - 1
+
+    def score(self, bb: BitBoard, ply: int) -> int | None:
+        """
+        Scores a position for search, the same way as found mates
+        :param bb: Position
+        :param ply: Distance from the root
+        :return: Score from the side to move's point of view, None if the position isn't covered
+        """
+        found = self.probe(bb)
+        if found is not None:
+            result, plies = found
+            return result * (MATE - ply - plies)
+        wdl = self.probe_syzygy(bb)
+        if wdl is None:
+            return None
+        # 1 and -1 are a cursed win and a blessed loss, draws under the fifty move rule
+        return (TB_WIN - ply) * _WDL_SIGN.get(wdl, 0)
+
+    def probe_syzygy(self, bb: BitBoard) -> int | None:
+        """
+        Looks a position up in the Syzygy tables
+        :param bb: Position
+        :return: Win-draw-loss from -2 to 2, where 1 and -1 are wins and losses spoiled by the fifty move rule,
+        None if there are no Syzygy tables for it
+        """
+        return self._probe_syzygy(bb, "probe_wdl")
+
+    def probe_syzygy_dtz(self, bb: BitBoard) -> int | None:
+        """
+        Looks up the distance to zeroing, the plies until the next capture or pawn move with best play
+        :param bb: Position
+        :return: Plies, positive if the side to move wins and negative if it loses, 0 for a draw,
+        None if there are no Syzygy tables for it
+        """
+        return self._probe_syzygy(bb, "probe_dtz")
+
+    def _probe_syzygy(self, bb: BitBoard, method: str) -> int | None:
+        if self.syzygy is None or bb.castling or bin(bb.occupied).count("1") > self.syzygy_pieces:
+            return None
+        import chess
+        from fen import format_fen
+        try:
+            return getattr(self.syzygy, method)(chess.Board(format_fen(bb)))
+        except KeyError:
+            return None
+
+    def best_move(self, bb: BitBoard) -> int | None:
+        """
+        Picks the move with the best table result: the fastest win, a draw, or the longest resistance
+        :param bb: Position
+        :return: Move, or None if the position or one of its children isn't covered
+        """
+        moves = generate_legal_moves(bb)
+        if not moves or bin(bb.occupied).count("1") > self.max_pieces:
+            return None
+        if self.syzygy is not None and self.probe(bb) is None:
+            return self._syzygy_best_move(bb, moves)
+        best_move, best_score = None, None
+        for move in moves:
+            undo = make_move(bb, move)
+            try:
+                score = self.score(bb, 1)
+            finally:
+                unmake_move(bb, move, undo)
+            if score is None:
+                return None
+            if best_score is None or -score > best_score:
+                best_move, best_score = move, -score
+        return best_move
+
+    def _syzygy_best_move(self, bb: BitBoard, moves: List[int]) -> int | None:
+        """
+        Picks a move by Syzygy WDL and DTZ. WDL alone can't tell progress from shuffling, so among the winning moves
+        the one that gets to the next capture or pawn move soonest is played, and wins the fifty move rule would
+        spoil count as draws
+        :param bb: Position
+        :param moves: Legal moves of the position
+        :return: Move, or None if a child isn't covered
+        """
+        halfmove = bb.halfmove
+        best_move, best_rank = None, None
+        for move in moves:
+            undo = make_move(bb, move)
+            try:
+                wdl = self.probe_syzygy(bb)
+                dtz = self.probe_syzygy_dtz(bb)
+                zeroing = bb.halfmove == 0
+            finally:
+                unmake_move(bb, move, undo)
+            if wdl is None or dtz is None:
+                return None
+            result = -_WDL_SIGN.get(wdl, 0)
+            # Plies from here to the next zeroing move
+            plies = 1 if zeroing else 1 + abs(dtz)
+            if result > 0 and not zeroing and halfmove + plies > 100:
+                result = 0
+            # Win as fast as possible, lose as slowly as possible
+            rank = (result, -plies if result > 0 else plies if result < 0 else 0)
+            if best_rank is None or rank > best_rank:
+                best_move, best_rank = move, rank
+        return best_move
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import game
+    from moves import move_to_uci
+
+    parser = argparse.ArgumentParser(description="Generate the built-in endgame tables, or probe a position")
+    parser.add_argument("--generate", action="store_true", help="generate KQK, KRK and KPK")
+    parser.add_argument("--dir", default=TABLES_DIR, help="directory of the built-in tables")
+    parser.add_argument("--syzygy", help="directory of Syzygy tables")
+    parser.add_argument("--fen", help="position to probe")
+    args = parser.parse_args()
+
+    if args.generate:
+        start = time.perf_counter()
+        for written in generate_tables(args.dir):
+            print(f"Wrote {written} ({os.path.getsize(written)} bytes)")
+        print(f"Generated in {time.perf_counter() - start:.1f}s")
+    if args.fen:
+        engine = game.ChessEngine(False)
+        engine.load_fen(args.fen)
+        tablebases = Tablebases(args.dir, args.syzygy)
+        start = time.perf_counter()
+        found = tablebases.probe(engine.bitboard)
+        move = tablebases.best_move(engine.bitboard)
+        seconds = time.perf_counter() - start
+        if found is None:
+            print("not in the tables")
+        else:
+            print(f"{['loss', 'draw', 'win'][found[0] + 1]}, mate in {found[1]} plies" if found[0] else "draw")
+        print(f"best move {move_to_uci(move) if move else 'none'} ({seconds * 1000:.2f}ms)")
@@ -0,0 +1,140 @@
+# Transposition Table
+# Nischay Bharadwaj (N-tronics)
+
+from array import array
+from typing import *
+
+# Bound types of a stored score
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+ENTRY_BYTES = 16
+SCORE_OFFSET = 1 << 31
+
+
+def table_entries(size_mb: float) -> int:
+    """
+    Returns the number of entries a table of the given size holds
+    :param size_mb: Memory budget in megabytes
+    :return: Largest power of two number of entries that fits, at least 2
+    """
+    entries = 2
+    while entries * 2 * ENTRY_BYTES <= size_mb * 1024 * 1024:
+        entries *= 2
+    return entries
+
+
+class TranspositionTable:
+    def __init__(self, size_mb: float = 16, policy: str = "depth", buffer: memoryview | None = None):
+        """
+        Fixed size hash table of search results, backed by two flat arrays of 64 bit ints
+        Each entry is a key and a data word: move | depth << 16 | bound << 24 | generation << 26 | score << 32
+        The key is stored XORed with the data, so an entry torn by two processes writing at once just misses
+        :param size_mb: Memory budget in megabytes, rounded down to a power of two number of entries
+        :param policy: "depth" for buckets of a depth-preferred and an always-replace slot, "always" to always replace
+        :param buffer: Memory to keep the table in, e.g. a SharedMemory buffer of at least size_mb. Allocated if None
+        """
+        if policy not in ("depth", "always"):
+            raise ValueError(f"Unknown replacement policy {policy}")
+        self.policy = policy
+        entries = table_entries(size_mb)
+        self.size = entries
+        if buffer is None:
+            self.keys = array("Q", bytes(entries * 8))
+            self.data = array("Q", bytes(entries * 8))
+        else:
+            self.keys = buffer[:entries * 8].cast("Q")
+            self.data = buffer[entries * 8:entries * 16].cast("Q")
+        # Depth-preferred buckets are slot pairs, so the index mask drops the lowest bit
+        self.mask = (entries - 1) & ~1 if policy == "depth" else entries - 1
+        self.generation = 0
+
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    @property
+    def misses(self) -> int:
+        return self.probes - self.hits
+
+    def hit_rate(self) -> float:
+        return self.hits / self.probes if self.probes else 0.0
+
+    def new_search(self) -> None:
+        """
+        Ages the table so entries from earlier searches are replaced first
+        :return: None
+        """
+        self.generation = (self.generation + 1) & 63
+
+    def clear(self) -> None:
+        for i in range(self.size):
+            self.keys[i] = 0
+            self.data[i] = 0
+        self.generation = 0
+        self.probes = self.hits = self.stores = self.overwrites = 0
+
+    def probe(self, key: int) -> Tuple[int, int, int, int] | None:
+        """
+        Looks up a position
+        :param key: Zobrist key of the position
+        :return: (move, depth, bound, score) or None on a miss
+        """
+        self.probes += 1
+        i = key & self.mask
+        keys = self.keys
+        data = self.data
+        # Each slot is read once, so an entry another worker writes in between is rejected rather than mixed in
+        entry = data[i]
+        if keys[i] ^ entry != key:
+            if self.policy == "always":
+                return None
+            entry = data[i + 1]
+            if keys[i + 1] ^ entry != key:
+                return None
+        self.hits += 1
+        return entry & 0xFFFF, entry >> 16 & 0xFF, entry >> 24 & 3, (entry >> 32) - SCORE_OFFSET
+
+    def store(self, key: int, move: int, depth: int, bound: int, score: int) -> None:
+        """
+        Stores a search result
+        :param key: Zobrist key of the position
+        :param move: Best move found, or 0
+        :param depth: Depth searched
+        :param bound: EXACT, LOWER or UPPER
+        :param score: Score from the side to move's point of view
+        :return: None
+        """
+        i = key & self.mask
+        keys = self.keys
+        data = self.data
+        if self.policy == "depth" and keys[i] ^ data[i] != key:
+            old = data[i]
+            # Keep the deeper entry of the current search in the first slot, the second slot takes everything else
+            if keys[i + 1] ^ data[i + 1] == key \
+                    or (keys[i] and old >> 26 & 63 == self.generation and old >> 16 & 0xFF > depth):
+                i += 1
+        if keys[i] ^ data[i] == key:
+            # Don't lose the best move when re-storing a position without one
+            if not move:
+                move = data[i] & 0xFFFF
+        elif keys[i]:
+            self.overwrites += 1
+        self.stores += 1
+        entry = move | min(max(depth, 0), 255) << 16 | bound << 24 | self.generation << 26 \
+            | (score + SCORE_OFFSET) << 32
+        data[i] = entry
+        keys[i] = key ^ entry
+
+    def stats(self) -> Dict[str, int | float]:
+        return {
+            "entries": self.size,
+            "probes": self.probes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+            "hit_rate": self.hit_rate()
+        }
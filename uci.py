@@ -0,0 +1,262 @@
+# UCI Engine
+# Nischay Bharadwaj (N-tronics)
+
+import sys
+import random
+import threading
+import game
+import instrumentation
+from book import OpeningBook
+from fen import FENError
+from moves import match_uci, move_to_uci
+from search import Searcher, SearchLimits, SearchInfo
+from tablebases import Tablebases
+from typing import *
+
+ENGINE_NAME = "N-tronics Chess"
+ENGINE_AUTHOR = "Nischay Bharadwaj (N-tronics)"
+
+
+class UCIEngine:
+    def __init__(self, output: TextIO = sys.stdout):
+        """
+        Speaks the UCI protocol, searching in a background thread so commands like stop and isready answer at once
+        :param output: Stream to write responses to
+        """
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.engine = game.ChessEngine()
+        self.hash_mb = 16
+        self.threads = 1
+        # Built-in endgame tables found in tablebases/, plus Syzygy tables once SyzygyPath is set
+        self.tablebases = Tablebases()
+        self.searcher: "Searcher | ParallelSearcher" = Searcher(tt_size_mb=self.hash_mb, tablebases=self.tablebases)
+        # Book moves are played without searching while OwnBook is on and the position is in the book
+        self.own_book = False
+        self.book: OpeningBook | None = None
+        self.book_rng = random.Random()
+        self.search_thread: threading.Thread | None = None
+        self.infinite = False
+        # An infinite search holds its bestmove back until this is set by stop
+        self.stop_requested = threading.Event()
+        # Set by instrument(), every searcher created from then on records search statistics
+        self.instrumented = False
+
+    def send(self, line: str) -> None:
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def wait_for_search(self) -> None:
+        """
+        Stops a running search and waits for it to send its bestmove
+        :return: None
+        """
+        if self.search_thread is not None:
+            self.stop_requested.set()
+            self.searcher.stop()
+            self.search_thread.join()
+            self.search_thread = None
+
+    def new_searcher(self) -> None:
+        """
+        Recreates the searcher after Hash or Threads changed
+        :return: None
+        """
+        if hasattr(self.searcher, "close"):
+            self.searcher.close()
+        if self.threads > 1:
+            # Only pulled in when asked for, single threaded use doesn't start any processes
+            from parallel import ParallelSearcher
+            self.searcher = ParallelSearcher(self.threads, self.hash_mb)
+        else:
+            self.searcher = Searcher(tt_size_mb=self.hash_mb)
+        self.searcher.tablebases = self.tablebases
+        if self.instrumented:
+            instrumentation.instrument_search(self.searcher)
+
+    def instrument(self) -> None:
+        """
+        Records search statistics (see instrumentation.py) of the current searcher and every one that replaces it
+        :return: None
+        """
+        self.instrumented = True
+        instrumentation.instrument_search(self.searcher)
+
+    def handle(self, line: str) -> bool:
+        """
+        Handles one command
+        :param line: Command line as received
+        :return: False once the engine should quit
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send("option name Hash type spin default 16 min 1 max 4096")
+            self.send("option name Threads type spin default 1 min 1 max 256")
+            self.send("option name OwnBook type check default false")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name SyzygyPath type string default <empty>")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "ucinewgame":
+            self.wait_for_search()
+            self.searcher.tt.clear()
+        elif command == "position":
+            self.wait_for_search()
+            self.set_position(args)
+        elif command == "go":
+            self.wait_for_search()
+            self.go(args)
+        elif command == "stop":
+            self.wait_for_search()
+        elif command == "quit":
+            self.wait_for_search()
+            if hasattr(self.searcher, "close"):
+                self.searcher.close()
+            if self.book is not None:
+                self.book.close()
+            return False
+        elif command == "d":
+            # Non-standard, prints the current position
+            self.send(self.engine.generate_fen())
+        return True
+
+    def set_option(self, args: List[str]) -> None:
+        """
+        Handles "setoption name <name> value <value>"
+        :param args: Tokens after setoption
+        :return: None
+        """
+        if "name" not in args or "value" not in args:
+            return
+        name = " ".join(args[args.index("name") + 1:args.index("value")]).lower()
+        value = " ".join(args[args.index("value") + 1:])
+        self.wait_for_search()
+        if name in ("hash", "threads"):
+            try:
+                number = max(1, int(value))
+            except ValueError:
+                self.send(f"info string invalid value {value!r} for {name}")
+                return
+            if name == "hash":
+                self.hash_mb = number
+            else:
+                self.threads = number
+            self.new_searcher()
+        elif name == "ownbook":
+            self.own_book = value.lower() == "true"
+        elif name == "bookfile":
+            if self.book is not None:
+                self.book.close()
+                self.book = None
+            if value and value != "<empty>":
+                try:
+                    self.book = OpeningBook(value)
+                except OSError as e:
+                    self.send(f"info string can't open book: {e}")
+        elif name == "syzygypath":
+            try:
+                self.tablebases = Tablebases(syzygy_path=value if value and value != "<empty>" else None)
+            except (ImportError, OSError) as e:
+                self.send(f"info string can't load syzygy tables: {e}")
+                self.tablebases = Tablebases()
+            self.searcher.tablebases = self.tablebases
+
+    def set_position(self, args: List[str]) -> None:
+        """
+        Handles "position [startpos | fen <fen>] [moves <move> ...]"
+        :param args: Tokens after position
+        :return: None
+        """
+        moves_index = args.index("moves") if "moves" in args else len(args)
+        if args and args[0] == "fen":
+            try:
+                self.engine.load_fen(" ".join(args[1:moves_index]))
+            except FENError as e:
+                self.send(f"info string invalid fen: {e}")
+                self.engine.load_fen(game.start_fen)
+                return
+        else:
+            self.engine.load_fen(game.start_fen)
+        for uci in args[moves_index + 1:]:
+            move = match_uci(uci, self.engine.legal_moves())
+            if move is None:
+                self.send(f"info string illegal move {uci}")
+                break
+            self.engine.make_move(move)
+
+    def go(self, args: List[str]) -> None:
+        """
+        Handles "go" with depth, nodes, movetime, wtime/btime/winc/binc/movestogo or infinite, then starts searching
+        :param args: Tokens after go
+        :return: None
+        """
+        params: Dict[str, int] = {}
+        for i, token in enumerate(args[:-1]):
+            if token in ("depth", "nodes", "movetime", "wtime", "btime", "winc", "binc", "movestogo"):
+                try:
+                    params[token] = int(args[i + 1])
+                except ValueError:
+                    self.send(f"info string invalid value {args[i + 1]!r} for {token}")
+
+        limits = SearchLimits(depth=params.get("depth"), nodes=params.get("nodes"))
+        self.infinite = "infinite" in args
+        if self.own_book and self.book is not None and not self.infinite:
+            move = self.book.choose(self.engine.bitboard, self.book_rng)
+            if move is not None:
+                self.send("info string book move")
+                self.send(f"bestmove {move_to_uci(move)}")
+                return
+        if "movetime" in params:
+            limits.movetime = params["movetime"] / 1000
+        elif "infinite" not in args:
+            time_left = params.get("wtime" if self.engine.turn == "w" else "btime")
+            if time_left is not None:
+                increment = params.get("winc" if self.engine.turn == "w" else "binc", 0)
+                budget = time_left / params.get("movestogo", 30) + increment * 0.8
+                # Keep a margin for move overhead so we never flag
+                limits.movetime = max(min(budget, time_left * 0.5 - 50), 10) / 1000
+
+        def run() -> None:
+            result = self.searcher.search(self.engine.bitboard, limits, self.send_info)
+            if self.infinite:
+                self.stop_requested.wait()
+            self.send(f"bestmove {move_to_uci(result.pv[0]) if result.pv else '0000'}")
+
+        self.stop_requested.clear()
+        self.search_thread = threading.Thread(target=run, daemon=True)
+        self.search_thread.start()
+
+    def send_info(self, info: SearchInfo) -> None:
+        self.send(f"info {info}")
+
+    def loop(self, input_stream: TextIO = sys.stdin) -> None:
+        """
+        Reads and handles commands until quit or end of input
+        :param input_stream: Stream to read commands from
+        :return: None
+        """
+        for line in input_stream:
+            if not self.handle(line):
+                return
+        # Input closed without quit, let a search with limits finish
+        if self.search_thread is not None and not self.infinite:
+            self.search_thread.join()
+        self.wait_for_search()
+
+
+if __name__ == "__main__":
+    uci_engine = UCIEngine()
+    # Off unless NTCHESS_PROFILE is set, see instrumentation.py
+    if instrumentation.enable_from_environment():
+        uci_engine.instrument()
+    uci_engine.loop()
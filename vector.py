@@ -2,6 +2,8 @@
 # Nischay Bharadwaj (N-tronics)
 
 class Vec2:
+    __slots__ = ("x", "y")
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -22,8 +24,9 @@ class Vec2:
         return hash((self.x, self.y))
 
     def __eq__(self, vec):
+        # Lets Python fall back to identity, so Vec2s can sit in containers with other types
         if not isinstance(vec, Vec2):
-            raise ValueError(f"{vec} not a Vec2")
+            return NotImplemented
         return self.x == vec.x and self.y == vec.y
 
     def __repr__(self):
@@ -0,0 +1,35 @@
+# Zobrist Hashing
+# Nischay Bharadwaj (N-tronics)
+
+import random
+from typing import *
+
+# Fixed seed so keys, and anything stored under them, are the same on every run and in every process
+_rng = random.Random(0x5EED_C4E55)
+
+# PIECE_KEYS[piece code][square]
+PIECE_KEYS: List[List[int]] = [[_rng.getrandbits(64) for _ in range(64)] for _ in range(12)]
+# One key per combination of castling rights so a rights change is a single XOR
+CASTLING_KEYS: List[int] = [_rng.getrandbits(64) for _ in range(16)]
+# En passant keys by file
+EP_KEYS: List[int] = [_rng.getrandbits(64) for _ in range(8)]
+# XORed in when black is to move
+SIDE_KEY: int = _rng.getrandbits(64)
+
+
+def compute_key(bb: "BitBoard") -> int:
+    """
+    Computes the Zobrist key of a position from scratch
+    :param bb: Position
+    :return: 64 bit key
+    """
+    key = 0
+    for sq, code in enumerate(bb.mailbox):
+        if code != -1:
+            key ^= PIECE_KEYS[code][sq]
+    key ^= CASTLING_KEYS[bb.castling]
+    if bb.ep != -1:
+        key ^= EP_KEYS[bb.ep & 7]
+    if bb.side:
+        key ^= SIDE_KEY
+    return key